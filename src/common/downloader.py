@@ -0,0 +1,318 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+エクスポートしたファイルをダウンロードするための関数
+HTTPのRangeリクエストで大きなファイルを分割して並行にダウンロードし、
+途中で失敗した場合はサイドカーのマニフェストを使って足りない部分だけを再取得します
+"""
+
+import os
+import json
+import time
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import urllib3
+
+from common.rate_limit import RetryPolicy, parse_retry_after
+
+# 分割ダウンロードの1区間の大きさ
+DEFAULT_SEGMENT_SIZE = 8 * 1024 * 1024
+# このサイズ以上のファイルを分割して並行にダウンロードする
+PARALLEL_THRESHOLD = 16 * 1024 * 1024
+# マニフェストを保存する間隔（バイト）
+_MANIFEST_SAVE_INTERVAL = 1024 * 1024
+_CHUNK_SIZE = 64 * 1024
+
+# ダウンロードの再試行ポリシー
+retry_policy = RetryPolicy(max_retries=5, base_delay=1.0, max_delay=30.0)
+
+class DownloadError(Exception):
+    """ダウンロードに失敗したときの例外"""
+
+class RetryableDownloadError(DownloadError):
+    """429や5xxなど、待ってから再試行すれば成功する可能性があるエラー"""
+
+    def __init__(self, message, retry_after=None):
+        """
+        Args:
+            message (str): エラーメッセージ
+            retry_after (float, optional): サーバーから指示された待機時間（秒）
+        """
+        super().__init__(message)
+        self.retry_after = retry_after
+
+# 再試行するエラー（接続の切断や読み込みのタイムアウト、429や5xxのステータス）
+# ディスクの空き不足などローカルのOSErrorは再試行しても解決しないため含めない
+_RETRYABLE_ERRORS = (urllib3.exceptions.HTTPError, ConnectionError, TimeoutError, RetryableDownloadError)
+
+def download_file(http, url, output_path, headers=None, max_workers=4,
+                  segment_size=DEFAULT_SEGMENT_SIZE):
+    """
+    URLの内容をファイルにダウンロードする
+
+    サーバーがRangeリクエストに対応していれば、大きなファイルを区間に分けて並行に
+    ダウンロードします。途中のファイル（.part）とマニフェスト（.part.json）が残っていれば、
+    ダウンロード済みの区間を飛ばして再開します。
+
+    Args:
+        http (urllib3.PoolManager): HTTPクライアント
+        url (str): ダウンロードURL
+        output_path (str): 出力ファイルパス
+        headers (dict, optional): リクエストヘッダー
+        max_workers (int): 並行してダウンロードする区間の数
+        segment_size (int): 1区間の大きさ（バイト）
+
+    Returns:
+        int: ダウンロードしたファイルのサイズ（バイト）
+    """
+    partial_path = f"{output_path}.part"
+    manifest_path = f"{partial_path}.json"
+    headers = dict(headers or {})
+
+    # 先頭1バイトを要求して、サイズとRangeリクエストへの対応を確認する
+    response = _request_with_retry(http, url, dict(headers, Range='bytes=0-0'))
+    if response.status == 200:
+        # Rangeリクエストに対応していない場合はそのまま全体を保存する
+        content_length = response.headers.get('Content-Length')
+        _save_whole(response, partial_path)
+        size = os.path.getsize(partial_path)
+        if content_length is not None and size != int(content_length):
+            raise DownloadError(f"ダウンロードしたファイルのサイズが一致しません: {output_path}")
+    else:
+        total = _parse_total_size(response)
+        validator = response.headers.get('ETag') or response.headers.get('Last-Modified')
+        response.drain_conn()
+        response.release_conn()
+
+        segments = _load_manifest(manifest_path, partial_path, total, validator)
+        if segments is None:
+            segments = _plan_segments(total, segment_size)
+            with open(partial_path, 'wb') as f:
+                f.truncate(total)
+        else:
+            done = sum(segment[2] for segment in segments)
+            print(f"途中までダウンロードしたファイルから再開します: {done}/{total}バイト")
+
+        _download_segments(http, url, headers, partial_path, manifest_path,
+                           segments, total, validator, max_workers)
+        # .part は最初に全体のサイズで確保しているため、区間ごとの記録で全て受信したかを確認する
+        if any(segment[2] != segment[1] - segment[0] + 1 for segment in segments):
+            # 記録が壊れている場合は次回に最初からダウンロードし直す
+            os.unlink(manifest_path)
+            raise DownloadError(f"ダウンロードしたファイルのサイズが一致しません: {output_path}")
+        size = total
+
+    os.replace(partial_path, output_path)
+    if os.path.exists(manifest_path):
+        os.unlink(manifest_path)
+    return size
+
+class ResumableStream:
+    """
+    接続が切れた場合に Range リクエストで続きから読み直すストリーム
+    ZIPのストリーム解凍など、先頭から順に読む処理で使用します
+    """
+
+    def __init__(self, http, url, headers=None):
+        """
+        Args:
+            http (urllib3.PoolManager): HTTPクライアント
+            url (str): ダウンロードURL
+            headers (dict, optional): リクエストヘッダー
+        """
+        self._http = http
+        self._url = url
+        self._headers = dict(headers or {})
+        self._offset = 0
+        self._validator = None
+        self._response = _request_with_retry(http, url, self._headers)
+        if self._response.status != 200:
+            raise DownloadError(f"ダウンロードエラー: {self._response.status}")
+        self._validator = self._response.headers.get('ETag') or self._response.headers.get('Last-Modified')
+        self._accept_ranges = self._response.headers.get('Accept-Ranges', '').lower() == 'bytes'
+
+    def read(self, size):
+        """
+        最大 size バイトを読み込む
+
+        Args:
+            size (int): 読み込む最大バイト数
+
+        Returns:
+            bytes: 読み込んだデータ（終端では空）
+        """
+        attempt = 0
+        while True:
+            try:
+                if self._response is None:
+                    self._reopen()
+                data = self._response.read(size)
+                self._offset += len(data)
+                return data
+            except _RETRYABLE_ERRORS as e:
+                if not self._accept_ranges or attempt >= retry_policy.max_retries:
+                    raise
+                delay = retry_policy.delay(attempt, getattr(e, 'retry_after', None))
+                print(f"ダウンロードが中断したため{delay:.1f}秒後に{self._offset}バイト目から再開します: {str(e)}")
+                if self._response is not None:
+                    self._response.release_conn()
+                    self._response = None
+                time.sleep(delay)
+                attempt += 1
+
+    def _reopen(self):
+        """現在の位置から Range リクエストで接続し直す"""
+        headers = dict(self._headers, Range=f"bytes={self._offset}-")
+        if self._validator:
+            headers['If-Range'] = self._validator
+        response = _request(self._http, self._url, headers)
+        if response.status != 206:
+            response.release_conn()
+            raise DownloadError("ダウンロード中にファイルが変更されたため再開できません")
+        self._response = response
+
+    def close(self):
+        """接続を閉じる"""
+        if self._response is not None:
+            self._response.close()
+            self._response.release_conn()
+
+def _request(http, url, headers):
+    """GETリクエストを送信し、エラーのステータスは例外にする"""
+    response = http.request('GET', url, headers=headers, preload_content=False)
+    if response.status >= 400:
+        response.release_conn()
+        if retry_policy.should_retry_status('GET', response.status, 0):
+            raise RetryableDownloadError(f"ダウンロードエラー: {response.status}",
+                                         parse_retry_after(response.headers.get('Retry-After')))
+        raise DownloadError(f"ダウンロードエラー: {response.status}")
+    return response
+
+def _request_with_retry(http, url, headers):
+    """GETリクエストを送信し、接続エラーや429・5xxの場合は待ってから再試行する"""
+    attempt = 0
+    while True:
+        try:
+            return _request(http, url, headers)
+        except _RETRYABLE_ERRORS as e:
+            if attempt >= retry_policy.max_retries:
+                raise
+            delay = retry_policy.delay(attempt, getattr(e, 'retry_after', None))
+            print(f"ダウンロードに失敗したため{delay:.1f}秒後に再試行します: {str(e)}")
+            time.sleep(delay)
+            attempt += 1
+
+def _parse_total_size(response):
+    """Content-Range ヘッダーからファイル全体のサイズを取り出す"""
+    content_range = response.headers.get('Content-Range', '')
+    try:
+        return int(content_range.rsplit('/', 1)[1])
+    except (IndexError, ValueError):
+        raise DownloadError(f"Content-Rangeヘッダーを解釈できません: {content_range}")
+
+def _save_whole(response, partial_path):
+    """レスポンス全体をファイルに保存する"""
+    try:
+        with open(partial_path, 'wb') as out_file:
+            for chunk in response.stream(_CHUNK_SIZE):
+                out_file.write(chunk)
+    finally:
+        response.release_conn()
+
+def _plan_segments(total, segment_size):
+    """
+    ファイルを区間に分割する
+
+    Returns:
+        list: [開始位置, 終了位置（含む）, ダウンロード済みバイト数] のリスト
+    """
+    if total == 0:
+        return []
+    if total < PARALLEL_THRESHOLD:
+        return [[0, total - 1, 0]]
+    return [[start, min(start + segment_size, total) - 1, 0] for start in range(0, total, segment_size)]
+
+def _load_manifest(manifest_path, partial_path, total, validator):
+    """
+    再開用のマニフェストを読み込む
+
+    Returns:
+        list: 区間のリスト。再開できない場合はNone
+    """
+    try:
+        with open(manifest_path, 'r', encoding='utf-8') as f:
+            manifest = json.load(f)
+    except (OSError, ValueError):
+        return None
+
+    # ファイルが変わっている場合は最初からダウンロードし直す
+    if manifest.get('size') != total or manifest.get('validator') != validator:
+        return None
+    if not os.path.exists(partial_path) or os.path.getsize(partial_path) != total:
+        return None
+    return manifest.get('segments')
+
+def _save_manifest(manifest_path, segments, total, validator):
+    """再開用のマニフェストを保存する"""
+    temp_path = f"{manifest_path}.tmp"
+    with open(temp_path, 'w', encoding='utf-8') as f:
+        json.dump({'size': total, 'validator': validator, 'segments': segments}, f)
+    os.replace(temp_path, manifest_path)
+
+def _download_segments(http, url, headers, partial_path, manifest_path,
+                       segments, total, validator, max_workers):
+    """未完了の区間を並行にダウンロードする"""
+    lock = threading.Lock()
+    unsaved = [0]
+
+    def record(segment, length):
+        with lock:
+            segment[2] += length
+            unsaved[0] += length
+            if unsaved[0] >= _MANIFEST_SAVE_INTERVAL:
+                _save_manifest(manifest_path, segments, total, validator)
+                unsaved[0] = 0
+
+    def fetch(segment):
+        start, end = segment[0], segment[1]
+        attempt = 0
+        while segment[2] < end - start + 1:
+            received = segment[2]
+            range_headers = dict(headers, Range=f"bytes={start + segment[2]}-{end}")
+            if validator:
+                range_headers['If-Range'] = validator
+            try:
+                response = _request(http, url, range_headers)
+                if response.status != 206:
+                    response.release_conn()
+                    raise DownloadError("ダウンロード中にファイルが変更されたため再開できません")
+                try:
+                    with open(partial_path, 'r+b') as out_file:
+                        out_file.seek(start + segment[2])
+                        for chunk in response.stream(_CHUNK_SIZE):
+                            out_file.write(chunk)
+                            record(segment, len(chunk))
+                finally:
+                    response.release_conn()
+            except _RETRYABLE_ERRORS as e:
+                if segment[2] > received:
+                    # 途中まで受信できた場合は、続けて失敗した回数だけを数える
+                    attempt = 0
+                if attempt >= retry_policy.max_retries:
+                    raise
+                delay = retry_policy.delay(attempt, getattr(e, 'retry_after', None))
+                print(f"区間 {start}-{end} のダウンロードが中断したため{delay:.1f}秒後に再試行します: {str(e)}")
+                time.sleep(delay)
+                attempt += 1
+
+    pending = [segment for segment in segments if segment[2] < segment[1] - segment[0] + 1]
+    _save_manifest(manifest_path, segments, total, validator)
+    try:
+        with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(pending) or 1))) as executor:
+            for future in [executor.submit(fetch, segment) for segment in pending]:
+                future.result()
+    finally:
+        with lock:
+            _save_manifest(manifest_path, segments, total, validator)
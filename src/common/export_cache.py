@@ -0,0 +1,410 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+エクスポートした静止画・動画のローカルキャッシュ
+録画から切り出した静止画や動画は、同じデバイス・同じ時刻であれば内容が変わらないため、
+(デバイスID, 種類, 時間範囲) をキーとしてSQLiteの索引に記録し、ファイル自体は内容のハッシュで
+保存します（同じ内容のファイルは1つだけ保存します）。同じ時刻や重なる時間範囲を再度エクスポートする場合は、
+エクスポートジョブを作成せずにキャッシュから返します。
+"""
+
+import os
+import sys
+import time
+import shutil
+import sqlite3
+import threading
+from datetime import datetime
+
+# 共通モジュールのパスを追加
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+from common.token_cache import default_cache_dir
+from common.result_cache import file_digest
+
+# キャッシュの既定の上限（バイト）と保存期間（秒）
+DEFAULT_MAX_BYTES = 2 * 1024 * 1024 * 1024
+DEFAULT_TTL_SECONDS = 30 * 24 * 60 * 60
+
+def to_epoch_ms(timestamp):
+    """
+    ISO 8601形式の時刻をUNIXタイムスタンプ（ミリ秒）に変換する
+    エクスポートAPIのリクエストボディと同じ変換を行います。
+
+    Args:
+        timestamp (str): 時刻（ISO 8601形式）
+
+    Returns:
+        int: UNIXタイムスタンプ（ミリ秒）
+    """
+    return int(datetime.fromisoformat(timestamp.replace('Z', '+00:00')).timestamp() * 1000)
+
+class ExportCache:
+    """
+    エクスポートしたファイルのキャッシュ
+
+    ファイルは内容のSHA-256をファイル名として保存し、索引には (デバイスID, 種類, 開始時刻, 終了時刻)
+    とファイルのハッシュを記録します。保存から ttl 秒を過ぎたエントリは削除し、ファイルの合計サイズが
+    上限を超えた場合は最後に参照された時刻が古いものから削除します（LRU）。
+
+    使用例:
+        cache = ExportCache()
+        path = cache.get(device_id, 'image', timestamp)
+        if path is None:
+            export(device_id, timestamp, output_path)
+            cache.put(device_id, 'image', timestamp, None, output_path)
+    """
+
+    def __init__(self, cache_dir=None, max_bytes=DEFAULT_MAX_BYTES, ttl=DEFAULT_TTL_SECONDS):
+        """
+        Args:
+            cache_dir (str, optional): キャッシュのディレクトリ。指定しない場合は既定のキャッシュディレクトリを使用
+            max_bytes (int): 保存するファイルの合計サイズの上限（バイト）
+            ttl (float): エントリを保存する期間（秒）。0の場合は期限なし
+        """
+        self.cache_dir = cache_dir or os.path.join(default_cache_dir(), 'exports')
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.hits = 0
+        self.partial_hits = 0
+        self.misses = 0
+        self.evicted = 0
+        self._lock = threading.Lock()
+
+        os.makedirs(self.cache_dir, mode=0o700, exist_ok=True)
+        self._conn = sqlite3.connect(os.path.join(self.cache_dir, 'index.sqlite3'), timeout=30,
+                                     check_same_thread=False, isolation_level=None)
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.execute(
+            'CREATE TABLE IF NOT EXISTS exports ('
+            'device_id TEXT NOT NULL, kind TEXT NOT NULL, start_ms INTEGER NOT NULL, end_ms INTEGER NOT NULL, '
+            'digest TEXT NOT NULL, ext TEXT NOT NULL, size INTEGER NOT NULL, '
+            'created_at REAL NOT NULL, accessed_at REAL NOT NULL, '
+            'PRIMARY KEY (device_id, kind, start_ms, end_ms))'
+        )
+        self._conn.execute('CREATE INDEX IF NOT EXISTS exports_accessed_at ON exports (accessed_at)')
+        with self._lock:
+            self._evict()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    def get(self, device_id, kind, start, end=None):
+        """
+        時間範囲が完全に一致するファイルを取得する
+
+        Args:
+            device_id (str): デバイスID
+            kind (str): 種類（'image' または 'video'）
+            start (str): 時刻または開始時刻（ISO 8601形式）
+            end (str, optional): 終了時刻（ISO 8601形式）。静止画の場合は指定しない
+
+        Returns:
+            str: キャッシュしたファイルのパス。保存していない場合はNone
+        """
+        start_ms = to_epoch_ms(start)
+        end_ms = to_epoch_ms(end) if end else start_ms
+        with self._lock:
+            row = self._conn.execute(
+                'SELECT digest, ext FROM exports WHERE device_id = ? AND kind = ? AND start_ms = ? AND end_ms = ?',
+                (device_id, kind, start_ms, end_ms)
+            ).fetchone()
+            path = self._valid_blob(row)
+            if path is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self._conn.execute(
+                'UPDATE exports SET accessed_at = ? WHERE device_id = ? AND kind = ? AND start_ms = ? AND end_ms = ?',
+                (time.time(), device_id, kind, start_ms, end_ms)
+            )
+        return path
+
+    def plan(self, device_id, kind, start, end):
+        """
+        時間範囲を、キャッシュから切り出せる区間と不足している区間に分ける
+
+        先頭から順に、その時点を含むエントリのうち最も後まで続くものを選びます。
+        どのエントリにも含まれない区間は、次のエントリの開始時刻まで（または終了時刻まで）を
+        不足している区間とします。
+
+        Args:
+            device_id (str): デバイスID
+            kind (str): 種類（通常は 'video'）
+            start (str): 開始時刻（ISO 8601形式）
+            end (str): 終了時刻（ISO 8601形式）
+
+        Returns:
+            list: (区間の開始, 区間の終了, エントリ) のリスト（時刻はミリ秒）。
+                  エントリは start_ms, end_ms, path を含む辞書で、不足している区間はNone
+        """
+        with self._lock:
+            segments, used = self._plan(device_id, kind, to_epoch_ms(start), to_epoch_ms(end))
+            now = time.time()
+            self._conn.executemany(
+                'UPDATE exports SET accessed_at = ? WHERE device_id = ? AND kind = ? AND start_ms = ? AND end_ms = ?',
+                [(now, device_id, kind, entry_start, entry_end) for entry_start, entry_end in used]
+            )
+            if all(entry is not None for _, _, entry in segments):
+                self.hits += 1
+            elif used:
+                self.partial_hits += 1
+            else:
+                self.misses += 1
+        return segments
+
+    def covers(self, device_id, kind, start, end, exact=False):
+        """
+        時間範囲の全体をキャッシュから用意できるかを返す（ヒット数や参照時刻は更新しない）
+
+        Args:
+            device_id (str): デバイスID
+            kind (str): 種類（通常は 'video'）
+            start (str): 開始時刻（ISO 8601形式）
+            end (str): 終了時刻（ISO 8601形式）
+            exact (bool): 時間範囲が完全に一致するエントリがある場合のみTrueを返す（切り出しができない場合）
+
+        Returns:
+            bool: 不足している区間がなければTrue
+        """
+        start_ms = to_epoch_ms(start)
+        end_ms = to_epoch_ms(end)
+        with self._lock:
+            if exact:
+                row = self._conn.execute(
+                    'SELECT digest, ext FROM exports WHERE device_id = ? AND kind = ? AND start_ms = ? AND end_ms = ?',
+                    (device_id, kind, start_ms, end_ms)
+                ).fetchone()
+                return self._valid_blob(row) is not None
+            segments, _ = self._plan(device_id, kind, start_ms, end_ms)
+        return all(entry is not None for _, _, entry in segments)
+
+    def put(self, device_id, kind, start, end, path):
+        """
+        ファイルをキャッシュに保存し、期限切れのエントリや上限を超えた分を削除する
+
+        Args:
+            device_id (str): デバイスID
+            kind (str): 種類（'image' または 'video'）
+            start (str): 時刻または開始時刻（ISO 8601形式）
+            end (str): 終了時刻（ISO 8601形式）。静止画の場合はNone
+            path (str): 保存するファイルのパス
+
+        Returns:
+            str: キャッシュしたファイルのパス。上限より大きいなどで保存しなかった場合はNone
+        """
+        try:
+            return self._put(device_id, kind, start, end, path)
+        except (OSError, sqlite3.Error) as e:
+            # ディスクの空きがない場合などもエクスポート自体は成功として扱う
+            print(f"エクスポートしたファイルをキャッシュに保存できませんでした: {str(e)}")
+            return None
+
+    def _put(self, device_id, kind, start, end, path):
+        """put の本体"""
+        start_ms = to_epoch_ms(start)
+        end_ms = to_epoch_ms(end) if end else start_ms
+        size = os.path.getsize(path)
+        if size > self.max_bytes:
+            return None
+        digest = file_digest(path)
+        ext = os.path.splitext(path)[1].lower()
+        blob_path = self._blob_path(digest, ext)
+
+        # 同じ内容のファイルを保存済みであればコピーしない
+        if not os.path.exists(blob_path):
+            os.makedirs(os.path.dirname(blob_path), exist_ok=True)
+            temp_path = f"{blob_path}.{os.getpid()}.{threading.get_ident()}.tmp"
+            try:
+                shutil.copyfile(path, temp_path)
+                os.replace(temp_path, blob_path)
+            finally:
+                if os.path.exists(temp_path):
+                    os.unlink(temp_path)
+
+        now = time.time()
+        with self._lock:
+            previous = self._conn.execute(
+                'SELECT digest, ext FROM exports WHERE device_id = ? AND kind = ? AND start_ms = ? AND end_ms = ?',
+                (device_id, kind, start_ms, end_ms)
+            ).fetchone()
+            self._conn.execute(
+                'INSERT OR REPLACE INTO exports '
+                '(device_id, kind, start_ms, end_ms, digest, ext, size, created_at, accessed_at) '
+                'VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)',
+                (device_id, kind, start_ms, end_ms, digest, ext, size, now, now)
+            )
+            if previous and tuple(previous) != (digest, ext):
+                self._remove_unreferenced([tuple(previous)])
+            self._evict()
+            row = self._conn.execute(
+                'SELECT digest, ext FROM exports WHERE device_id = ? AND kind = ? AND start_ms = ? AND end_ms = ?',
+                (device_id, kind, start_ms, end_ms)
+            ).fetchone()
+        return self._blob_path(*row) if row else None
+
+    def report(self):
+        """
+        ヒット数とキャッシュの使用量を返す
+
+        Returns:
+            dict: ヒット数、一部ヒット数、ミス数、削除した件数、保存している件数とファイルの合計サイズ、上限
+        """
+        with self._lock:
+            entries = self._conn.execute('SELECT COUNT(*) FROM exports').fetchone()[0]
+            size = self._stored_bytes()
+        return {
+            'hits': self.hits,
+            'partial_hits': self.partial_hits,
+            'misses': self.misses,
+            'evicted': self.evicted,
+            'entries': entries,
+            'bytes': size,
+            'max_bytes': self.max_bytes,
+            'ttl': self.ttl
+        }
+
+    def close(self):
+        """索引のファイルを閉じる"""
+        with self._lock:
+            self._conn.close()
+
+    def _plan(self, device_id, kind, start_ms, end_ms):
+        """plan の本体（ロックを取得した状態で呼び出す）"""
+        rows = self._conn.execute(
+            'SELECT start_ms, end_ms, digest, ext FROM exports '
+            'WHERE device_id = ? AND kind = ? AND start_ms < ? AND end_ms > ? ORDER BY start_ms',
+            (device_id, kind, end_ms, start_ms)
+        ).fetchall()
+        entries = []
+        for entry_start, entry_end, digest, ext in rows:
+            path = self._valid_blob((digest, ext))
+            if path is not None:
+                entries.append({'start_ms': entry_start, 'end_ms': entry_end, 'path': path})
+
+        segments = []
+        used = set()
+        cursor = start_ms
+        while cursor < end_ms:
+            covering = [entry for entry in entries if entry['start_ms'] <= cursor < entry['end_ms']]
+            if covering:
+                entry = max(covering, key=lambda e: e['end_ms'])
+                segment_end = min(entry['end_ms'], end_ms)
+                used.add((entry['start_ms'], entry['end_ms']))
+            else:
+                entry = None
+                later = [e['start_ms'] for e in entries if e['start_ms'] > cursor]
+                segment_end = min(later + [end_ms])
+            segments.append((cursor, segment_end, entry))
+            cursor = segment_end
+        return segments, used
+
+    def _blob_path(self, digest, ext):
+        """内容のハッシュからファイルの保存先を返す"""
+        return os.path.join(self.cache_dir, 'blobs', digest[:2], f"{digest}{ext}")
+
+    def _valid_blob(self, row):
+        """索引の行に対応するファイルのパスを返す（ファイルが削除されていればNone）"""
+        if row is None:
+            return None
+        path = self._blob_path(*row)
+        return path if os.path.exists(path) else None
+
+    def _stored_bytes(self):
+        """保存しているファイルの合計サイズ（同じ内容のファイルは1回だけ数える）"""
+        return self._conn.execute(
+            'SELECT COALESCE(SUM(size), 0) FROM (SELECT DISTINCT digest, ext, size FROM exports)'
+        ).fetchone()[0]
+
+    def _evict(self):
+        """期限切れのエントリと、合計サイズが上限を超えた分を古いものから削除する"""
+        removed = []
+        if self.ttl:
+            removed += self._conn.execute(
+                'SELECT device_id, kind, start_ms, end_ms, digest, ext FROM exports WHERE created_at < ?',
+                (time.time() - self.ttl,)
+            ).fetchall()
+            self._delete(removed)
+
+        total = self._stored_bytes()
+        if total > self.max_bytes:
+            rows = self._conn.execute(
+                'SELECT device_id, kind, start_ms, end_ms, digest, ext FROM exports ORDER BY accessed_at'
+            ).fetchall()
+            for row in rows:
+                if total <= self.max_bytes:
+                    break
+                # 同じ内容のファイルを他のエントリが参照している場合は合計サイズが減らないため、減るまで続ける
+                self._delete([row])
+                removed.append(row)
+                total = self._stored_bytes()
+
+        self._remove_unreferenced({(row[4], row[5]) for row in removed})
+        self.evicted += len(removed)
+
+    def _delete(self, rows):
+        """索引からエントリを削除する"""
+        self._conn.executemany(
+            'DELETE FROM exports WHERE device_id = ? AND kind = ? AND start_ms = ? AND end_ms = ?',
+            [row[:4] for row in rows]
+        )
+
+    def _remove_unreferenced(self, blobs):
+        """どのエントリからも参照されなくなったファイルを削除する"""
+        for digest, ext in blobs:
+            referenced = self._conn.execute(
+                'SELECT 1 FROM exports WHERE digest = ? AND ext = ? LIMIT 1', (digest, ext)
+            ).fetchone()
+            if not referenced:
+                try:
+                    os.unlink(self._blob_path(digest, ext))
+                except FileNotFoundError:
+                    pass
+
+def add_export_cache_arguments(parser):
+    """
+    エクスポートのキャッシュに関するコマンドライン引数を追加する
+
+    Args:
+        parser (argparse.ArgumentParser): 引数を追加するパーサー
+    """
+    group = parser.add_argument_group('キャッシュ')
+    group.add_argument('--no-cache', dest='cache', action='store_false',
+                       help='エクスポートしたファイルのローカルキャッシュを使用しない')
+    group.add_argument('--cache-max-mb', type=int, default=DEFAULT_MAX_BYTES // 1024 // 1024,
+                       help='キャッシュの合計サイズの上限（MB）')
+    group.add_argument('--cache-ttl-days', type=float, default=DEFAULT_TTL_SECONDS / 86400,
+                       help='キャッシュの保存期間（日）。0の場合は期限なし')
+
+def create_export_cache(args):
+    """
+    コマンドライン引数から ExportCache を作成する
+
+    Args:
+        args: add_export_cache_arguments で追加した引数を含むコマンドライン引数
+
+    Returns:
+        ExportCache: --no-cache を指定した場合や、キャッシュディレクトリに書き込めない場合はNone
+    """
+    if not args.cache:
+        return None
+    try:
+        return ExportCache(max_bytes=args.cache_max_mb * 1024 * 1024, ttl=args.cache_ttl_days * 86400)
+    except (OSError, sqlite3.Error) as e:
+        # キャッシュディレクトリを作成・書き込みできない環境ではキャッシュを使わずにエクスポートする
+        print(f"エクスポートのキャッシュを使用できません: {str(e)}")
+        return None
+
+def print_export_cache_report(report):
+    """
+    ExportCache.report の結果を表示する
+
+    Args:
+        report (dict): ExportCache.report の結果
+    """
+    print(f"エクスポートのキャッシュ: ヒット {report['hits']}件、一部ヒット {report['partial_hits']}件、"
+          f"ミス {report['misses']}件、保存 {report['entries']}件 / {report['bytes'] / 1024 / 1024:.1f}MB"
+          f"（上限 {report['max_bytes'] / 1024 / 1024:.0f}MB）")
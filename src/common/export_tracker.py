@@ -0,0 +1,307 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+ソラカメのエクスポートジョブの完了をまとめて監視するトラッカー
+デバイスごとにエクスポートジョブ一覧を1回だけ取得し、
+そのレスポンスで待機中の全てのジョブの完了を判定します
+"""
+
+import os
+import sys
+import time
+import threading
+from concurrent.futures import Future, InvalidStateError, ThreadPoolExecutor
+
+# 共通モジュールのパスを追加
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+from common.soracom_api import (
+    get_export_status,
+    remember_completed_export
+)
+
+# 監視できるエクスポートの種類
+EXPORT_KINDS = ('video', 'image')
+
+class _PendingExport:
+    """待機中のエクスポートジョブ"""
+
+    def __init__(self, export_id, deadline):
+        self.export_id = export_id
+        self.deadline = deadline
+        self.future = Future()
+        self.status = None
+        # ジョブ一覧に続けて含まれなかった回数
+        self.missed = 0
+
+class _DeviceGroup:
+    """同じデバイス・種類のエクスポートジョブの集まり"""
+
+    def __init__(self, kind, device_id, interval):
+        self.kind = kind
+        self.device_id = device_id
+        self.pending = {}
+        self.interval = interval
+        self.next_poll = time.time()
+        self.polling = False
+        self.last_error = None
+
+class ExportTracker:
+    """
+    エクスポートジョブの完了をまとめて監視するトラッカー
+
+    デバイスごとにポーリングを1本にまとめるため、APIの呼び出し回数は
+    ジョブ数ではなくデバイス数に比例します。状態に変化がない間は
+    ポーリング間隔を伸ばし（バックオフ）、変化があれば元の間隔に戻します。
+
+    使用例:
+        with ExportTracker() as tracker:
+            futures = [tracker.track(device_id, export_id, 'image') for export_id in export_ids]
+            for future in futures:
+                export_info = future.result()
+    """
+
+    def __init__(self, interval=5, max_interval=30, backoff=1.5, timeout=600, max_workers=8, lookup_after=3):
+        """
+        Args:
+            interval (float): ステータス確認の初期間隔（秒）
+            max_interval (float): バックオフ時の最大間隔（秒）
+            backoff (float): 変化がなかった場合に間隔に掛ける係数
+            timeout (float): ジョブごとの既定のタイムアウト（秒）
+            max_workers (int): 並行してポーリングするデバイス数の上限
+            lookup_after (int): ジョブ一覧にこの回数続けて含まれなかったジョブは、ジョブ単体のステータスで確認する
+        """
+        self.interval = interval
+        self.max_interval = max_interval
+        self.backoff = backoff
+        self.timeout = timeout
+        self.lookup_after = lookup_after
+        self.api_calls = 0
+        self._groups = {}
+        self._closed = False
+        self._condition = threading.Condition()
+        self._executor = ThreadPoolExecutor(max_workers=max_workers)
+        self._thread = threading.Thread(target=self._run, name='export-tracker', daemon=True)
+        self._thread.start()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    def track(self, device_id, export_id, kind='video', callback=None, timeout=None):
+        """
+        エクスポートジョブを監視対象に追加する
+
+        Args:
+            device_id (str): デバイスID
+            export_id (str): エクスポートジョブID
+            kind (str): エクスポートの種類（'video' または 'image'）
+            callback (callable, optional): 完了時に Future を引数として呼ばれる関数
+            timeout (float, optional): タイムアウト（秒）。指定しない場合は既定値
+
+        Returns:
+            concurrent.futures.Future: 完了時にエクスポートジョブ情報が設定される Future
+        """
+        if kind not in EXPORT_KINDS:
+            raise ValueError(f"不明なエクスポートの種類です: {kind}")
+
+        deadline = time.time() + (timeout if timeout is not None else self.timeout)
+        job = _PendingExport(export_id, deadline)
+        if callback:
+            job.future.add_done_callback(callback)
+
+        with self._condition:
+            if self._closed:
+                raise RuntimeError("トラッカーは既に終了しています")
+            key = (kind, device_id)
+            group = self._groups.get(key)
+            if group is None:
+                group = _DeviceGroup(kind, device_id, self.interval)
+                self._groups[key] = group
+            # 新しいジョブが追加されたら間隔を初期値に戻す
+            group.interval = self.interval
+            group.pending[export_id] = job
+            self._condition.notify()
+
+        return job.future
+
+    def pending_count(self):
+        """
+        待機中のジョブ数を返す
+
+        Returns:
+            int: 待機中のジョブ数
+        """
+        with self._condition:
+            return sum(len(group.pending) for group in self._groups.values())
+
+    def close(self):
+        """監視を終了し、待機中のジョブをキャンセルする"""
+        with self._condition:
+            if self._closed:
+                return
+            self._closed = True
+            for group in self._groups.values():
+                for job in group.pending.values():
+                    job.future.cancel()
+                group.pending.clear()
+            self._condition.notify_all()
+        self._thread.join()
+        self._executor.shutdown(wait=True)
+
+    def _run(self):
+        """期限を迎えたデバイスのポーリングを割り当てるループ"""
+        with self._condition:
+            while not self._closed:
+                now = time.time()
+                next_wakeup = None
+                for group in self._groups.values():
+                    if not group.pending or group.polling:
+                        continue
+                    if group.next_poll <= now:
+                        group.polling = True
+                        self._executor.submit(self._poll_group, group)
+                    elif next_wakeup is None or group.next_poll < next_wakeup:
+                        next_wakeup = group.next_poll
+                self._condition.wait(None if next_wakeup is None else max(next_wakeup - now, 0))
+
+    def _poll_group(self, group):
+        """1つのデバイスのエクスポートジョブ一覧を取得して待機中のジョブを判定する"""
+        with self._condition:
+            export_ids = list(group.pending)
+
+        exports = None
+        last_error = None
+        api_calls = 1
+        try:
+            if len(export_ids) == 1:
+                # 待機中のジョブが1件だけならジョブ単体のステータスを取得する
+                exports = [get_export_status(group.kind, group.device_id, export_ids[0])]
+            else:
+                exports = get_export_status(group.kind, group.device_id)
+        except Exception as e:
+            last_error = e
+
+        if exports is not None and len(export_ids) > 1:
+            # 一覧はページングされるため、含まれていないジョブは次のポーリングまで待機中のままにし、
+            # lookup_after 回続けて含まれなかった場合だけジョブ単体のステータスで確認する
+            listed = {export.get('exportId') for export in exports}
+            lookups = []
+            with self._condition:
+                for export_id in list(export_ids):
+                    job = group.pending.get(export_id)
+                    if job is None or export_id in listed:
+                        if job is not None:
+                            job.missed = 0
+                        continue
+                    job.missed += 1
+                    if job.missed >= self.lookup_after:
+                        job.missed = 0
+                        lookups.append(export_id)
+                    else:
+                        export_ids.remove(export_id)
+            for export_id in lookups:
+                api_calls += 1
+                try:
+                    exports.append(get_export_status(group.kind, group.device_id, export_id))
+                except Exception as e:
+                    # 確認できなかったジョブは次のポーリングまで待機中のままにする
+                    last_error = e
+                    export_ids.remove(export_id)
+
+        # コールバックはロックの外で呼び出すため、結果をまとめてから設定する
+        outcomes = []
+        with self._condition:
+            self.api_calls += api_calls
+            group.last_error = last_error
+            changed = False
+            if exports is not None:
+                changed = self._resolve(group, export_ids, exports, outcomes)
+            self._expire(group, outcomes)
+
+            if changed:
+                group.interval = self.interval
+            else:
+                group.interval = min(group.interval * self.backoff, self.max_interval)
+            group.next_poll = time.time() + group.interval
+            group.polling = False
+            if not group.pending and self._groups.get((group.kind, group.device_id)) is group:
+                # 待機中のジョブがなくなったデバイスは削除する（再び追加されたら作り直す）
+                del self._groups[(group.kind, group.device_id)]
+            self._condition.notify()
+
+        for future, result, error in outcomes:
+            try:
+                if error is not None:
+                    future.set_exception(error)
+                else:
+                    future.set_result(result)
+            except InvalidStateError:
+                # 呼び出し元で既にキャンセルされている
+                pass
+
+    def _resolve(self, group, export_ids, exports, outcomes):
+        """
+        取得したジョブ一覧から待機中のジョブの完了を判定する
+
+        Args:
+            group (_DeviceGroup): 判定するデバイス
+            export_ids (list): ステータスを取得したジョブのID（取得後に追加されたジョブは判定しない）
+            exports (list): 取得したエクスポートジョブの一覧
+            outcomes (list): 確定した (Future, 結果, 例外) を追加するリスト
+
+        Returns:
+            bool: いずれかのジョブの状態が変化した場合はTrue
+        """
+        by_id = {export.get('exportId'): export for export in exports}
+        changed = False
+
+        for export_id in export_ids:
+            job = group.pending.get(export_id)
+            if job is None:
+                continue
+            if job.future.done():
+                # 呼び出し元でキャンセルされたジョブは監視対象から外す
+                del group.pending[export_id]
+                continue
+
+            export_info = by_id.get(export_id)
+
+            if not export_info:
+                del group.pending[export_id]
+                outcomes.append((job.future, None, Exception(f"エクスポートジョブが見つかりません: {export_id}")))
+                changed = True
+                continue
+
+            status = export_info.get('status')
+            if status != job.status:
+                job.status = status
+                changed = True
+
+            if status == 'completed':
+                del group.pending[export_id]
+                print(f"エクスポートジョブが完了しました: {export_id}")
+                # 直後のダウンロードでステータスを再取得しないように登録する
+                remember_completed_export(group.kind, group.device_id, export_info)
+                outcomes.append((job.future, export_info, None))
+            elif status in ['failed', 'canceled']:
+                del group.pending[export_id]
+                outcomes.append((job.future, None, Exception(f"エクスポートジョブが失敗しました: {status}")))
+
+        return changed
+
+    def _expire(self, group, outcomes):
+        """タイムアウトしたジョブを失敗として扱う"""
+        now = time.time()
+        for export_id, job in list(group.pending.items()):
+            if now <= job.deadline and not job.future.done():
+                continue
+            del group.pending[export_id]
+            if job.future.done():
+                continue
+            message = f"エクスポートジョブがタイムアウトしました: {export_id}"
+            if group.last_error:
+                message += f"（最後のエラー: {str(group.last_error)}）"
+            outcomes.append((job.future, None, Exception(message)))
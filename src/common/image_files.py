@@ -0,0 +1,35 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+まとめて解析する画像ファイルの収集
+analyze_image_yolo.py / analyze_image_gpt.py / export_yolo_model.py の
+--images / --dir で指定された画像ファイルのパスを集めます
+"""
+
+import os
+import glob
+
+# まとめて解析する画像ファイルの拡張子
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.bmp', '.webp')
+
+def collect_image_paths(patterns=None, directory=None):
+    """
+    まとめて解析する画像ファイルのパスを集める
+
+    Args:
+        patterns (list, optional): 画像ファイルのパスまたはワイルドカード
+        directory (str, optional): 画像ファイルのディレクトリ
+
+    Returns:
+        list: 画像ファイルのパス（名前順）
+    """
+    paths = []
+    if directory:
+        paths = [os.path.join(directory, name) for name in os.listdir(directory)
+                 if name.lower().endswith(IMAGE_EXTENSIONS)]
+    for pattern in patterns or []:
+        # シェルで展開されなかったワイルドカードを展開する
+        matched = glob.glob(pattern)
+        paths.extend(matched if matched else [pattern])
+    return sorted(set(paths))
@@ -0,0 +1,56 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+ハンズオン用スクリプトの対話的な一時停止
+各スクリプトのmain関数は処理の区切りでEnterキーの入力を待ちますが、
+バッチモード（--batch / --yes、または環境変数 SORACOM_BATCH=1）や標準入力が端末でない場合は
+待たずに続けて実行します。ライブラリとして使用する関数は入力を待ちません。
+"""
+
+import os
+import sys
+
+# --batch を指定した場合にTrue
+_batch_mode = False
+
+def set_batch_mode(enabled):
+    """
+    バッチモードを設定する
+
+    Args:
+        enabled (bool): Trueの場合はEnterキーの入力を待たない
+    """
+    global _batch_mode
+    _batch_mode = enabled
+
+def is_batch_mode():
+    """
+    Enterキーの入力を待たずに実行するかを返す
+
+    Returns:
+        bool: バッチモード、環境変数 SORACOM_BATCH=1、または標準入力が端末でない場合はTrue
+    """
+    if _batch_mode or os.environ.get('SORACOM_BATCH') == '1':
+        return True
+    return not (sys.stdin and sys.stdin.isatty())
+
+def pause(message="Enterキーを押すと、処理を続行します..."):
+    """
+    Enterキーの入力を待つ（バッチモードの場合は待たない）
+
+    Args:
+        message (str): 表示するメッセージ
+    """
+    if not is_batch_mode():
+        input(message)
+
+def add_batch_argument(parser):
+    """
+    バッチモードのコマンドライン引数を追加する
+
+    Args:
+        parser (argparse.ArgumentParser): 引数を追加するパーサー
+    """
+    parser.add_argument('--batch', '--yes', '-y', dest='batch', action='store_true',
+                        help='Enterキーの入力を待たずに全ての処理を続けて実行する（スクリプトや自動実行向け）')
@@ -0,0 +1,274 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+SORACOM APIの呼び出しレートを制限するためのトークンバケットと再試行ポリシー
+エンドポイントの種類（ファミリー）ごとにトークンバケットを持ち、
+429（Too Many Requests）や5xxエラー時の再試行間隔を計算します
+"""
+
+import time
+import random
+import threading
+from email.utils import parsedate_to_datetime
+
+class TokenBucket:
+    """
+    トークンバケット
+
+    毎秒 rate 個のトークンが補充され、最大 burst 個まで貯まります。
+    1回のリクエストにつき1個のトークンを消費します。
+    """
+
+    def __init__(self, rate, burst):
+        """
+        Args:
+            rate (float): 1秒あたりに補充されるトークン数
+            burst (int): 貯めておけるトークンの最大数
+        """
+        self.rate = rate
+        self.burst = burst
+        self._tokens = burst
+        self._updated_at = time.monotonic()
+        self._blocked_until = 0.0
+        self._lock = threading.Lock()
+
+    def reserve(self):
+        """
+        トークンを1個予約し、使用できるまでの待ち時間を返す
+
+        Returns:
+            float: トークンが使用できるまでの待ち時間（秒）
+        """
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.burst, self._tokens + (now - self._updated_at) * self.rate)
+            self._updated_at = now
+            self._tokens -= 1
+
+            wait = 0.0
+            if self._tokens < 0:
+                wait = -self._tokens / self.rate
+            return max(wait, self._blocked_until - now)
+
+    def block(self, seconds):
+        """
+        サーバーから待機を指示された場合に、指定時間トークンの払い出しを止める
+
+        Args:
+            seconds (float): 待機する時間（秒）
+        """
+        with self._lock:
+            self._blocked_until = max(self._blocked_until, time.monotonic() + seconds)
+
+class RateLimiter:
+    """
+    エンドポイントのファミリーごとのトークンバケットと統計情報をまとめたもの
+    """
+
+    def __init__(self, limits):
+        """
+        Args:
+            limits (dict): ファミリー名から {'rate': 毎秒のリクエスト数, 'burst': バースト数} への辞書。
+                'default' は設定のないファミリーに使用する
+        """
+        self._limits = dict(limits)
+        self._buckets = {}
+        self._lock = threading.Lock()
+        self._stats = {
+            'requests': 0,
+            'retries': 0,
+            'throttled': 0,
+            'rate_limit_waits': 0,
+            'rate_limit_wait_seconds': 0.0
+        }
+
+    def configure(self, family, rate, burst=None):
+        """
+        ファミリーのレート制限を変更する
+
+        Args:
+            family (str): エンドポイントのファミリー名
+            rate (float): 1秒あたりのリクエスト数
+            burst (int, optional): バースト数。指定しない場合はrateと同じ（最低1）
+        """
+        burst = burst if burst is not None else max(1, int(rate))
+        with self._lock:
+            self._limits[family] = {'rate': rate, 'burst': burst}
+            self._buckets.pop(family, None)
+
+    def bucket(self, family):
+        """
+        ファミリーのトークンバケットを返す
+
+        Args:
+            family (str): エンドポイントのファミリー名
+
+        Returns:
+            TokenBucket: トークンバケット
+        """
+        with self._lock:
+            bucket = self._buckets.get(family)
+            if bucket is None:
+                limit = self._limits.get(family) or self._limits['default']
+                bucket = TokenBucket(limit['rate'], limit['burst'])
+                self._buckets[family] = bucket
+            return bucket
+
+    def reserve(self, family):
+        """
+        リクエストを1回分予約し、送信までの待ち時間を返す
+
+        Args:
+            family (str): エンドポイントのファミリー名
+
+        Returns:
+            float: 送信までの待ち時間（秒）
+        """
+        wait = self.bucket(family).reserve()
+        with self._lock:
+            self._stats['requests'] += 1
+            if wait > 0:
+                self._stats['rate_limit_waits'] += 1
+                self._stats['rate_limit_wait_seconds'] += wait
+        return wait
+
+    def acquire(self, family):
+        """
+        リクエストを送信できるまで待機する
+
+        Args:
+            family (str): エンドポイントのファミリー名
+        """
+        wait = self.reserve(family)
+        if wait > 0:
+            time.sleep(wait)
+
+    def record_retry(self, family, throttled=False, retry_after=None):
+        """
+        再試行を記録する
+
+        Args:
+            family (str): エンドポイントのファミリー名
+            throttled (bool): 429エラーによる再試行の場合はTrue
+            retry_after (float, optional): サーバーから指示された待機時間（秒）
+        """
+        with self._lock:
+            self._stats['retries'] += 1
+            if throttled:
+                self._stats['throttled'] += 1
+        if retry_after:
+            self.bucket(family).block(retry_after)
+
+    def stats(self):
+        """
+        統計情報を返す
+
+        Returns:
+            dict: リクエスト数、再試行数、429の回数、レート制限による待機回数と待機時間
+        """
+        with self._lock:
+            return dict(self._stats)
+
+class RetryPolicy:
+    """
+    再試行の回数と待機時間（ジッター付き指数バックオフ）を決めるポリシー
+    """
+
+    # 再試行するステータスコード
+    RETRY_STATUSES = (429, 500, 502, 503, 504)
+    # 処理されていないことが明らかなため、POSTでも再試行するステータスコード
+    SAFE_RETRY_STATUSES = (429, 503)
+
+    def __init__(self, max_retries=5, base_delay=0.5, max_delay=30.0):
+        """
+        Args:
+            max_retries (int): 最大再試行回数
+            base_delay (float): 1回目の再試行の基準待機時間（秒）
+            max_delay (float): 待機時間の上限（秒）
+        """
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+
+    def should_retry_status(self, method, status, attempt):
+        """
+        ステータスコードに対して再試行するかを判定する
+
+        Args:
+            method (str): HTTPメソッド
+            status (int): ステータスコード
+            attempt (int): これまでの再試行回数
+
+        Returns:
+            bool: 再試行する場合はTrue
+        """
+        if attempt >= self.max_retries:
+            return False
+        if method.upper() in ('GET', 'HEAD', 'PUT', 'DELETE'):
+            return status in self.RETRY_STATUSES
+        return status in self.SAFE_RETRY_STATUSES
+
+    def delay(self, attempt, retry_after=None):
+        """
+        次の再試行までの待機時間を返す
+
+        Args:
+            attempt (int): これまでの再試行回数
+            retry_after (float, optional): サーバーから指示された待機時間（秒）
+
+        Returns:
+            float: 待機時間（秒）
+        """
+        backoff = min(self.max_delay, self.base_delay * (2 ** attempt))
+        # フルジッター: 多数のクライアントが同時に再試行しないようにばらつかせる
+        jittered = random.uniform(0, backoff)
+        if retry_after is not None:
+            return min(self.max_delay, retry_after) + jittered * 0.1
+        return jittered
+
+def parse_retry_after(value):
+    """
+    Retry-Afterヘッダーの値を秒数に変換する
+
+    Args:
+        value (str): Retry-Afterヘッダーの値（秒数またはHTTP日付）
+
+    Returns:
+        float: 待機時間（秒）。解釈できない場合はNone
+    """
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        retry_at = parsedate_to_datetime(value)
+        return max(0.0, retry_at.timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+def endpoint_family(method, path):
+    """
+    APIのパスからレート制限のファミリー名を決める
+
+    Args:
+        method (str): HTTPメソッド
+        path (str): APIのパス（クエリを含んでもよい）
+
+    Returns:
+        str: ファミリー名
+    """
+    path = path.split('?', 1)[0]
+    if path == '/auth':
+        return 'auth'
+    if path.startswith('/sora_cam/'):
+        if path.endswith('/exports') and method.upper() == 'POST':
+            return 'sora_cam.export_requests'
+        if path.endswith('/snapshots'):
+            return 'sora_cam.snapshots'
+        return 'sora_cam'
+    if path.startswith('/subscribers'):
+        return 'subscribers'
+    return 'default'
@@ -0,0 +1,199 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+画像の解析結果のキャッシュ
+画像のバイト列のハッシュと解析の条件（モデル、プロンプト、しきい値など）をキーとして、
+YOLOやGPTの解析結果をSQLiteのファイルに保存します。同じ画像を同じ条件で解析し直す場合は、
+推論やAPIの呼び出しを行わずに保存した結果を返します。
+"""
+
+import os
+import sys
+import json
+import time
+import sqlite3
+import hashlib
+import threading
+
+# 共通モジュールのパスを追加
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+from common.token_cache import default_cache_dir
+
+# キャッシュの既定の上限（バイト）
+DEFAULT_MAX_BYTES = 100 * 1024 * 1024
+
+def file_digest(path):
+    """
+    ファイルの内容のハッシュを計算する
+
+    Args:
+        path (str): ファイルのパス
+
+    Returns:
+        str: SHA-256のハッシュ（16進数）
+    """
+    with open(path, 'rb') as f:
+        return hashlib.file_digest(f, 'sha256').hexdigest()
+
+def bytes_digest(data):
+    """
+    バイト列のハッシュを計算する
+
+    Args:
+        data (bytes): バイト列
+
+    Returns:
+        str: SHA-256のハッシュ（16進数）
+    """
+    return hashlib.sha256(data).hexdigest()
+
+class ResultCache:
+    """
+    解析結果のファイルキャッシュ
+
+    結果はJSONとしてSQLiteに保存し、合計サイズが上限を超えた場合は
+    最後に参照された時刻が古いものから削除します（LRU）。
+    SQLiteのロックにより、複数のプロセスから同じファイルを使用できます。
+
+    使用例:
+        cache = ResultCache()
+        key = cache.make_key(file_digest(image_path), model='yolov8n.pt', conf=0.25)
+        result = cache.get(key)
+        if result is None:
+            result = analyze(image_path)
+            cache.put(key, result)
+    """
+
+    def __init__(self, path=None, max_bytes=DEFAULT_MAX_BYTES):
+        """
+        Args:
+            path (str, optional): キャッシュファイルのパス。指定しない場合は既定のキャッシュディレクトリを使用
+            max_bytes (int): 保存する結果の合計サイズの上限（バイト）
+        """
+        self.path = path or os.path.join(default_cache_dir(), 'results.sqlite3')
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.evicted = 0
+        self._lock = threading.Lock()
+
+        os.makedirs(os.path.dirname(self.path), mode=0o700, exist_ok=True)
+        self._conn = sqlite3.connect(self.path, timeout=30, check_same_thread=False, isolation_level=None)
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.execute(
+            'CREATE TABLE IF NOT EXISTS results ('
+            'key TEXT PRIMARY KEY, value TEXT NOT NULL, size INTEGER NOT NULL, '
+            'created_at REAL NOT NULL, accessed_at REAL NOT NULL)'
+        )
+        self._conn.execute('CREATE INDEX IF NOT EXISTS results_accessed_at ON results (accessed_at)')
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    @staticmethod
+    def make_key(image_digest, **params):
+        """
+        キャッシュのキーを作成する
+
+        Args:
+            image_digest (str): 画像のハッシュ（file_digest または bytes_digest の結果）
+            **params: 結果に影響する解析の条件（モデル、プロンプト、しきい値など）
+
+        Returns:
+            str: キャッシュのキー
+        """
+        payload = json.dumps({'image': image_digest, 'params': params}, sort_keys=True, ensure_ascii=False)
+        return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+    def get(self, key):
+        """
+        保存した結果を取得する
+
+        Args:
+            key (str): キャッシュのキー
+
+        Returns:
+            保存した結果。保存していない場合はNone
+        """
+        with self._lock:
+            row = self._conn.execute('SELECT value FROM results WHERE key = ?', (key,)).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self._conn.execute('UPDATE results SET accessed_at = ? WHERE key = ?', (time.time(), key))
+        return json.loads(row[0])
+
+    def put(self, key, value):
+        """
+        結果を保存し、上限を超えた場合は古い結果を削除する
+
+        Args:
+            key (str): キャッシュのキー
+            value: JSONに変換できる結果
+        """
+        data = json.dumps(value, ensure_ascii=False)
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                'INSERT OR REPLACE INTO results (key, value, size, created_at, accessed_at) VALUES (?, ?, ?, ?, ?)',
+                (key, data, len(data.encode('utf-8')), now, now)
+            )
+            self._evict()
+
+    def report(self):
+        """
+        ヒット数とキャッシュの使用量を返す
+
+        Returns:
+            dict: ヒット数、ミス数、ヒット率、削除した件数、保存している件数と合計サイズ、上限
+        """
+        with self._lock:
+            entries, size = self._conn.execute('SELECT COUNT(*), COALESCE(SUM(size), 0) FROM results').fetchone()
+        lookups = self.hits + self.misses
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': self.hits / lookups if lookups else 0.0,
+            'evicted': self.evicted,
+            'entries': entries,
+            'bytes': size,
+            'max_bytes': self.max_bytes
+        }
+
+    def close(self):
+        """キャッシュファイルを閉じる"""
+        with self._lock:
+            self._conn.close()
+
+    def _evict(self):
+        """合計サイズが上限以下になるまで、最後に参照された時刻が古い結果から削除する"""
+        total = self._conn.execute('SELECT COALESCE(SUM(size), 0) FROM results').fetchone()[0]
+        if total <= self.max_bytes:
+            return
+
+        rows = self._conn.execute('SELECT key, size FROM results ORDER BY accessed_at').fetchall()
+        keys = []
+        for key, size in rows:
+            if total <= self.max_bytes:
+                break
+            keys.append((key,))
+            total -= size
+        self._conn.executemany('DELETE FROM results WHERE key = ?', keys)
+        self.evicted += len(keys)
+
+def print_cache_report(report):
+    """
+    ResultCache.report の結果を表示する
+
+    Args:
+        report (dict): ResultCache.report の結果
+    """
+    print(f"結果のキャッシュ: ヒット {report['hits']}件、ミス {report['misses']}件"
+          f"（ヒット率 {report['hit_rate'] * 100:.1f}%）、"
+          f"保存 {report['entries']}件 / {report['bytes'] / 1024 / 1024:.1f}MB"
+          f"（上限 {report['max_bytes'] / 1024 / 1024:.0f}MB）")
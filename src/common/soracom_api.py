@@ -7,17 +7,30 @@ SORACOM APIを使用するための共通関数
 """
 
 import os
+import sys
 import json
+import argparse
 import urllib3
 import certifi
 import time
 import zipfile
 import tempfile
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 from urllib.parse import urlencode
 from dotenv import load_dotenv
 import shutil
 
+# 共通モジュールのパスを追加
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+from common.token_cache import TokenCache
+from common.rate_limit import RateLimiter, RetryPolicy, endpoint_family, parse_retry_after
+from common.zip_stream import extract_first_video, ZipStreamUnsupported
+from common.downloader import download_file, ResumableStream
+from common.interactive import add_batch_argument, pause, set_batch_mode
+
 # .envファイルを読み込む
 load_dotenv()
 
@@ -28,13 +41,55 @@ config = {
         "auth_key_id": os.environ.get("SORACOM_AUTH_KEY_ID", "keyId-xxxxxxxxxxxx"),
         "auth_key": os.environ.get("SORACOM_AUTH_KEY", "secret-xxxxxxxxxxxx"),
         "api_key": None,
-        "token": None
+        "token": None,
+        "scope": "SoraCam:* OAuth2:authorize",
+        "token_timeout": 86400,  # 認証トークンの有効期間（秒）
+        "expires_at": None
+    },
+    # 認証トークンをキャッシュファイルに保存してプロセス間で共有する
+    "token_cache": os.environ.get("SORACOM_TOKEN_CACHE", "1") != "0",
+    # エンドポイントのファミリーごとのレート制限（1秒あたりのリクエスト数とバースト数）
+    "rate_limits": {
+        "default": {"rate": 10, "burst": 20},
+        "auth": {"rate": 1, "burst": 2},
+        "sora_cam.export_requests": {"rate": 2, "burst": 5},
+        "sora_cam.snapshots": {"rate": 5, "burst": 10}
     }
 }
 
+# 有効期限のこの秒数前になったら認証トークンを更新する
+TOKEN_REFRESH_MARGIN = 300
+
 # HTTPクライアントの初期化
 http = urllib3.PoolManager(cert_reqs='CERT_REQUIRED', ca_certs=certifi.where())
 
+# APIのレート制限と再試行ポリシー
+rate_limiter = RateLimiter(config['rate_limits'])
+retry_policy = RetryPolicy()
+
+# 1回の動画エクスポートで指定できる最大の長さ（秒）
+MAX_VIDEO_EXPORT_SECONDS = 900
+
+# ZIPエクスポートに含まれる動画ファイルの拡張子
+VIDEO_EXTENSIONS = ('.mp4', '.avi', '.mov', '.mkv', '.wmv')
+
+# 完了済みエクスポートのインデックス
+# 完了を確認した直後のダウンロードでステータスを再取得しないために使用する
+COMPLETED_EXPORT_INDEX_SIZE = 1024
+COMPLETED_EXPORT_TTL = 600  # ダウンロードURLの有効期限を考慮した保持時間（秒）
+_completed_exports = OrderedDict()
+_completed_exports_lock = threading.Lock()
+
+# 認証処理の排他制御（複数スレッドからの同時再認証を防ぐ）
+_auth_lock = threading.RLock()
+
+class SoracomApiError(Exception):
+    """SORACOM APIがエラーを返したときの例外"""
+    
+    def __init__(self, message, status=None):
+        super().__init__(message)
+        self.status = status
+
 def load_config(config_path):
     """
     設定ファイルから認証情報を読み込む
@@ -54,6 +109,39 @@ def load_config(config_path):
         print(f'設定ファイル {config_path} の読み込みに失敗しました: {str(e)}')
         print('環境変数または既定値を使用します')
 
+def auth_token_expiring():
+    """
+    認証トークンの有効期限が近いかを返す
+    
+    Returns:
+        bool: 認証トークンがあり、有効期限まで TOKEN_REFRESH_MARGIN 秒未満の場合はTrue
+    """
+    expires_at = config['auth']['expires_at']
+    return bool(config['auth']['token'] and expires_at and expires_at - time.time() < TOKEN_REFRESH_MARGIN)
+
+def build_auth_headers():
+    """
+    SORACOM APIの認証ヘッダーを作成する
+    
+    Returns:
+        dict: X-Soracom-API-Key / X-Soracom-Token ヘッダー
+    """
+    # 有効期限が近い認証トークンは事前に更新する
+    if auth_token_expiring():
+        auth_with_api_key(invalid_token=config['auth']['token'])
+    
+    # 認証トークンがあれば使用する
+    if config['auth']['api_key'] and config['auth']['token']:
+        return {
+            'X-Soracom-API-Key': config['auth']['api_key'],
+            'X-Soracom-Token': config['auth']['token']
+        }
+    # 認証トークンがなければAPIキーとシークレットを使用する
+    return {
+        'X-Soracom-API-Key': config['auth']['auth_key_id'],
+        'X-Soracom-Token': config['auth']['auth_key']
+    }
+
 def call_soracom_api(path, method='GET', body=None, additional_headers=None):
     """
     SORACOMのAPIを呼び出す関数
@@ -67,52 +155,139 @@ def call_soracom_api(path, method='GET', body=None, additional_headers=None):
     Returns:
         dict: レスポンス
     """
-    url = f"{config['endpoint']}{path}"
+    response = call_soracom_api_raw(path, method, body, additional_headers)
     
-    headers = {
-        'Content-Type': 'application/json'
-    }
+    # レスポンスが空の場合は空の辞書を返す
+    if response.status == 204 or len(response.data) == 0:
+        return {}
     
-    # 認証トークンがあれば使用する
-    if config['auth']['api_key'] and config['auth']['token']:
-        headers['X-Soracom-API-Key'] = config['auth']['api_key']
-        headers['X-Soracom-Token'] = config['auth']['token']
-    else:
-        # 認証トークンがなければAPIキーとシークレットを使用する
-        headers['X-Soracom-API-Key'] = config['auth']['auth_key_id']
-        headers['X-Soracom-Token'] = config['auth']['auth_key']
-    
-    if additional_headers:
-        headers.update(additional_headers)
+    return json.loads(response.data.decode('utf-8'))
+
+def call_soracom_api_raw(path, method='GET', body=None, additional_headers=None, preload_content=True):
+    """
+    SORACOMのAPIを呼び出し、レスポンスヘッダーを含むレスポンスをそのまま返す関数
     
+    Args:
+        path (str): APIのパス
+        method (str): HTTPメソッド
+        body (dict): リクエストボディ
+        additional_headers (dict): 追加のヘッダー
+        preload_content (bool): Falseの場合はレスポンス本文を読み込まずに返す
+        
+    Returns:
+        urllib3.BaseHTTPResponse: レスポンス
+    """
     try:
-        if body:
-            encoded_body = json.dumps(body).encode('utf-8')
+        try:
+            return _send_soracom_api_request(path, method, body, additional_headers, preload_content)
+        except SoracomApiError as e:
+            # 認証トークンが失効していた場合は再認証して1回だけ再試行する
+            token = config['auth']['token']
+            if e.status != 401 or not token:
+                raise
+            print('認証トークンが無効になったため再認証します')
+            auth_with_api_key(invalid_token=token)
+            return _send_soracom_api_request(path, method, body, additional_headers, preload_content)
+    except Exception as e:
+        print(f"API呼び出しエラー: {str(e)}")
+        raise
+
+def _send_soracom_api_request(path, method='GET', body=None, additional_headers=None,
+                              preload_content=True, authenticate=True):
+    """
+    SORACOMのAPIにリクエストを送信する
+    レート制限に従って送信し、429・5xx・接続エラーの場合はバックオフして再試行する
+    
+    Args:
+        path (str): APIのパス
+        method (str): HTTPメソッド
+        body (dict): リクエストボディ
+        additional_headers (dict): 追加のヘッダー
+        preload_content (bool): Falseの場合はレスポンス本文を読み込まずに返す
+        authenticate (bool): 認証ヘッダーを付与する
+        
+    Returns:
+        urllib3.BaseHTTPResponse: レスポンス
+    """
+    url = f"{config['endpoint']}{path}"
+    family = endpoint_family(method, path)
+    encoded_body = json.dumps(body).encode('utf-8') if body else None
+    attempt = 0
+    
+    while True:
+        rate_limiter.acquire(family)
+        
+        headers = {
+            'Content-Type': 'application/json'
+        }
+        # 再試行中に認証トークンが更新されることがあるため毎回作成する
+        if authenticate:
+            headers.update(build_auth_headers())
+        
+        if additional_headers:
+            headers.update(additional_headers)
+        
+        try:
             response = http.request(
                 method,
                 url,
                 body=encoded_body,
-                headers=headers
-            )
-        else:
-            response = http.request(
-                method,
-                url,
-                headers=headers
+                headers=headers,
+                retries=False,
+                preload_content=preload_content
             )
+        except urllib3.exceptions.HTTPError as e:
+            # POSTは送信されていないことが明らかな接続エラーのみ再試行する
+            retryable = method.upper() != 'POST' or isinstance(
+                e, (urllib3.exceptions.NewConnectionError, urllib3.exceptions.ConnectTimeoutError))
+            if not retryable or attempt >= retry_policy.max_retries:
+                raise
+            delay = retry_policy.delay(attempt)
+            rate_limiter.record_retry(family)
+            print(f"接続エラーのため{delay:.1f}秒後に再試行します（{attempt + 1}回目）: {str(e)}")
+            time.sleep(delay)
+            attempt += 1
+            continue
+        
+        if response.status >= 400 and retry_policy.should_retry_status(method, response.status, attempt):
+            throttled = response.status == 429
+            retry_after = parse_retry_after(response.headers.get('Retry-After'))
+            delay = retry_policy.delay(attempt, retry_after)
+            # 429の場合は同じファミリーの他のリクエストも待機させる
+            rate_limiter.record_retry(family, throttled=throttled, retry_after=delay if throttled else None)
+            print(f"APIが{response.status}を返したため{delay:.1f}秒後に再試行します（{attempt + 1}回目）")
+            response.drain_conn()
+            response.release_conn()
+            time.sleep(delay)
+            attempt += 1
+            continue
         
         if response.status >= 400:
             error_text = response.data.decode('utf-8')
-            raise Exception(f"API呼び出しエラー: {response.status} - {error_text}")
-        
-        # レスポンスが空の場合は空の辞書を返す
-        if response.status == 204 or len(response.data) == 0:
-            return {}
+            response.release_conn()
+            raise SoracomApiError(f"API呼び出しエラー: {response.status} - {error_text}", response.status)
         
-        return json.loads(response.data.decode('utf-8'))
-    except Exception as e:
-        print(f"API呼び出しエラー: {str(e)}")
-        raise
+        return response
+
+def set_rate_limit(family, rate, burst=None):
+    """
+    APIのレート制限を変更する
+    
+    Args:
+        family (str): エンドポイントのファミリー名（'default', 'sora_cam', 'sora_cam.export_requests' など）
+        rate (float): 1秒あたりのリクエスト数
+        burst (int, optional): バースト数
+    """
+    rate_limiter.configure(family, rate, burst)
+
+def get_api_stats():
+    """
+    API呼び出しの統計情報を取得する
+    
+    Returns:
+        dict: リクエスト数、再試行数、429の回数、レート制限による待機回数と待機時間
+    """
+    return rate_limiter.stats()
 
 # ===== SIM関連のAPI =====
 
@@ -138,6 +313,62 @@ def get_subscribers(limit=None, last_evaluated_key=None):
     
     return call_soracom_api(path)
 
+def get_subscribers_page(limit=None, last_evaluated_key=None):
+    """
+    SIMの一覧を1ページ分取得し、次のページのキーも返す
+    
+    Args:
+        limit (int): 取得する最大件数
+        last_evaluated_key (str): 前回の取得結果の最後のキー
+        
+    Returns:
+        tuple: (SIMの一覧, 次のページのキー。最後のページの場合はNone)
+    """
+    query_params = {}
+    if limit:
+        query_params['limit'] = limit
+    if last_evaluated_key:
+        query_params['last_evaluated_key'] = last_evaluated_key
+    
+    query = f"?{urlencode(query_params)}" if query_params else ""
+    response = call_soracom_api_raw(f"/subscribers{query}")
+    
+    subscribers = json.loads(response.data.decode('utf-8')) if response.data else []
+    # 続きのページがある場合は x-soracom-next-key ヘッダーにキーが入っている
+    next_key = response.headers.get('x-soracom-next-key')
+    return subscribers, next_key or None
+
+def iter_subscribers(limit=None, prefetch=False):
+    """
+    全てのSIMを1件ずつ返すジェネレーター
+    ページのキーを自動でたどるため、メモリ上には常に1ページ分（先読み時は2ページ分）しか保持しない
+    
+    Args:
+        limit (int): 1ページあたりの取得件数
+        prefetch (bool): 現在のページを処理している間に次のページを取得する
+        
+    Yields:
+        dict: SIMの情報
+    """
+    if not prefetch:
+        last_evaluated_key = None
+        while True:
+            subscribers, last_evaluated_key = get_subscribers_page(limit, last_evaluated_key)
+            yield from subscribers
+            if not last_evaluated_key:
+                return
+    
+    executor = ThreadPoolExecutor(max_workers=1)
+    try:
+        future = executor.submit(get_subscribers_page, limit, None)
+        while future:
+            subscribers, next_key = future.result()
+            # 呼び出し元が現在のページを処理している間に次のページを取得する
+            future = executor.submit(get_subscribers_page, limit, next_key) if next_key else None
+            yield from subscribers
+    finally:
+        executor.shutdown(wait=False, cancel_futures=True)
+
 # この関数は存在しないAPIを呼び出しているため削除
 # def get_subscriber_status(imsi):
 #     """
@@ -198,20 +429,18 @@ def get_camera_live_stream_url(device_id):
     """
     return call_soracom_api(f"/sora_cam/devices/{device_id}/stream")
 
-def request_video_export(device_id, start, end):
+def build_video_export_body(start, end):
     """
-    ソラカメの動画エクスポートをリクエストする
+    動画エクスポートAPIのリクエストボディを作成する
     
     Args:
-        device_id (str): デバイスID
         start (str): 開始時刻（ISO 8601形式）
         end (str): 終了時刻（ISO 8601形式）
         
     Returns:
-        dict: エクスポートジョブ情報
+        dict: リクエストボディ
     """
     # ISO 8601形式の時刻をUNIXタイムスタンプ（ミリ秒）に変換
-    from datetime import datetime
     start_dt = datetime.fromisoformat(start.replace('Z', '+00:00'))
     end_dt = datetime.fromisoformat(end.replace('Z', '+00:00'))
     
@@ -219,21 +448,53 @@ def request_video_export(device_id, start, end):
     time_diff = (end_dt - start_dt).total_seconds()
     
     # 時間差が900秒（15分）を超える場合はエラー
-    if time_diff > 900:
-        raise Exception(f"エクスポート時間が長すぎます: {time_diff}秒（最大900秒）")
+    if time_diff > MAX_VIDEO_EXPORT_SECONDS:
+        raise Exception(f"エクスポート時間が長すぎます: {time_diff}秒（最大{MAX_VIDEO_EXPORT_SECONDS}秒）")
     
     # 未来の時刻を指定している場合は警告
-    now = datetime.now()
+    now = datetime.now(start_dt.tzinfo)
     if start_dt > now or end_dt > now:
         print("警告: 未来の時刻が指定されています。過去の録画映像のみエクスポートできます。")
     
     start_ms = int(start_dt.timestamp() * 1000)
     end_ms = int(end_dt.timestamp() * 1000)
     
-    body = {
+    return {
         "from": start_ms,
         "to": end_ms
     }
+
+def build_image_export_body(timestamp):
+    """
+    静止画エクスポートAPIのリクエストボディを作成する
+    
+    Args:
+        timestamp (str): 時刻（ISO 8601形式）
+        
+    Returns:
+        dict: リクエストボディ
+    """
+    # ISO 8601形式の時刻をUNIXタイムスタンプ（ミリ秒）に変換
+    timestamp_dt = datetime.fromisoformat(timestamp.replace('Z', '+00:00'))
+    timestamp_ms = int(timestamp_dt.timestamp() * 1000)
+    
+    return {
+        "time": timestamp_ms
+    }
+
+def request_video_export(device_id, start, end):
+    """
+    ソラカメの動画エクスポートをリクエストする
+    
+    Args:
+        device_id (str): デバイスID
+        start (str): 開始時刻（ISO 8601形式）
+        end (str): 終了時刻（ISO 8601形式）
+        
+    Returns:
+        dict: エクスポートジョブ情報
+    """
+    body = build_video_export_body(start, end)
     return call_soracom_api(f"/sora_cam/devices/{device_id}/videos/exports", "POST", body)
 
 def get_video_export_status(device_id, export_id=None):
@@ -254,97 +515,247 @@ def get_video_export_status(device_id, export_id=None):
         # デバイスの全てのエクスポートジョブを取得
         return call_soracom_api(f"/sora_cam/devices/{device_id}/videos/exports")
 
-def download_video_export(device_id, export_id, output_path):
+def is_zip_url(download_url):
     """
-    ソラカメの動画エクスポートをダウンロードする
+    ダウンロードURLがZIPファイルを指しているかを判定する
+    
+    Args:
+        download_url (str): ダウンロードURL
+        
+    Returns:
+        bool: ZIPファイルの場合はTrue
+    """
+    return download_url.lower().endswith('.zip') or '.zip?' in download_url.lower()
+
+def extract_video_from_zip(zip_path, output_path):
+    """
+    ZIPファイルから動画ファイルを取り出す
+    
+    Args:
+        zip_path (str or file): ZIPファイルのパス、またはシーク可能なファイルオブジェクト
+        output_path (str): 出力ファイルパス
+    """
+    # ZIPファイルを解凍
+    print(f"ZIPファイルを解凍中...")
+    with zipfile.ZipFile(zip_path, 'r') as zip_ref:
+        # ZIPファイル内のファイル一覧を取得
+        file_list = zip_ref.namelist()
+        
+        if not file_list:
+            raise Exception("ZIPファイルが空です")
+        
+        # 動画ファイルを探す（.mp4, .avi, .movなど）
+        video_files = [f for f in file_list if f.lower().endswith(VIDEO_EXTENSIONS)]
+        
+        if video_files:
+            # 最初の動画ファイルを出力パスに解凍
+            video_file = video_files[0]
+            print(f"動画ファイルを解凍: {video_file}")
+        else:
+            # 動画ファイルが見つからない場合は最初のファイルを使用
+            video_file = file_list[0]
+            print(f"動画ファイルが見つからないため、最初のファイルを使用: {video_file}")
+        
+        with zip_ref.open(video_file) as source, open(output_path, 'wb') as target:
+            shutil.copyfileobj(source, target)
+
+def get_export_status(kind, device_id, export_id=None):
+    """
+    エクスポートジョブのステータスを取得する
     
     Args:
+        kind (str): エクスポートの種類（'video' または 'image'）
+        device_id (str): デバイスID
+        export_id (str, optional): エクスポートジョブID。指定しない場合は全てのジョブを取得
+        
+    Returns:
+        dict or list: エクスポートジョブのステータス
+    """
+    if kind == 'video':
+        return get_video_export_status(device_id, export_id)
+    elif kind == 'image':
+        return get_image_export_status(device_id, export_id)
+    raise ValueError(f"不明なエクスポートの種類です: {kind}")
+
+def remember_completed_export(kind, device_id, export_info):
+    """
+    完了したエクスポートジョブをインデックスに登録する
+    
+    Args:
+        kind (str): エクスポートの種類（'video' または 'image'）
+        device_id (str): デバイスID
+        export_info (dict): エクスポートジョブ情報
+    """
+    if export_info.get('status') != 'completed' or not export_info.get('url'):
+        return
+    
+    key = (kind, device_id, export_info.get('exportId'))
+    with _completed_exports_lock:
+        _completed_exports[key] = (time.time(), export_info)
+        _completed_exports.move_to_end(key)
+        while len(_completed_exports) > COMPLETED_EXPORT_INDEX_SIZE:
+            _completed_exports.popitem(last=False)
+
+def lookup_completed_export(kind, device_id, export_id):
+    """
+    インデックスから完了済みのエクスポートジョブを探す
+    
+    Args:
+        kind (str): エクスポートの種類（'video' または 'image'）
         device_id (str): デバイスID
         export_id (str): エクスポートジョブID
-        output_path (str): 出力ファイルパス
+        
+    Returns:
+        dict: エクスポートジョブ情報。見つからないか期限切れの場合はNone
+    """
+    key = (kind, device_id, export_id)
+    with _completed_exports_lock:
+        entry = _completed_exports.get(key)
+        if not entry:
+            return None
+        registered_at, export_info = entry
+        if time.time() - registered_at > COMPLETED_EXPORT_TTL:
+            del _completed_exports[key]
+            return None
+        return export_info
+
+def get_completed_export(kind, device_id, export_id):
     """
-    # デバイスの全てのエクスポートジョブを取得
-    exports = get_video_export_status(device_id)
+    完了済みのエクスポートジョブ情報を取得する
+    インデックスになければジョブ単体のステータスを取得する
     
-    # 指定したエクスポートジョブを探す
-    export_info = None
-    for export in exports:
-        if export.get('exportId') == export_id:
-            export_info = export
-            break
+    Args:
+        kind (str): エクスポートの種類（'video' または 'image'）
+        device_id (str): デバイスID
+        export_id (str): エクスポートジョブID
+        
+    Returns:
+        dict: エクスポートジョブ情報
+    """
+    export_info = lookup_completed_export(kind, device_id, export_id)
+    if export_info:
+        return export_info
     
+    export_info = get_export_status(kind, device_id, export_id)
     if not export_info:
         raise Exception(f"エクスポートジョブが見つかりません: {export_id}")
     
+    remember_completed_export(kind, device_id, export_info)
+    return export_info
+
+def get_export_download_url(export_info, export_id):
+    """
+    完了済みのエクスポートジョブ情報からダウンロードURLを取り出す
+    
+    Args:
+        export_info (dict): エクスポートジョブ情報
+        export_id (str): エクスポートジョブID
+        
+    Returns:
+        str: ダウンロードURL
+    """
     if export_info.get('status') != 'completed':
         raise Exception(f"エクスポートジョブがまだ完了していません: {export_info.get('status')}")
     
     download_url = export_info.get('url')
     if not download_url:
-        raise Exception("ダウンロードURLが見つかりません")
+        raise Exception(f"ダウンロードURLが見つかりません: {export_id}")
     
-    print(f"動画をダウンロード中: {download_url}")
+    return download_url
+
+def _wait_for_export(kind, device_id, export_id, timeout, interval):
+    """
+    エクスポートジョブの完了を待ち、完了したジョブをインデックスに登録する
     
-    # URLがZIPファイルかどうかを確認
-    is_zip = download_url.lower().endswith('.zip') or '.zip?' in download_url.lower()
+    Args:
+        kind (str): エクスポートの種類（'video' または 'image'）
+        device_id (str): デバイスID
+        export_id (str): エクスポートジョブID
+        timeout (int): タイムアウト（秒）
+        interval (int): ステータス確認間隔（秒）
+        
+    Returns:
+        dict: エクスポートジョブ情報
+    """
+    start_time = time.time()
+    while True:
+        # 指定したエクスポートジョブのステータスだけを取得
+        export_info = get_export_status(kind, device_id, export_id)
+        
+        if not export_info:
+            raise Exception(f"エクスポートジョブが見つかりません: {export_id}")
+        
+        status = export_info.get('status')
+        
+        if status == 'completed':
+            print(f"エクスポートジョブが完了しました: {export_id}")
+            remember_completed_export(kind, device_id, export_info)
+            return export_info
+        elif status in ['failed', 'canceled']:
+            raise Exception(f"エクスポートジョブが失敗しました: {status}")
+        
+        elapsed = time.time() - start_time
+        if elapsed > timeout:
+            raise Exception(f"エクスポートジョブがタイムアウトしました: {elapsed}秒経過")
+        
+        print(f"エクスポートジョブの状態: {status}, {int(elapsed)}秒経過")
+        time.sleep(interval)
+
+def _download_zip_via_spool(download_url, output_path):
+    """
+    ZIPファイルを一時ファイルにダウンロードしてから動画ファイルを取り出す
     
-    if is_zip:
-        # 一時ファイルを作成してZIPをダウンロード
-        with tempfile.NamedTemporaryFile(suffix='.zip', delete=False) as temp_file:
-            temp_path = temp_file.name
-            
-            response = http.request('GET', download_url, preload_content=False)
-            if response.status >= 400:
-                raise Exception(f"ダウンロードエラー: {response.status}")
-            
-            # 一時ファイルにZIPを保存
-            shutil.copyfileobj(response, temp_file)
-            response.release_conn()
-            
-        try:
-            # ZIPファイルを解凍
-            print(f"ZIPファイルを解凍中...")
-            with zipfile.ZipFile(temp_path, 'r') as zip_ref:
-                # ZIPファイル内のファイル一覧を取得
-                file_list = zip_ref.namelist()
-                
-                if not file_list:
-                    raise Exception("ZIPファイルが空です")
-                
-                # 動画ファイルを探す（.mp4, .avi, .movなど）
-                video_extensions = ['.mp4', '.avi', '.mov', '.mkv', '.wmv']
-                video_files = [f for f in file_list if any(f.lower().endswith(ext) for ext in video_extensions)]
-                
-                if video_files:
-                    # 最初の動画ファイルを出力パスに解凍
-                    video_file = video_files[0]
-                    print(f"動画ファイルを解凍: {video_file}")
-                    
-                    with zip_ref.open(video_file) as source, open(output_path, 'wb') as target:
-                        shutil.copyfileobj(source, target)
-                else:
-                    # 動画ファイルが見つからない場合は最初のファイルを使用
-                    first_file = file_list[0]
-                    print(f"動画ファイルが見つからないため、最初のファイルを使用: {first_file}")
-                    
-                    with zip_ref.open(first_file) as source, open(output_path, 'wb') as target:
-                        shutil.copyfileobj(source, target)
-            
-            print(f"動画を保存しました: {output_path}")
-        finally:
-            # 一時ファイルを削除
-            if os.path.exists(temp_path):
-                os.unlink(temp_path)
-    else:
-        # 通常のファイルとしてダウンロード
+    Args:
+        download_url (str): ダウンロードURL
+        output_path (str): 出力ファイルパス
+    """
+    with tempfile.TemporaryFile(suffix='.zip') as temp_file:
         response = http.request('GET', download_url, preload_content=False)
         if response.status >= 400:
             raise Exception(f"ダウンロードエラー: {response.status}")
         
-        with open(output_path, 'wb') as out_file:
-            shutil.copyfileobj(response, out_file)
-        
+        # 一時ファイルにZIPを保存
+        shutil.copyfileobj(response, temp_file)
         response.release_conn()
+        
+        temp_file.seek(0)
+        extract_video_from_zip(temp_file, output_path)
+
+def download_video_export(device_id, export_id, output_path):
+    """
+    ソラカメの動画エクスポートをダウンロードする
+    
+    Args:
+        device_id (str): デバイスID
+        export_id (str): エクスポートジョブID
+        output_path (str): 出力ファイルパス
+    """
+    export_info = get_completed_export('video', device_id, export_id)
+    download_url = get_export_download_url(export_info, export_id)
+    
+    print(f"動画をダウンロード中: {download_url}")
+    
+    # URLがZIPファイルかどうかを確認
+    if is_zip_url(download_url):
+        # 接続が切れた場合は続きからダウンロードし直すストリーム
+        stream = ResumableStream(http, download_url)
+        
+        try:
+            # ダウンロードしながらZIPを解凍する
+            print(f"ZIPファイルをダウンロードしながら解凍中...")
+            extract_first_video(stream, output_path, VIDEO_EXTENSIONS)
+        except ZipStreamUnsupported as e:
+            # セントラルディレクトリが必要な形式の場合は一時ファイルに保存してから解凍する
+            print(f"ストリームのままでは解凍できないため、一時ファイル経由で解凍します: {str(e)}")
+            stream.close()
+            _download_zip_via_spool(download_url, output_path)
+        finally:
+            stream.close()
+        
+        print(f"動画を保存しました: {output_path}")
+    else:
+        # 通常のファイルとして分割・再開可能なダウンロード
+        download_file(http, download_url, output_path)
         print(f"動画を保存しました: {output_path}")
 
 def request_image_export(device_id, timestamp):
@@ -358,14 +769,7 @@ def request_image_export(device_id, timestamp):
     Returns:
         dict: エクスポートジョブ情報
     """
-    # ISO 8601形式の時刻をUNIXタイムスタンプ（ミリ秒）に変換
-    from datetime import datetime
-    timestamp_dt = datetime.fromisoformat(timestamp.replace('Z', '+00:00'))
-    timestamp_ms = int(timestamp_dt.timestamp() * 1000)
-    
-    body = {
-        "time": timestamp_ms
-    }
+    body = build_image_export_body(timestamp)
     return call_soracom_api(f"/sora_cam/devices/{device_id}/images/exports", "POST", body)
 
 def get_image_export_status(device_id, export_id=None):
@@ -395,36 +799,12 @@ def download_image_export(device_id, export_id, output_path):
         export_id (str): エクスポートジョブID
         output_path (str): 出力ファイルパス
     """
-    # デバイスの全てのエクスポートジョブを取得
-    exports = get_image_export_status(device_id)
-    
-    # 指定したエクスポートジョブを探す
-    export_info = None
-    for export in exports:
-        if export.get('exportId') == export_id:
-            export_info = export
-            break
-    
-    if not export_info:
-        raise Exception(f"エクスポートジョブが見つかりません: {export_id}")
-    
-    if export_info.get('status') != 'completed':
-        raise Exception(f"エクスポートジョブがまだ完了していません: {export_info.get('status')}")
-    
-    download_url = export_info.get('url')
-    if not download_url:
-        raise Exception("ダウンロードURLが見つかりません")
+    export_info = get_completed_export('image', device_id, export_id)
+    download_url = get_export_download_url(export_info, export_id)
     
     print(f"静止画をダウンロード中: {download_url}")
     
-    response = http.request('GET', download_url, preload_content=False)
-    if response.status >= 400:
-        raise Exception(f"ダウンロードエラー: {response.status}")
-    
-    with open(output_path, 'wb') as out_file:
-        shutil.copyfileobj(response, out_file)
-    
-    response.release_conn()
+    download_file(http, download_url, output_path)
     print(f"静止画を保存しました: {output_path}")
 
 def wait_for_image_export_completion(device_id, export_id, timeout=600, interval=5):
@@ -440,35 +820,7 @@ def wait_for_image_export_completion(device_id, export_id, timeout=600, interval
     Returns:
         dict: エクスポートジョブ情報
     """
-    start_time = time.time()
-    while True:
-        # デバイスの全てのエクスポートジョブを取得
-        exports = get_image_export_status(device_id)
-        
-        # 指定したエクスポートジョブを探す
-        export_info = None
-        for export in exports:
-            if export.get('exportId') == export_id:
-                export_info = export
-                break
-        
-        if not export_info:
-            raise Exception(f"エクスポートジョブが見つかりません: {export_id}")
-        
-        status = export_info.get('status')
-        
-        if status == 'completed':
-            print(f"エクスポートジョブが完了しました: {export_id}")
-            return export_info
-        elif status in ['failed', 'canceled']:
-            raise Exception(f"エクスポートジョブが失敗しました: {status}")
-        
-        elapsed = time.time() - start_time
-        if elapsed > timeout:
-            raise Exception(f"エクスポートジョブがタイムアウトしました: {elapsed}秒経過")
-        
-        print(f"エクスポートジョブの状態: {status}, {int(elapsed)}秒経過")
-        time.sleep(interval)
+    return _wait_for_export('image', device_id, export_id, timeout, interval)
 
 def get_image_snapshot(device_id, timestamp, output_path):
     """
@@ -480,31 +832,66 @@ def get_image_snapshot(device_id, timestamp, output_path):
         output_path (str): 出力ファイルパス
     """
     query = f"?timestamp={timestamp}" if timestamp else ""
-    url = f"{config['endpoint']}/sora_cam/devices/{device_id}/snapshots{query}"
+    path = f"/sora_cam/devices/{device_id}/snapshots{query}"
     
-    headers = {}
+    print(f"静止画を取得中: {config['endpoint']}{path}")
     
-    # 認証トークンがあれば使用する
-    if config['auth']['api_key'] and config['auth']['token']:
-        headers['X-Soracom-API-Key'] = config['auth']['api_key']
-        headers['X-Soracom-Token'] = config['auth']['token']
-    else:
-        # 認証トークンがなければAPIキーとシークレットを使用する
-        headers['X-Soracom-API-Key'] = config['auth']['auth_key_id']
-        headers['X-Soracom-Token'] = config['auth']['auth_key']
+    # 静止画はリクエストごとに生成されるため分割ダウンロードはせず、
+    # 途中で切れた場合は取得し直す
+    partial_path = f"{output_path}.part"
+    attempt = 0
+    while True:
+        response = call_soracom_api_raw(path, preload_content=False)
+        try:
+            with open(partial_path, 'wb') as out_file:
+                shutil.copyfileobj(response, out_file)
+            break
+        except (urllib3.exceptions.ProtocolError, urllib3.exceptions.ReadTimeoutError) as e:
+            if attempt >= retry_policy.max_retries:
+                raise
+            delay = retry_policy.delay(attempt)
+            print(f"静止画の取得が中断したため{delay:.1f}秒後に再試行します: {str(e)}")
+            time.sleep(delay)
+            attempt += 1
+        finally:
+            response.release_conn()
     
-    print(f"静止画を取得中: {url}")
+    os.replace(partial_path, output_path)
+    print(f"静止画を保存しました: {output_path}")
+
+def fetch_image_snapshot(device_id, timestamp=None):
+    """
+    ソラカメの静止画をファイルに保存せずに取得する
     
-    response = http.request('GET', url, headers=headers, preload_content=False)
-    if response.status >= 400:
-        error_text = response.data.decode('utf-8')
-        raise Exception(f"静止画取得エラー: {response.status} - {error_text}")
+    Args:
+        device_id (str): デバイスID
+        timestamp (str, optional): 時刻（ISO 8601形式）。指定しない場合は最新の静止画
+    
+    Returns:
+        bytes: 静止画（JPEG）のデータ
+    """
+    query = f"?timestamp={timestamp}" if timestamp else ""
+    response = call_soracom_api_raw(f"/sora_cam/devices/{device_id}/snapshots{query}")
+    return response.data
+
+def fetch_image_export(device_id, export_id):
+    """
+    ソラカメの静止画エクスポートをファイルに保存せずに取得する
     
-    with open(output_path, 'wb') as out_file:
-        shutil.copyfileobj(response, out_file)
+    Args:
+        device_id (str): デバイスID
+        export_id (str): エクスポートジョブID
     
-    response.release_conn()
-    print(f"静止画を保存しました: {output_path}")
+    Returns:
+        bytes: 静止画（JPEG）のデータ
+    """
+    export_info = get_completed_export('image', device_id, export_id)
+    download_url = get_export_download_url(export_info, export_id)
+    
+    response = http.request('GET', download_url)
+    if response.status >= 400:
+        raise Exception(f"ダウンロードエラー: {response.status}")
+    return response.data
 
 def wait_for_export_completion(device_id, export_id, timeout=600, interval=5):
     """
@@ -519,39 +906,77 @@ def wait_for_export_completion(device_id, export_id, timeout=600, interval=5):
     Returns:
         dict: エクスポートジョブ情報
     """
-    start_time = time.time()
-    while True:
-        # デバイスの全てのエクスポートジョブを取得
-        exports = get_video_export_status(device_id)
-        
-        # 指定したエクスポートジョブを探す
-        export_info = None
-        for export in exports:
-            if export.get('exportId') == export_id:
-                export_info = export
-                break
-        
-        if not export_info:
-            raise Exception(f"エクスポートジョブが見つかりません: {export_id}")
-        
-        status = export_info.get('status')
-        
-        if status == 'completed':
-            print(f"エクスポートジョブが完了しました: {export_id}")
-            return export_info
-        elif status in ['failed', 'canceled']:
-            raise Exception(f"エクスポートジョブが失敗しました: {status}")
+    return _wait_for_export('video', device_id, export_id, timeout, interval)
+
+def auth_with_api_key(force=False, invalid_token=None):
+    """
+    APIキーとシークレットを使用して認証する
+    キャッシュに有効な認証トークンがあれば、認証APIを呼び出さずにそれを使用する
+    
+    Args:
+        force (bool): キャッシュを使用せずに必ず認証APIを呼び出す
+        invalid_token (str, optional): 失効したことが分かっている認証トークン。キャッシュにこのトークンしかなければ再認証する
         
-        elapsed = time.time() - start_time
-        if elapsed > timeout:
-            raise Exception(f"エクスポートジョブがタイムアウトしました: {elapsed}秒経過")
+    Returns:
+        dict: 認証レスポンス
+    """
+    with _auth_lock:
+        # 設定で無効にされている場合はキャッシュを使用しない
+        if not config['token_cache']:
+            return _request_auth_token()
         
-        print(f"エクスポートジョブの状態: {status}, {int(elapsed)}秒経過")
-        time.sleep(interval)
+        cache = TokenCache()
+        key = TokenCache.make_key(config['auth']['auth_key_id'], config['auth']['scope'], config['endpoint'])
+        try:
+            with cache.lock():
+                if not force:
+                    entry = cache.get(key)
+                    if entry and entry.get('token') != invalid_token and \
+                            entry.get('expiresAt', 0) - time.time() > TOKEN_REFRESH_MARGIN:
+                        _apply_auth_token(entry)
+                        return entry['response']
+                
+                auth_response = _request_auth_token()
+                _store_auth_token(cache, key, auth_response)
+                return auth_response
+        except OSError as e:
+            # ロックファイルを作成できない環境ではキャッシュを使わずに認証する
+            print(f"認証トークンのキャッシュを使用できません: {str(e)}")
+            return _request_auth_token()
 
-def auth_with_api_key():
+def _apply_auth_token(entry):
     """
-    APIキーとシークレットを使用して認証する
+    キャッシュした認証トークンを設定に反映する
+    
+    Args:
+        entry (dict): キャッシュしたトークン情報
+    """
+    config['auth']['api_key'] = entry.get('apiKey')
+    config['auth']['token'] = entry.get('token')
+    config['auth']['expires_at'] = entry.get('expiresAt')
+
+def _store_auth_token(cache, key, auth_response):
+    """
+    取得した認証トークンをキャッシュに保存する
+    
+    Args:
+        cache (TokenCache): トークンキャッシュ
+        key (str): キャッシュのキー
+        auth_response (dict): 認証レスポンス
+    """
+    try:
+        cache.put(key, {
+            'apiKey': config['auth']['api_key'],
+            'token': config['auth']['token'],
+            'expiresAt': config['auth']['expires_at'],
+            'response': auth_response
+        })
+    except OSError as e:
+        print(f"認証トークンをキャッシュに保存できませんでした: {str(e)}")
+
+def _request_auth_token():
+    """
+    認証APIを呼び出して認証トークンを取得する
     
     Returns:
         dict: 認証レスポンス
@@ -559,37 +984,25 @@ def auth_with_api_key():
     # 認証トークンをリセット
     config['auth']['api_key'] = None
     config['auth']['token'] = None
-    
-    url = f"{config['endpoint']}/auth"
-    
-    headers = {
-        'Content-Type': 'application/json'
-    }
+    config['auth']['expires_at'] = None
     
     body = {
         'authKeyId': config['auth']['auth_key_id'],
         'authKey': config['auth']['auth_key'],
-        'scope': 'SoraCam:* OAuth2:authorize'
+        'scope': config['auth']['scope'],
+        'tokenTimeoutSeconds': config['auth']['token_timeout']
     }
     
     try:
-        encoded_body = json.dumps(body).encode('utf-8')
-        response = http.request(
-            'POST',
-            url,
-            body=encoded_body,
-            headers=headers
-        )
-        
-        if response.status >= 400:
-            error_text = response.data.decode('utf-8')
-            raise Exception(f"認証エラー: {response.status} - {error_text}")
+        requested_at = time.time()
+        response = _send_soracom_api_request('/auth', 'POST', body, authenticate=False)
         
         auth_response = json.loads(response.data.decode('utf-8'))
         
         # 認証トークンを設定
         config['auth']['api_key'] = auth_response.get('apiKey')
         config['auth']['token'] = auth_response.get('token')
+        config['auth']['expires_at'] = requested_at + config['auth']['token_timeout']
         
         return auth_response
     except Exception as e:
@@ -598,6 +1011,10 @@ def auth_with_api_key():
 
 def main():
     """メイン関数"""
+    parser = argparse.ArgumentParser(description='SORACOM APIの動作確認（SIMとソラカメの一覧を取得）')
+    add_batch_argument(parser)
+    set_batch_mode(parser.parse_args().batch)
+    
     try:
         # 設定ファイルがあれば読み込む
         import os
@@ -608,14 +1025,18 @@ def main():
         auth_response = auth_with_api_key()
         print('認証成功:', auth_response)
         
-        input("Enterキーを押すと、SIMの一覧を取得します...")
+        pause("Enterキーを押すと、SIMの一覧を取得します...")
         print('SIMの一覧を取得中...')
-        subscribers = get_subscribers()
-        print(f"{len(subscribers)}件のSIMが見つかりました")
+        first_sim = None
+        subscriber_count = 0
+        for subscriber in iter_subscribers(prefetch=True):
+            if first_sim is None:
+                first_sim = subscriber
+            subscriber_count += 1
+        print(f"{subscriber_count}件のSIMが見つかりました")
         
-        if subscribers:
-            input("Enterキーを押すと、最初のSIMの詳細を取得します...")
-            first_sim = subscribers[0]
+        if first_sim:
+            pause("Enterキーを押すと、最初のSIMの詳細を取得します...")
             print(f"最初のSIM ({first_sim['imsi']}) の詳細を取得中...")
             try:
                 # SIM情報を取得
@@ -627,14 +1048,14 @@ def main():
                 print(f"SIM詳細の取得に失敗しました: {str(e)}")
                 print("これは特定のSIMに対するアクセス権限がない可能性があります。")
         
-        input("Enterキーを押すと、ソラカメの一覧を取得します...")
+        pause("Enterキーを押すと、ソラカメの一覧を取得します...")
         print('ソラカメの一覧を取得中...')
         try:
             cameras = get_cameras()
             print(f"{len(cameras)}件のソラカメが見つかりました")
             
             if cameras:
-                input("Enterキーを押すと、最初のソラカメの詳細を取得します...")
+                pause("Enterキーを押すと、最初のソラカメの詳細を取得します...")
                 first_camera = cameras[0]
                 print(f"最初のソラカメ ({first_camera['deviceId']}) の詳細を取得中...")
                 camera_info = get_camera(first_camera['deviceId'])
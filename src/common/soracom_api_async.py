@@ -0,0 +1,451 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+SORACOM APIを非同期（asyncio）で呼び出すためのクライアント
+多数のソラカメに対するAPI呼び出しを並行して実行するために使用します
+認証情報とエンドポイントは soracom_api.config を共有します
+"""
+
+import os
+import sys
+import json
+import time
+import asyncio
+import tempfile
+import certifi
+import httpx
+
+# 共通モジュールのパスを追加
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+from common.soracom_api import (
+    config,
+    load_config,
+    auth_with_api_key,
+    auth_token_expiring,
+    build_auth_headers,
+    SoracomApiError,
+    build_video_export_body,
+    build_image_export_body,
+    is_zip_url,
+    extract_video_from_zip,
+    remember_completed_export,
+    lookup_completed_export,
+    get_export_download_url,
+    rate_limiter,
+    retry_policy
+)
+from common.rate_limit import endpoint_family, parse_retry_after
+
+# 同時に実行するAPI呼び出しの既定の上限
+DEFAULT_MAX_CONCURRENCY = 20
+
+class AsyncSoracomClient:
+    """
+    SORACOM APIの非同期クライアント
+
+    1つのコネクションプールを共有し、同時実行数をセマフォで制限します。
+
+    使用例:
+        async with AsyncSoracomClient(max_concurrency=50) as client:
+            cameras = await client.get_cameras()
+            details = await asyncio.gather(
+                *(client.get_camera(c['deviceId']) for c in cameras)
+            )
+    """
+
+    def __init__(self, max_concurrency=DEFAULT_MAX_CONCURRENCY, timeout=30.0):
+        """
+        Args:
+            max_concurrency (int): 同時に実行するリクエストの最大数
+            timeout (float): リクエストのタイムアウト（秒）
+        """
+        self.max_concurrency = max_concurrency
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+        # 認証トークンの更新は1つのコルーチンだけが行う
+        self._auth_lock = asyncio.Lock()
+        self._client = httpx.AsyncClient(
+            verify=certifi.where(),
+            timeout=timeout,
+            limits=httpx.Limits(
+                max_connections=max_concurrency,
+                max_keepalive_connections=max_concurrency
+            )
+        )
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        await self.aclose()
+
+    async def aclose(self):
+        """コネクションプールを閉じる"""
+        await self._client.aclose()
+
+    async def call_api(self, path, method='GET', body=None, additional_headers=None):
+        """
+        SORACOMのAPIを呼び出す
+
+        Args:
+            path (str): APIのパス
+            method (str): HTTPメソッド
+            body (dict): リクエストボディ
+            additional_headers (dict): 追加のヘッダー
+
+        Returns:
+            dict: レスポンス
+        """
+        response = await self._send(path, method, body, additional_headers)
+
+        # 認証トークンが失効していた場合は再認証して1回だけ再試行する
+        token = config['auth']['token']
+        if response.status_code == 401 and token:
+            print('認証トークンが無効になったため再認証します')
+            await self._reauthenticate(token)
+            response = await self._send(path, method, body, additional_headers)
+
+        if response.status_code >= 400:
+            raise SoracomApiError(f"API呼び出しエラー: {response.status_code} - {response.text}", response.status_code)
+
+        # レスポンスが空の場合は空の辞書を返す
+        if response.status_code == 204 or len(response.content) == 0:
+            return {}
+
+        return response.json()
+
+    async def _auth_headers(self):
+        """
+        認証ヘッダーを作成する
+        有効期限が近い認証トークンは、イベントループを止めないようにスレッドで事前に更新します
+
+        Returns:
+            dict: X-Soracom-API-Key / X-Soracom-Token ヘッダー
+        """
+        if auth_token_expiring():
+            async with self._auth_lock:
+                # 待っている間に他のコルーチンが更新した場合は何もしない
+                if auth_token_expiring():
+                    await asyncio.to_thread(auth_with_api_key, invalid_token=config['auth']['token'])
+        return build_auth_headers()
+
+    async def _reauthenticate(self, invalid_token):
+        """
+        失効した認証トークンを更新する
+
+        Args:
+            invalid_token (str): 失効した認証トークン（他のコルーチンが更新済みの場合は再認証しない）
+        """
+        async with self._auth_lock:
+            await asyncio.to_thread(auth_with_api_key, invalid_token=invalid_token)
+
+    async def _send(self, path, method, body, additional_headers):
+        """
+        SORACOMのAPIにリクエストを送信する
+        レート制限に従って送信し、429・5xx・接続エラーの場合はバックオフして再試行する
+
+        Returns:
+            httpx.Response: レスポンス
+        """
+        url = f"{config['endpoint']}{path}"
+        family = endpoint_family(method, path)
+        content = json.dumps(body).encode('utf-8') if body else None
+        attempt = 0
+
+        while True:
+            wait = rate_limiter.reserve(family)
+            if wait > 0:
+                await asyncio.sleep(wait)
+
+            headers = {
+                'Content-Type': 'application/json'
+            }
+            headers.update(await self._auth_headers())
+
+            if additional_headers:
+                headers.update(additional_headers)
+
+            try:
+                async with self._semaphore:
+                    response = await self._client.request(method, url, content=content, headers=headers)
+            except httpx.TransportError as e:
+                # POSTは送信されていないことが明らかな接続エラーのみ再試行する
+                retryable = method.upper() != 'POST' or isinstance(e, (httpx.ConnectError, httpx.ConnectTimeout))
+                if not retryable or attempt >= retry_policy.max_retries:
+                    raise
+                delay = retry_policy.delay(attempt)
+                rate_limiter.record_retry(family)
+                print(f"接続エラーのため{delay:.1f}秒後に再試行します（{attempt + 1}回目）: {str(e)}")
+                await asyncio.sleep(delay)
+                attempt += 1
+                continue
+
+            if response.status_code >= 400 and retry_policy.should_retry_status(method, response.status_code, attempt):
+                throttled = response.status_code == 429
+                retry_after = parse_retry_after(response.headers.get('Retry-After'))
+                delay = retry_policy.delay(attempt, retry_after)
+                rate_limiter.record_retry(family, throttled=throttled, retry_after=delay if throttled else None)
+                print(f"APIが{response.status_code}を返したため{delay:.1f}秒後に再試行します（{attempt + 1}回目）")
+                await asyncio.sleep(delay)
+                attempt += 1
+                continue
+
+            return response
+
+    async def _download(self, url, output_path, headers=None, family=None, auth=False):
+        """
+        URLの内容をファイルにストリーミングで保存する
+
+        Args:
+            url (str): ダウンロードURL
+            output_path (str): 出力ファイルパス
+            headers (dict): リクエストヘッダー
+            family (str, optional): SORACOM APIのファミリー名。指定した場合はレート制限と再試行を行う
+            auth (bool): Trueの場合はSORACOM APIの認証ヘッダーを付け、401の場合は再認証して1回だけ再試行する
+        """
+        attempt = 0
+        reauthenticated = False
+        while True:
+            if family:
+                wait = rate_limiter.reserve(family)
+                if wait > 0:
+                    await asyncio.sleep(wait)
+
+            request_headers = dict(headers or {})
+            if auth:
+                request_headers.update(await self._auth_headers())
+            unauthorized = False
+            async with self._semaphore:
+                async with self._client.stream('GET', url, headers=request_headers) as response:
+                    if response.status_code < 400:
+                        with open(output_path, 'wb') as out_file:
+                            async for chunk in response.aiter_bytes():
+                                out_file.write(chunk)
+                        return
+
+                    await response.aread()
+                    if auth and response.status_code == 401 and not reauthenticated and config['auth']['token']:
+                        unauthorized = True
+                    elif not family or not retry_policy.should_retry_status('GET', response.status_code, attempt):
+                        raise Exception(f"ダウンロードエラー: {response.status_code} - {response.text}")
+                    else:
+                        throttled = response.status_code == 429
+                        retry_after = parse_retry_after(response.headers.get('Retry-After'))
+
+            if unauthorized:
+                # 認証トークンが失効していた場合は再認証して1回だけ再試行する
+                print('認証トークンが無効になったため再認証します')
+                await self._reauthenticate(request_headers['X-Soracom-Token'])
+                reauthenticated = True
+                continue
+
+            delay = retry_policy.delay(attempt, retry_after)
+            rate_limiter.record_retry(family, throttled=throttled, retry_after=delay if throttled else None)
+            await asyncio.sleep(delay)
+            attempt += 1
+
+    async def _get_completed_export(self, kind, device_id, export_id):
+        """
+        完了済みのエクスポートジョブ情報を取得する
+        インデックスになければジョブ単体のステータスを取得する
+
+        Args:
+            kind (str): エクスポートの種類（'video' または 'image'）
+            device_id (str): デバイスID
+            export_id (str): エクスポートジョブID
+
+        Returns:
+            dict: エクスポートジョブ情報
+        """
+        export_info = lookup_completed_export(kind, device_id, export_id)
+        if export_info:
+            return export_info
+
+        if kind == 'video':
+            export_info = await self.get_video_export_status(device_id, export_id)
+        else:
+            export_info = await self.get_image_export_status(device_id, export_id)
+        if not export_info:
+            raise Exception(f"エクスポートジョブが見つかりません: {export_id}")
+
+        remember_completed_export(kind, device_id, export_info)
+        return export_info
+
+    # ===== ソラカメ関連のAPI =====
+
+    async def get_cameras(self):
+        """
+        ソラカメの一覧を取得する
+
+        Returns:
+            list: ソラカメの一覧
+        """
+        return await self.call_api("/sora_cam/devices")
+
+    async def get_camera(self, device_id):
+        """
+        ソラカメの詳細情報を取得する
+
+        Args:
+            device_id (str): デバイスID
+
+        Returns:
+            dict: ソラカメの詳細情報
+        """
+        return await self.call_api(f"/sora_cam/devices/{device_id}")
+
+    async def request_video_export(self, device_id, start, end):
+        """
+        ソラカメの動画エクスポートをリクエストする
+
+        Args:
+            device_id (str): デバイスID
+            start (str): 開始時刻（ISO 8601形式）
+            end (str): 終了時刻（ISO 8601形式）
+
+        Returns:
+            dict: エクスポートジョブ情報
+        """
+        body = build_video_export_body(start, end)
+        return await self.call_api(f"/sora_cam/devices/{device_id}/videos/exports", "POST", body)
+
+    async def get_video_export_status(self, device_id, export_id=None):
+        """
+        ソラカメの動画エクスポートジョブのステータスを取得する
+
+        Args:
+            device_id (str): デバイスID
+            export_id (str, optional): エクスポートジョブID。指定しない場合は全てのジョブを取得
+
+        Returns:
+            dict or list: エクスポートジョブのステータス
+        """
+        if export_id:
+            return await self.call_api(f"/sora_cam/devices/{device_id}/videos/exports/{export_id}")
+        return await self.call_api(f"/sora_cam/devices/{device_id}/videos/exports")
+
+    async def download_video_export(self, device_id, export_id, output_path):
+        """
+        ソラカメの動画エクスポートをダウンロードする
+
+        Args:
+            device_id (str): デバイスID
+            export_id (str): エクスポートジョブID
+            output_path (str): 出力ファイルパス
+        """
+        export_info = await self._get_completed_export('video', device_id, export_id)
+        download_url = get_export_download_url(export_info, export_id)
+
+        if is_zip_url(download_url):
+            # 一時ファイルにZIPをダウンロードしてから解凍する
+            with tempfile.NamedTemporaryFile(suffix='.zip', delete=False) as temp_file:
+                temp_path = temp_file.name
+            try:
+                await self._download(download_url, temp_path)
+                # 解凍処理はブロッキングのためスレッドで実行する
+                await asyncio.to_thread(extract_video_from_zip, temp_path, output_path)
+            finally:
+                if os.path.exists(temp_path):
+                    os.unlink(temp_path)
+        else:
+            await self._download(download_url, output_path)
+
+    async def request_image_export(self, device_id, timestamp):
+        """
+        ソラカメの静止画エクスポートをリクエストする
+
+        Args:
+            device_id (str): デバイスID
+            timestamp (str): 時刻（ISO 8601形式）
+
+        Returns:
+            dict: エクスポートジョブ情報
+        """
+        body = build_image_export_body(timestamp)
+        return await self.call_api(f"/sora_cam/devices/{device_id}/images/exports", "POST", body)
+
+    async def get_image_export_status(self, device_id, export_id=None):
+        """
+        ソラカメの静止画エクスポートジョブのステータスを取得する
+
+        Args:
+            device_id (str): デバイスID
+            export_id (str, optional): エクスポートジョブID。指定しない場合は全てのジョブを取得
+
+        Returns:
+            dict or list: エクスポートジョブのステータス
+        """
+        if export_id:
+            return await self.call_api(f"/sora_cam/devices/{device_id}/images/exports/{export_id}")
+        return await self.call_api(f"/sora_cam/devices/{device_id}/images/exports")
+
+    async def download_image_export(self, device_id, export_id, output_path):
+        """
+        ソラカメの静止画エクスポートをダウンロードする
+
+        Args:
+            device_id (str): デバイスID
+            export_id (str): エクスポートジョブID
+            output_path (str): 出力ファイルパス
+        """
+        export_info = await self._get_completed_export('image', device_id, export_id)
+        download_url = get_export_download_url(export_info, export_id)
+        await self._download(download_url, output_path)
+
+    async def get_image_snapshot(self, device_id, timestamp, output_path):
+        """
+        ソラカメの静止画を取得する
+
+        Args:
+            device_id (str): デバイスID
+            timestamp (str): 時刻（ISO 8601形式）
+            output_path (str): 出力ファイルパス
+        """
+        query = f"?timestamp={timestamp}" if timestamp else ""
+        url = f"{config['endpoint']}/sora_cam/devices/{device_id}/snapshots{query}"
+        await self._download(url, output_path, family='sora_cam.snapshots', auth=True)
+
+async def fetch_all_cameras(max_concurrency=DEFAULT_MAX_CONCURRENCY):
+    """
+    全てのソラカメの詳細情報を並行して取得する
+
+    Args:
+        max_concurrency (int): 同時に実行するリクエストの最大数
+
+    Returns:
+        list: (デバイスID, 詳細情報または例外) のリスト
+    """
+    async with AsyncSoracomClient(max_concurrency=max_concurrency) as client:
+        cameras = await client.get_cameras()
+        device_ids = [camera['deviceId'] for camera in cameras]
+        details = await asyncio.gather(
+            *(client.get_camera(device_id) for device_id in device_ids),
+            return_exceptions=True
+        )
+        return list(zip(device_ids, details))
+
+def main():
+    """メイン関数"""
+    try:
+        # 設定ファイルがあれば読み込む
+        config_path = os.path.join(os.path.dirname(__file__), '..', '..', 'soracom-config.json')
+        load_config(config_path)
+
+        print('APIキーとシークレットで認証中...')
+        auth_with_api_key()
+        print('認証成功')
+
+        print('全てのソラカメの詳細を並行して取得中...')
+        start_time = time.time()
+        results = asyncio.run(fetch_all_cameras())
+        elapsed = time.time() - start_time
+
+        failed = [device_id for device_id, detail in results if isinstance(detail, Exception)]
+        print(f"{len(results)}件のソラカメの詳細を取得しました（{elapsed:.2f}秒、失敗: {len(failed)}件）")
+        for device_id in failed:
+            print(f"- 取得に失敗: {device_id}")
+    except Exception as e:
+        print(f"エラーが発生しました: {str(e)}")
+
+if __name__ == "__main__":
+    main()
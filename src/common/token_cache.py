@@ -0,0 +1,140 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+SORACOM APIの認証トークンをプロセス間で共有するためのキャッシュ
+ユーザーのキャッシュディレクトリにロック付きのJSONファイルとして保存します
+"""
+
+import os
+import json
+import tempfile
+from contextlib import contextmanager
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+def default_cache_dir():
+    """
+    キャッシュディレクトリの既定値を返す
+
+    Returns:
+        str: キャッシュディレクトリのパス
+    """
+    if os.name == 'nt':
+        base = os.environ.get('LOCALAPPDATA') or os.path.expanduser('~')
+    else:
+        base = os.environ.get('XDG_CACHE_HOME') or os.path.join(os.path.expanduser('~'), '.cache')
+    return os.path.join(base, 'soracom-handson')
+
+class TokenCache:
+    """
+    認証トークンのファイルキャッシュ
+
+    トークンは認証キーID・スコープ・エンドポイントの組み合わせをキーとして保存します。
+    lock() でファイルロックを取得している間に読み書きすることで、
+    複数のプロセスが同時に再認証することを防ぎます。
+    """
+
+    def __init__(self, path=None):
+        """
+        Args:
+            path (str, optional): キャッシュファイルのパス。指定しない場合は既定のキャッシュディレクトリを使用
+        """
+        self.path = path or os.path.join(default_cache_dir(), 'tokens.json')
+        self._lock_path = f"{self.path}.lock"
+
+    @staticmethod
+    def make_key(auth_key_id, scope, endpoint):
+        """
+        キャッシュのキーを作成する
+
+        Args:
+            auth_key_id (str): 認証キーID
+            scope (str): トークンのスコープ
+            endpoint (str): APIエンドポイント
+
+        Returns:
+            str: キャッシュのキー
+        """
+        return f"{auth_key_id} {scope} {endpoint}"
+
+    @contextmanager
+    def lock(self):
+        """キャッシュファイルの排他ロックを取得する"""
+        os.makedirs(os.path.dirname(self.path), mode=0o700, exist_ok=True)
+        with open(self._lock_path, 'a+') as lock_file:
+            if fcntl:
+                fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX)
+            else:
+                lock_file.seek(0)
+                msvcrt.locking(lock_file.fileno(), msvcrt.LK_LOCK, 1)
+            try:
+                yield
+            finally:
+                if fcntl:
+                    fcntl.flock(lock_file.fileno(), fcntl.LOCK_UN)
+                else:
+                    lock_file.seek(0)
+                    msvcrt.locking(lock_file.fileno(), msvcrt.LK_UNLCK, 1)
+
+    def get(self, key):
+        """
+        キャッシュからトークン情報を取得する
+
+        Args:
+            key (str): キャッシュのキー
+
+        Returns:
+            dict: トークン情報。存在しない場合はNone
+        """
+        return self._load().get(key)
+
+    def put(self, key, entry):
+        """
+        トークン情報をキャッシュに保存する
+
+        Args:
+            key (str): キャッシュのキー
+            entry (dict): トークン情報
+        """
+        entries = self._load()
+        entries[key] = entry
+        self._save(entries)
+
+    def delete(self, key):
+        """
+        トークン情報をキャッシュから削除する
+
+        Args:
+            key (str): キャッシュのキー
+        """
+        entries = self._load()
+        if entries.pop(key, None) is not None:
+            self._save(entries)
+
+    def _load(self):
+        """キャッシュファイルを読み込む（壊れている場合は空として扱う）"""
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+            return data if isinstance(data, dict) else {}
+        except (OSError, ValueError):
+            return {}
+
+    def _save(self, entries):
+        """キャッシュファイルを書き込む（他のユーザーから読めないように保存する）"""
+        directory = os.path.dirname(self.path)
+        fd, temp_path = tempfile.mkstemp(dir=directory, prefix='.tokens-')
+        try:
+            with os.fdopen(fd, 'w', encoding='utf-8') as f:
+                json.dump(entries, f)
+            os.chmod(temp_path, 0o600)
+            os.replace(temp_path, self.path)
+        except Exception:
+            if os.path.exists(temp_path):
+                os.unlink(temp_path)
+            raise
@@ -0,0 +1,201 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+ダウンロード中のZIPファイルをストリームのまま解凍するための関数
+ZIPのローカルファイルヘッダーを先頭から順に読み、一時ファイルを経由せずに
+目的のファイルを取り出します
+"""
+
+import os
+import zlib
+import struct
+
+# ZIPのシグネチャ
+LOCAL_FILE_HEADER = b'PK\x03\x04'
+CENTRAL_DIRECTORY_HEADER = b'PK\x01\x02'
+END_OF_CENTRAL_DIRECTORY = b'PK\x05\x06'
+DATA_DESCRIPTOR = b'PK\x07\x08'
+
+# ローカルファイルヘッダーのシグネチャ以降の固定長部分
+_LOCAL_HEADER_FORMAT = '<HHHHHIIIHH'
+_LOCAL_HEADER_SIZE = struct.calcsize(_LOCAL_HEADER_FORMAT)
+
+# 汎用フラグ
+_FLAG_ENCRYPTED = 0x0001
+_FLAG_DATA_DESCRIPTOR = 0x0008
+_FLAG_UTF8 = 0x0800
+
+# 圧縮方式
+_STORED = 0
+_DEFLATED = 8
+
+_CHUNK_SIZE = 64 * 1024
+
+class ZipStreamUnsupported(Exception):
+    """ストリームのままでは解凍できないZIPファイル（セントラルディレクトリが必要）"""
+
+class _StreamReader:
+    """読みすぎたデータを戻せるストリームの読み込み"""
+
+    def __init__(self, stream):
+        self._stream = stream
+        self._buffer = b''
+
+    def read(self, size):
+        """最大 size バイトを読み込む（終端では空のバイト列を返す）"""
+        if self._buffer:
+            data, self._buffer = self._buffer[:size], self._buffer[size:]
+            return data
+        return self._stream.read(size) or b''
+
+    def read_exact(self, size):
+        """ちょうど size バイトを読み込む"""
+        chunks = []
+        remaining = size
+        while remaining > 0:
+            data = self.read(remaining)
+            if not data:
+                raise ZipStreamUnsupported("ZIPファイルが途中で終わっています")
+            chunks.append(data)
+            remaining -= len(data)
+        return b''.join(chunks)
+
+    def unread(self, data):
+        """読みすぎたデータを戻す"""
+        self._buffer = data + self._buffer
+
+def extract_first_video(stream, output_path, video_extensions):
+    """
+    ZIPのストリームから動画ファイルを取り出す
+    動画ファイルが見つかった時点で読み込みを終了します。
+    動画ファイルがない場合は最初のファイルを取り出します。
+
+    Args:
+        stream: read(size) を持つZIPファイルのストリーム
+        output_path (str): 出力ファイルパス
+        video_extensions (tuple): 動画ファイルの拡張子
+
+    Returns:
+        tuple: (取り出したファイル名, 動画ファイルかどうか)
+    """
+    reader = _StreamReader(stream)
+    partial_path = f"{output_path}.part"
+    extracted_name = None
+    extracted_is_video = False
+
+    try:
+        while True:
+            signature = reader.read(4)
+            if not signature:
+                break
+            if len(signature) < 4:
+                signature += reader.read_exact(4 - len(signature))
+            if signature in (CENTRAL_DIRECTORY_HEADER, END_OF_CENTRAL_DIRECTORY):
+                break
+            if signature != LOCAL_FILE_HEADER:
+                raise ZipStreamUnsupported("ローカルファイルヘッダーが見つかりません")
+
+            (_, flags, method, _, _, crc, compressed_size, size,
+             name_length, extra_length) = struct.unpack(_LOCAL_HEADER_FORMAT, reader.read_exact(_LOCAL_HEADER_SIZE))
+            raw_name = reader.read_exact(name_length)
+            name = raw_name.decode('utf-8' if flags & _FLAG_UTF8 else 'cp437')
+            reader.read_exact(extra_length)
+
+            has_descriptor = bool(flags & _FLAG_DATA_DESCRIPTOR)
+            if flags & _FLAG_ENCRYPTED:
+                raise ZipStreamUnsupported(f"暗号化されたファイルは解凍できません: {name}")
+            if method not in (_STORED, _DEFLATED):
+                raise ZipStreamUnsupported(f"未対応の圧縮方式です: {method}")
+            if compressed_size == 0xFFFFFFFF or size == 0xFFFFFFFF:
+                raise ZipStreamUnsupported(f"ZIP64形式のファイルです: {name}")
+            if method == _STORED and has_descriptor:
+                # 無圧縮かつサイズが後置されている場合はファイルの終わりが分からない
+                raise ZipStreamUnsupported(f"サイズが不明な無圧縮ファイルです: {name}")
+
+            is_directory = name.endswith('/')
+            is_video = name.lower().endswith(video_extensions)
+            # まだ何も取り出していないか、取り出したものが動画でなければ書き出す
+            wanted = not is_directory and (extracted_name is None or (is_video and not extracted_is_video))
+
+            if wanted:
+                with open(partial_path, 'wb') as target:
+                    actual_crc = _copy_member(reader, method, compressed_size, has_descriptor, target)
+            else:
+                actual_crc = _copy_member(reader, method, compressed_size, has_descriptor, None)
+
+            if has_descriptor:
+                crc = _read_data_descriptor(reader)
+            if wanted and actual_crc != crc:
+                raise Exception(f"ZIPファイルのCRCが一致しません: {name}")
+
+            if wanted:
+                extracted_name = name
+                extracted_is_video = is_video
+                print(f"動画ファイルを解凍: {name}" if is_video else f"動画以外のファイルを解凍: {name}")
+                if is_video:
+                    # 動画ファイルが見つかったので残りは読まない
+                    break
+
+        if extracted_name is None:
+            raise Exception("ZIPファイルが空です")
+
+        os.replace(partial_path, output_path)
+        return extracted_name, extracted_is_video
+    finally:
+        if os.path.exists(partial_path):
+            os.unlink(partial_path)
+
+def _copy_member(reader, method, compressed_size, has_descriptor, target):
+    """
+    1つのファイルのデータを読み込み、target が指定されていれば書き出す
+
+    Returns:
+        int: 展開後のデータのCRC32
+    """
+    crc = 0
+    decompressor = zlib.decompressobj(-15) if method == _DEFLATED else None
+    remaining = None if has_descriptor else compressed_size
+
+    while remaining is None or remaining > 0:
+        data = reader.read(_CHUNK_SIZE if remaining is None else min(_CHUNK_SIZE, remaining))
+        if not data:
+            raise ZipStreamUnsupported("ZIPファイルが途中で終わっています")
+        if remaining is not None:
+            remaining -= len(data)
+
+        if decompressor:
+            output = decompressor.decompress(data)
+            if decompressor.eof:
+                # 圧縮データの終わりを過ぎて読んだ分は戻す
+                reader.unread(decompressor.unused_data)
+                remaining = 0
+        else:
+            output = data
+
+        crc = zlib.crc32(output, crc)
+        if target:
+            target.write(output)
+
+    if decompressor and not decompressor.eof:
+        output = decompressor.flush()
+        crc = zlib.crc32(output, crc)
+        if target:
+            target.write(output)
+
+    return crc
+
+def _read_data_descriptor(reader):
+    """
+    ファイルデータの後にあるデータディスクリプタを読み込む
+
+    Returns:
+        int: データディスクリプタに記録されたCRC32
+    """
+    head = reader.read_exact(4)
+    if head == DATA_DESCRIPTOR:
+        head = reader.read_exact(4)
+    crc = struct.unpack('<I', head)[0]
+    # 圧縮後・圧縮前のサイズ（ZIP64ではない前提）
+    reader.read_exact(8)
+    return crc
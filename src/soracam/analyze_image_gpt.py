@@ -3,17 +3,31 @@
 
 """
 OpenAI GPT-4oを使用して画像を解析するスクリプト
+--images または --dir を指定すると、複数の画像を並行してAPIに送信し、結果をJSONLファイルに追記します。
 """
 
 import os
 import sys
+import json
+import math
+import time
+import asyncio
 import argparse
 import base64
 from dotenv import load_dotenv
-from openai import OpenAI
+import openai
+from openai import OpenAI, AsyncOpenAI
 from PIL import Image
 import io
 import httpx
+import cv2
+from motion_gate import add_motion_gate_arguments, create_motion_gate, motion_state_dir, print_motion_report
+
+# 共通モジュールのパスを追加
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+from common.result_cache import DEFAULT_MAX_BYTES, ResultCache, file_digest, print_cache_report
+from common.rate_limit import RetryPolicy, TokenBucket, parse_retry_after
+from common.image_files import collect_image_paths
 
 # .envファイルを読み込む
 load_dotenv()
@@ -22,43 +36,247 @@ def parse_args():
     """コマンドライン引数をパースする"""
     parser = argparse.ArgumentParser(description='OpenAI GPT-4oを使用して画像を解析するスクリプト')
     
-    parser.add_argument('--image', required=True, help='解析する画像ファイルのパス')
-    parser.add_argument('--output', help='解析結果を保存するファイルのパス')
+    image_group = parser.add_mutually_exclusive_group(required=True)
+    image_group.add_argument('--image', help='解析する画像ファイルのパス')
+    image_group.add_argument('--images', nargs='+', help='まとめて解析する画像ファイルのパス（ワイルドカード可、例: "timelapse_*.jpg"）')
+    image_group.add_argument('--dir', help='まとめて解析する画像ファイルのディレクトリ')
+    
+    parser.add_argument('--output', help='解析結果を保存するファイルのパス（--images、--dir 指定時は結果を追記するJSONLファイル）')
     parser.add_argument('--prompt', default='この画像に何が写っているか詳しく説明してください。', help='GPT-4oに送るプロンプト')
     parser.add_argument('--api-key', help='OpenAI APIキー（指定しない場合は環境変数から読み込みます）')
+    parser.add_argument('--model', default=DEFAULT_MODEL, help='使用するモデル')
+    parser.add_argument('--profile', choices=list(PREPROCESS_PROFILES), default=DEFAULT_PROFILE,
+                        help='画像の前処理（overview: 全体の様子を低解像度で、detail: 細部まで、original: 従来どおり）')
+    parser.add_argument('--base-url', help='OpenAI互換APIのURL（例: http://127.0.0.1:8000/v1）。指定しない場合はOpenAIのAPI')
+    parser.add_argument('--concurrency', type=int, default=8, help='まとめて解析する場合に同時に送信するリクエストの最大数')
+    parser.add_argument('--rpm', type=float, default=0, help='まとめて解析する場合の1分あたりのリクエスト数の上限（0の場合は制限なし）')
+    parser.add_argument('--max-retries', type=int, default=5, help='429や5xxエラーの場合に再試行する最大回数')
+    parser.add_argument('--device-id', help='画像を撮影したデバイスID（--image と --motion-gate で前回の画像と比較するために使用）')
+    parser.add_argument('--no-cache', dest='cache', action='store_false',
+                        help='解析結果のキャッシュを使用しない（同じ画像・プロンプトでもAPIを呼び出す）')
+    parser.add_argument('--cache-max-mb', type=int, default=DEFAULT_MAX_BYTES // 1024 // 1024,
+                        help='解析結果のキャッシュの上限（MB）')
+    add_motion_gate_arguments(parser)
+    
+    args = parser.parse_args()
+    if args.motion_gate and args.image and not args.device_id:
+        parser.error('--image で --motion-gate を使用する場合は --device-id を指定してください')
+    if (args.images or args.dir) and not args.output:
+        parser.error('--images、--dir を指定した場合は --output も指定してください')
+    return args
+
+# 既定のモデル
+DEFAULT_MODEL = "gpt-4o"
+# --base-url を指定しない場合のAPIのURL
+DEFAULT_BASE_URL = "https://api.openai.com/v1"
+
+# 1回の解析で生成する最大トークン数
+MAX_TOKENS = 1000
+
+# 画像の前処理のプロファイル
+# detail: APIに指定する詳細レベル、max_side: 長辺の上限、short_side: 短辺の上限、quality: JPEGの品質
+PREPROCESS_PROFILES = {
+    # 全体の様子が分かればよい場合（低詳細は512px以内に縮小されて固定の85トークンになるため、先に縮小して送る）
+    'overview': {'detail': 'low', 'max_side': 512, 'short_side': None, 'quality': 70},
+    # 細かい物体や文字も読み取りたい場合（高詳細でAPIが縮小するサイズに先に縮小するため、解析に使われる画像は変わらない）
+    'detail': {'detail': 'high', 'max_side': 2048, 'short_side': 768, 'quality': 85},
+    # 従来どおり（4000pxを超える場合のみ縮小し、詳細レベルはAPIに任せる）
+    'original': {'detail': 'auto', 'max_side': 4000, 'short_side': None, 'quality': 75}
+}
+
+# 既定の前処理のプロファイル
+DEFAULT_PROFILE = 'detail'
+
+# 一度にbase64エンコードするバイト数（3の倍数にすると、分割しても一括で変換した場合と同じ結果になる）
+BASE64_CHUNK_SIZE = 3 * 64 * 1024
+
+def target_size(width, height, settings):
+    """
+    前処理のプロファイルに合わせた画像のサイズを返す（拡大はしない）
+    
+    Args:
+        width (int): 元の画像の幅
+        height (int): 元の画像の高さ
+        settings (dict): PREPROCESS_PROFILES の設定
+    
+    Returns:
+        tuple: (幅, 高さ)
+    """
+    scale = min(1.0, settings['max_side'] / max(width, height))
+    if settings['short_side']:
+        scale = min(scale, settings['short_side'] / min(width, height))
+    return max(1, round(width * scale)), max(1, round(height * scale))
+
+def estimate_image_tokens(width, height, detail):
+    """
+    画像の入力トークン数を見積もる
+    高詳細の場合は、APIが縮小した後の画像を512pxのタイルに分割した数から計算します。
+    
+    Args:
+        width (int): 画像の幅
+        height (int): 画像の高さ
+        detail (str): 詳細レベル（"auto" は高詳細として見積もる）
+    
+    Returns:
+        int: 入力トークン数の見積もり
+    """
+    if detail == 'low':
+        return 85
+    width, height = target_size(width, height, PREPROCESS_PROFILES['detail'])
+    return 85 + 170 * math.ceil(width / 512) * math.ceil(height / 512)
+
+def base64_encode_stream(stream):
+    """
+    ファイルを少しずつ読み込みながらbase64エンコードする
     
-    return parser.parse_args()
+    Args:
+        stream: 読み込むファイルオブジェクト
+    
+    Returns:
+        str: base64エンコードした文字列
+    """
+    parts = []
+    while True:
+        chunk = stream.read(BASE64_CHUNK_SIZE)
+        if not chunk:
+            break
+        parts.append(base64.b64encode(chunk))
+    return b''.join(parts).decode('ascii')
 
-def encode_image(image_path):
-    """画像をbase64エンコードする"""
+def encode_image(image_path, profile=DEFAULT_PROFILE):
+    """
+    画像を前処理してbase64エンコードする
+    既にプロファイルのサイズ以下のJPEGの場合は、デコードと再エンコードを行わずにそのまま送ります。
+    
+    Args:
+        image_path (str): 画像ファイルのパス
+        profile (str): 前処理のプロファイル（PREPROCESS_PROFILES のキー）
+    
+    Returns:
+        tuple: (base64エンコードしたJPEG画像, 前処理の結果（サイズ、バイト数、トークン数の見積もり）)
+    """
+    settings = PREPROCESS_PROFILES[profile]
     try:
-        # 画像を開いてリサイズ（必要に応じて）
-        img = Image.open(image_path)
+        original_bytes = os.path.getsize(image_path)
         
-        # 画像が大きすぎる場合はリサイズ
-        max_size = 4000  # OpenAI APIの制限に合わせて調整
-        if max(img.size) > max_size:
-            ratio = max_size / max(img.size)
-            new_size = (int(img.size[0] * ratio), int(img.size[1] * ratio))
-            img = img.resize(new_size, Image.LANCZOS)
-            print(f"画像をリサイズしました: {img.size[0]}x{img.size[1]}")
+        # Image.open はヘッダーだけを読み込むため、サイズと形式の確認ではデコードしない
+        with Image.open(image_path) as img:
+            width, height = img.size
+            size = target_size(width, height, settings)
+            reencode = size != (width, height) or img.format != 'JPEG' or img.mode not in ('RGB', 'L')
+            
+            if reencode:
+                # JPEGは縮小後のサイズに近い解像度で直接デコードする
+                img.draft('RGB', size)
+                converted = img.convert('RGB')
+                if converted.size != size:
+                    converted = converted.resize(size, Image.LANCZOS)
+                
+                # JPEGに変換してバッファに保存
+                buffer = io.BytesIO()
+                converted.save(buffer, format="JPEG", quality=settings['quality'])
+                sent_bytes = buffer.tell()
+                buffer.seek(0)
+                encoded_image = base64_encode_stream(buffer)
         
-        # JPEGに変換してバッファに保存
-        buffer = io.BytesIO()
-        img.save(buffer, format="JPEG")
-        buffer.seek(0)
+        if not reencode:
+            with open(image_path, 'rb') as f:
+                encoded_image = base64_encode_stream(f)
+            sent_bytes = original_bytes
         
-        # base64エンコード
-        encoded_image = base64.b64encode(buffer.getvalue()).decode('utf-8')
-        return encoded_image
+        estimated_tokens = estimate_image_tokens(size[0], size[1], settings['detail'])
+        # 従来の処理（元のサイズのまま、詳細レベルをAPIに任せる）と比べる
+        baseline_tokens = estimate_image_tokens(width, height, 'auto')
+        info = {
+            'profile': profile,
+            'detail': settings['detail'],
+            'original_size': [width, height],
+            'sent_size': list(size),
+            'reencoded': reencode,
+            'original_bytes': original_bytes,
+            'sent_bytes': sent_bytes,
+            'bytes_saved': original_bytes - sent_bytes,
+            'estimated_tokens': estimated_tokens,
+            'tokens_saved': baseline_tokens - estimated_tokens
+        }
+        return encoded_image, info
     except Exception as e:
-        print(f"画像のエンコードに失敗しました: {str(e)}")
-        sys.exit(1)
+        raise Exception(f"画像のエンコードに失敗しました: {str(e)}")
 
-def analyze_image_with_gpt4o(image_path, prompt, api_key=None):
-    """GPT-4oを使用して画像を解析する"""
+def print_preprocess_info(info):
+    """encode_image の前処理の結果を表示する"""
+    width, height = info['original_size']
+    sent_width, sent_height = info['sent_size']
+    action = "再エンコード" if info['reencoded'] else "そのまま送信"
+    print(f"画像の前処理（{info['profile']}、詳細レベル: {info['detail']}）: "
+          f"{width}x{height} → {sent_width}x{sent_height}（{action}）、"
+          f"{info['original_bytes'] / 1024:.0f}KB → {info['sent_bytes'] / 1024:.0f}KB、"
+          f"入力トークンの見積もり {info['estimated_tokens']}（{info['tokens_saved']}削減）")
+
+def build_messages(prompt, base64_image, detail=PREPROCESS_PROFILES[DEFAULT_PROFILE]['detail']):
+    """
+    画像とプロンプトを送信するメッセージを作成する
+    
+    Args:
+        prompt (str): プロンプト
+        base64_image (str): base64エンコードしたJPEG画像
+        detail (str): 画像の詳細レベル（"low", "high", "auto"）
+    
+    Returns:
+        list: Chat Completions APIのメッセージ
+    """
+    return [
+        {
+            "role": "user",
+            "content": [
+                {"type": "text", "text": prompt},
+                {
+                    "type": "image_url",
+                    "image_url": {
+                        "url": f"data:image/jpeg;base64,{base64_image}",
+                        "detail": detail
+                    }
+                }
+            ]
+        }
+    ]
+
+def analysis_cache_key(image_path, prompt, model=DEFAULT_MODEL, profile=DEFAULT_PROFILE, base_url=None):
+    """解析結果のキャッシュのキーを作成する（モックサーバーなど別のAPIの結果とは区別する）"""
+    # OpenAIクライアントと同じく、指定がなければ環境変数 OPENAI_BASE_URL、既定のURLの順に使用する
+    base_url = (base_url or os.environ.get('OPENAI_BASE_URL') or DEFAULT_BASE_URL).rstrip('/')
+    return ResultCache.make_key(file_digest(image_path), model=model, prompt=prompt,
+                                preprocess=PREPROCESS_PROFILES[profile], max_tokens=MAX_TOKENS,
+                                base_url=base_url)
+
+def analyze_image_with_gpt4o(image_path, prompt, api_key=None, cache=None, model=DEFAULT_MODEL, base_url=None,
+                            profile=DEFAULT_PROFILE):
+    """
+    GPT-4oを使用して画像を解析する
+    
+    Args:
+        image_path (str): 画像ファイルのパス
+        prompt (str): GPT-4oに送るプロンプト
+        api_key (str, optional): OpenAI APIキー
+        cache (ResultCache, optional): 指定した場合は、同じ画像・プロンプトの解析結果をキャッシュから返す
+        model (str): 使用するモデル
+        base_url (str, optional): OpenAI互換APIのURL
+        profile (str): 画像の前処理のプロファイル
+    
+    Returns:
+        str: 解析結果
+    """
     print(f"画像 {image_path} を解析中...")
     
+    # 同じ画像を同じ条件で解析した結果があれば、APIを呼び出さずに返す
+    cache_key = None
+    if cache is not None:
+        cache_key = analysis_cache_key(image_path, prompt, model, profile, base_url)
+        cached = cache.get(cache_key)
+        if cached is not None:
+            print("キャッシュした解析結果を使用します")
+            return cached['analysis']
+    
     # APIキーの設定
     api_key_to_use = api_key if api_key else os.environ.get("OPENAI_API_KEY")
     if not api_key_to_use:
@@ -68,41 +286,266 @@ def analyze_image_with_gpt4o(image_path, prompt, api_key=None):
     
     try:
         # 画像をbase64エンコード
-        base64_image = encode_image(image_path)
+        base64_image, preprocess_info = encode_image(image_path, profile)
+        print_preprocess_info(preprocess_info)
         
         # OpenAIクライアントを初期化（プロキシ設定を無効化）
         http_client = httpx.Client(proxies=None)
-        client = OpenAI(api_key=api_key_to_use, http_client=http_client)
+        client = OpenAI(api_key=api_key_to_use, base_url=base_url, http_client=http_client)
         
         # GPT-4oに画像を送信
         response = client.chat.completions.create(
-            model="gpt-4o",
-            messages=[
-                {
-                    "role": "user",
-                    "content": [
-                        {"type": "text", "text": prompt},
-                        {
-                            "type": "image_url",
-                            "image_url": {
-                                "url": f"data:image/jpeg;base64,{base64_image}",
-                                "detail": "auto"  # 画像の詳細レベル: "low", "high", "auto"
-                            }
-                        }
-                    ]
-                }
-            ],
-            max_tokens=1000
+            model=model,
+            messages=build_messages(prompt, base64_image, preprocess_info['detail']),
+            max_tokens=MAX_TOKENS
         )
         
         # レスポンスから解析結果を取得
         analysis = response.choices[0].message.content
+        if cache is not None:
+            cache.put(cache_key, {'analysis': analysis})
         return analysis
     
     except Exception as e:
         print(f"画像解析に失敗しました: {str(e)}")
         sys.exit(1)
 
+def retry_after_from_error(error):
+    """
+    APIのエラーレスポンスから、サーバーが指示した待機時間を取り出す
+    
+    Args:
+        error (openai.APIStatusError): APIのエラー
+    
+    Returns:
+        float: 待機時間（秒）。指示がない場合はNone
+    """
+    headers = error.response.headers
+    retry_after_ms = headers.get('retry-after-ms')
+    if retry_after_ms:
+        try:
+            return max(0.0, float(retry_after_ms) / 1000)
+        except ValueError:
+            pass
+    return parse_retry_after(headers.get('retry-after'))
+
+async def request_analysis(client, messages, model, retry_policy, bucket, stats):
+    """
+    解析をリクエストし、429・5xx・接続エラーの場合はバックオフして再試行する
+    429の場合は、サーバーが指示した時間だけ他のリクエストの送信も止めます。
+    
+    Args:
+        client (AsyncOpenAI): 共有するクライアント
+        messages (list): 送信するメッセージ
+        model (str): 使用するモデル
+        retry_policy (RetryPolicy): 再試行のポリシー
+        bucket (TokenBucket): リクエストの送信レートを制限するトークンバケット
+        stats (dict): 再試行の回数を加算する集計
+    
+    Returns:
+        tuple: (レスポンス, 再試行した回数)
+    """
+    attempt = 0
+    while True:
+        wait = bucket.reserve()
+        if wait > 0:
+            await asyncio.sleep(wait)
+        
+        try:
+            response = await client.chat.completions.create(model=model, messages=messages, max_tokens=MAX_TOKENS)
+            return response, attempt
+        except openai.APIStatusError as e:
+            # 解析のリクエストは副作用がないため、5xxエラーでも再試行する
+            if e.status_code not in retry_policy.RETRY_STATUSES or attempt >= retry_policy.max_retries:
+                raise
+            retry_after = retry_after_from_error(e)
+            delay = retry_policy.delay(attempt, retry_after)
+            if e.status_code == 429:
+                stats['throttled'] += 1
+                bucket.block(delay)
+            print(f"APIが{e.status_code}を返したため{delay:.1f}秒後に再試行します（{attempt + 1}回目）")
+        except openai.APIConnectionError as e:
+            if attempt >= retry_policy.max_retries:
+                raise
+            delay = retry_policy.delay(attempt)
+            print(f"接続エラーのため{delay:.1f}秒後に再試行します（{attempt + 1}回目）: {str(e)}")
+        
+        stats['retries'] += 1
+        await asyncio.sleep(delay)
+        attempt += 1
+
+async def analyze_images_async(image_paths, prompt, output_path, api_key=None, base_url=None, model=DEFAULT_MODEL,
+                               concurrency=8, rpm=0, max_retries=5, cache=None, profile=DEFAULT_PROFILE,
+                               motion_gate=None, device_id=None):
+    """
+    複数の画像を並行して解析し、結果を1件ずつJSONLファイルに追記する
+    1つのコネクションプールを共有し、送信中のリクエストの応答を待つ間に次の画像をエンコードします。
+    失敗した画像はエラーとして記録し、残りの画像の解析を続けます。
+    motion_gate を指定した場合は、画像を指定された順に1台のカメラの連続した静止画として比較し、
+    変化のない画像はAPIを呼び出さずに省略した画像として記録します。
+    
+    Args:
+        image_paths (list): 画像ファイルのパス
+        prompt (str): プロンプト
+        output_path (str): 結果を追記するJSONLファイルのパス
+        api_key (str, optional): OpenAI APIキー
+        base_url (str, optional): OpenAI互換APIのURL
+        model (str): 使用するモデル
+        concurrency (int): 同時に送信するリクエストの最大数
+        rpm (float): 1分あたりのリクエスト数の上限（0の場合は制限なし）
+        max_retries (int): 再試行の最大回数
+        cache (ResultCache, optional): 指定した場合は、同じ画像・プロンプトの解析結果をキャッシュから返す
+        profile (str): 画像の前処理のプロファイル
+        motion_gate (MotionGate, optional): 指定した場合は、直前までの画像から変化のない画像の解析を省略する
+        device_id (str, optional): motion_gate で背景を区別するデバイスID
+    
+    Returns:
+        dict: 解析した枚数、失敗した枚数、変化がなく省略した枚数、再試行の回数、トークン数の合計、
+            前処理で削減したバイト数とトークン数の見積もり、処理時間と1秒あたりの処理枚数
+    """
+    stats = {
+        'images': len(image_paths), 'succeeded': 0, 'failed': 0, 'skipped': 0, 'cached': 0, 'retries': 0,
+        'throttled': 0,
+        'prompt_tokens': 0, 'completion_tokens': 0, 'total_tokens': 0,
+        'bytes_sent': 0, 'bytes_saved': 0, 'estimated_tokens_saved': 0
+    }
+    retry_policy = RetryPolicy(max_retries=max_retries)
+    # rpmを指定しない場合も、429で指示された待機時間を全てのリクエストで共有するために使用する
+    bucket = TokenBucket(rpm / 60 if rpm else 1e6, max(1, concurrency))
+    # 送信中のリクエストと、エンコード済みで送信を待つ画像をそれぞれ concurrency 件までに抑える
+    in_flight = asyncio.Semaphore(concurrency)
+    slots = asyncio.Semaphore(concurrency * 2)
+    
+    http_client = httpx.AsyncClient(
+        timeout=httpx.Timeout(120.0, connect=10.0),
+        limits=httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    )
+    # 再試行はトークンバケットと共有するためにこちらで行う
+    client = AsyncOpenAI(api_key=api_key, base_url=base_url, http_client=http_client, max_retries=0)
+    
+    async def analyze_one(image_path, output_file):
+        """1枚の画像を解析して結果を書き出す"""
+        async with slots:
+            record = {'image': image_path, 'model': model}
+            start_time = time.time()
+            try:
+                cache_key = (analysis_cache_key(image_path, prompt, model, profile, base_url)
+                             if cache is not None else None)
+                cached = cache.get(cache_key) if cache is not None else None
+                if cached is not None:
+                    record.update({'analysis': cached['analysis'], 'cached': True})
+                    stats['cached'] += 1
+                else:
+                    base64_image, preprocess_info = await asyncio.to_thread(encode_image, image_path, profile)
+                    record['preprocess'] = preprocess_info
+                    stats['bytes_sent'] += preprocess_info['sent_bytes']
+                    stats['bytes_saved'] += preprocess_info['bytes_saved']
+                    stats['estimated_tokens_saved'] += preprocess_info['tokens_saved']
+                    async with in_flight:
+                        response, retries = await request_analysis(
+                            client, build_messages(prompt, base64_image, preprocess_info['detail']), model,
+                            retry_policy, bucket, stats
+                        )
+                    analysis = response.choices[0].message.content
+                    usage = response.usage
+                    record.update({
+                        'analysis': analysis,
+                        'usage': {
+                            'prompt_tokens': usage.prompt_tokens,
+                            'completion_tokens': usage.completion_tokens,
+                            'total_tokens': usage.total_tokens
+                        } if usage else None,
+                        'retries': retries
+                    })
+                    if usage:
+                        stats['prompt_tokens'] += usage.prompt_tokens
+                        stats['completion_tokens'] += usage.completion_tokens
+                        stats['total_tokens'] += usage.total_tokens
+                    if cache is not None:
+                        cache.put(cache_key, {'analysis': analysis})
+                stats['succeeded'] += 1
+            except Exception as e:
+                record['error'] = str(e)
+                stats['failed'] += 1
+                print(f"画像 {image_path} の解析に失敗しました: {str(e)}")
+            
+            record['latency_ms'] = (time.time() - start_time) * 1000
+            output_file.write(json.dumps(record, ensure_ascii=False) + '\n')
+            output_file.flush()
+            done = stats['succeeded'] + stats['failed'] + stats['skipped']
+            print(f"{done}/{len(image_paths)}枚を処理しました: {image_path}")
+    
+    start_time = time.time()
+    try:
+        # 変化の判定は画像の順序に依存するため、送信を始める前に順に行う
+        unchanged = await asyncio.to_thread(unchanged_images, image_paths, motion_gate, device_id) \
+            if motion_gate is not None else {}
+        with open(output_path, 'a', encoding='utf-8') as output_file:
+            for image_path, score in unchanged.items():
+                record = {'image': image_path, 'model': model, 'skipped': True, 'motion_score': score}
+                output_file.write(json.dumps(record, ensure_ascii=False) + '\n')
+                stats['skipped'] += 1
+            if unchanged:
+                output_file.flush()
+                print(f"変化がないため{len(unchanged)}枚の解析を省略しました")
+            await asyncio.gather(*(analyze_one(image_path, output_file) for image_path in image_paths
+                                   if image_path not in unchanged))
+    finally:
+        await client.close()
+    
+    stats['elapsed_seconds'] = time.time() - start_time
+    stats['images_per_second'] = len(image_paths) / stats['elapsed_seconds'] if stats['elapsed_seconds'] > 0 else 0.0
+    if motion_gate is not None:
+        stats['motion'] = motion_gate.report()
+    return stats
+
+def unchanged_images(image_paths, motion_gate, device_id=None):
+    """
+    画像を順に MotionGate で判定し、直前までの画像から変化のない画像を返す
+    
+    Args:
+        image_paths (list): 画像ファイルのパス（撮影順）
+        motion_gate (MotionGate): 変化の判定に使用する MotionGate
+        device_id (str, optional): 背景を区別するデバイスID
+    
+    Returns:
+        dict: 変化のない画像ファイルのパスと、変化した画素の割合
+    """
+    unchanged = {}
+    for image_path in image_paths:
+        image = cv2.imread(image_path)
+        if image is None:
+            # 読み込めない画像は解析時にエラーとして記録する
+            continue
+        changed, score = motion_gate.check(device_id or 'default', image)
+        if not changed:
+            unchanged[image_path] = score
+    return unchanged
+
+def completed_images(output_path):
+    """
+    JSONLファイルに記録済みで、解析に成功した画像（変化がなく省略した画像を含む）を返す
+    
+    Args:
+        output_path (str): 結果を追記するJSONLファイルのパス
+    
+    Returns:
+        set: 画像ファイルのパス
+    """
+    completed = set()
+    if not os.path.exists(output_path):
+        return completed
+    with open(output_path, encoding='utf-8') as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                # 中断時に途中まで書き込まれた行は無視する
+                continue
+            if 'error' not in record:
+                completed.add(record.get('image'))
+    return completed
+
 def save_analysis(analysis, output_path):
     """解析結果をファイルに保存する"""
     try:
@@ -118,6 +561,51 @@ def main():
     """メイン関数"""
     args = parse_args()
     
+    if args.images or args.dir:
+        # 複数の画像を並行して解析する
+        image_paths = collect_image_paths(args.images, args.dir)
+        # 前回までに解析に成功した画像は省略する
+        completed = completed_images(args.output)
+        pending = [path for path in image_paths if path not in completed]
+        if not pending:
+            print("解析する画像ファイルがありません" + ("（全て解析済みです）" if image_paths else ""))
+            return
+        if completed:
+            print(f"解析済みの{len(image_paths) - len(pending)}枚を省略します")
+        
+        output_dir = os.path.dirname(args.output)
+        if output_dir and not os.path.exists(output_dir):
+            os.makedirs(output_dir)
+        
+        api_key = args.api_key or os.environ.get("OPENAI_API_KEY")
+        if not api_key:
+            print("エラー: OpenAI APIキーが設定されていません")
+            print("--api-keyオプションで指定するか、OPENAI_API_KEY環境変数を設定してください")
+            sys.exit(1)
+        
+        cache = ResultCache(max_bytes=args.cache_max_mb * 1024 * 1024) if args.cache else None
+        # 画像をファイル名の順に1台のカメラの連続した静止画として比較する（背景は保存しない）
+        motion_gate = create_motion_gate(args)
+        print(f"{len(pending)}枚の画像を解析中（同時実行数: {args.concurrency}）...")
+        stats = asyncio.run(analyze_images_async(
+            pending, args.prompt, args.output, api_key, args.base_url, args.model,
+            args.concurrency, args.rpm, args.max_retries, cache, args.profile,
+            motion_gate, args.device_id
+        ))
+        
+        motion_report = stats.pop('motion', None)
+        print("\n処理結果:")
+        print(json.dumps(stats, indent=2, ensure_ascii=False))
+        if motion_report is not None:
+            print_motion_report(motion_report)
+        if cache is not None:
+            print_cache_report(cache.report())
+            cache.close()
+        print(f"解析結果を追記しました: {args.output}")
+        if stats['failed']:
+            sys.exit(1)
+        return
+    
     # 入力ファイルの存在確認
     if not os.path.isfile(args.image):
         print(f"エラー: 画像ファイル {args.image} が見つかりません")
@@ -134,8 +622,30 @@ def main():
     if output_dir and not os.path.exists(output_dir):
         os.makedirs(output_dir)
     
+    # 前回の実行時の背景と比べて変化がなければ、APIを呼び出さずに終了する
+    # （背景は解析に成功した後で保存し、失敗した場合は再実行時に同じ画像を解析し直す）
+    motion_gate = create_motion_gate(args, motion_state_dir())
+    if motion_gate is not None:
+        image = cv2.imread(args.image)
+        if image is None:
+            print(f"エラー: 画像ファイル {args.image} を読み込めませんでした")
+            sys.exit(1)
+        changed, score = motion_gate.check(args.device_id, image, commit=False)
+        if not changed:
+            motion_gate.commit(args.device_id)
+            print(f"前回から変化がないため解析を省略しました（変化した画素: {score * 100:.2f}%、"
+                  f"しきい値: {args.motion_threshold * 100:.2f}%）")
+            return
+    
     # 画像を解析
-    analysis = analyze_image_with_gpt4o(args.image, args.prompt, args.api_key)
+    cache = ResultCache(max_bytes=args.cache_max_mb * 1024 * 1024) if args.cache else None
+    analysis = analyze_image_with_gpt4o(args.image, args.prompt, args.api_key, cache, args.model, args.base_url,
+                                        args.profile)
+    if cache is not None:
+        print_cache_report(cache.report())
+        cache.close()
+    if motion_gate is not None:
+        motion_gate.commit(args.device_id)
     
     # 解析結果を表示
     print("\n解析結果:")
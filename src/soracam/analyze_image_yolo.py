@@ -9,37 +9,194 @@ import os
 import sys
 import argparse
 import json
-from datetime import datetime
+import time
+import uuid
+import shutil
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
 import cv2
 import numpy as np
+import pandas as pd
+import urllib3
 from PIL import Image
-from ultralytics import YOLO
+
+# 共通モジュールのパスを追加
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+from common.token_cache import default_cache_dir
+from common.result_cache import DEFAULT_MAX_BYTES, ResultCache, file_digest, print_cache_report
+from common.interactive import add_batch_argument, pause, set_batch_mode
+from common.image_files import collect_image_paths
+from motion_gate import add_motion_gate_arguments, create_motion_gate, motion_state_dir, print_motion_report
 
 def parse_args():
     """コマンドライン引数をパースする"""
     parser = argparse.ArgumentParser(description='YOLOを使用して画像内の物体を検出するスクリプト')
     
     # 画像ファイルの指定
-    parser.add_argument('--image', required=True, help='解析する画像ファイルのパス')
+    image_group = parser.add_mutually_exclusive_group(required=True)
+    image_group.add_argument('--image', help='解析する画像ファイルのパス')
+    image_group.add_argument('--images', nargs='+', help='まとめて解析する画像ファイルのパス（ワイルドカード可、例: "timelapse_*.jpg"）')
+    image_group.add_argument('--dir', help='まとめて解析する画像ファイルのディレクトリ')
     
-    parser.add_argument('--output', required=True, help='解析結果を保存するファイルのパス')
+    parser.add_argument('--output', help='解析結果を保存するファイルのパス（--server、--images、--dir 指定時は検出結果のJSON）')
     parser.add_argument('--model', default='yolov8n.pt', help='使用するモデル（例: yolov8n.pt, yolov8s.pt）')
     parser.add_argument('--conf', type=float, default=0.25, help='信頼度のしきい値（0-1）')
+    parser.add_argument('--backend', choices=BACKENDS, default='pytorch',
+                        help='推論に使用するランタイム（onnx, openvino はCPU向けに変換したモデルを使用）')
+    parser.add_argument('--int8', action='store_true', help='--backend でINT8に量子化したモデルを使用する')
     parser.add_argument('--save-txt', action='store_true', help='検出結果をテキストファイルに保存する')
+    parser.add_argument('--no-annotate', dest='annotate', action='store_false',
+                        help='検出結果を描画した画像の代わりに、検出結果のJSONを --output に保存する')
+    parser.add_argument('--annotate-dir', help='まとめて解析する場合に、検出結果を描画した画像を保存するディレクトリ')
+    parser.add_argument('--store', help='検出結果を追記するParquetのディレクトリ（例: detections/）')
+    parser.add_argument('--device-id', help='--store に記録するデバイスID')
+    parser.add_argument('--timestamp', help='--store に記録する撮影時刻（ISO 8601形式）。指定しない場合は画像ファイルの更新時刻')
+    parser.add_argument('--server', help='推論サーバーのURL（例: http://127.0.0.1:8008）。指定するとモデルを読み込まずにサーバーで解析する')
+    parser.add_argument('--batch-size', type=int, default=8, help='まとめて解析する場合に1回の推論で処理する画像の枚数')
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 4, help='まとめて解析する場合に画像を読み込むスレッド数')
+    parser.add_argument('--no-cache', dest='cache', action='store_false',
+                        help='検出結果のキャッシュを使用しない（同じ画像・条件でも推論し直す）')
+    parser.add_argument('--cache-max-mb', type=int, default=DEFAULT_MAX_BYTES // 1024 // 1024,
+                        help='検出結果のキャッシュの上限（MB）')
+    add_motion_gate_arguments(parser)
+    add_batch_argument(parser)
+    
+    args = parser.parse_args()
+    if args.int8 and args.backend == 'pytorch':
+        parser.error('--int8 は --backend onnx または openvino と組み合わせて使用してください')
+    if not args.server and not args.output:
+        parser.error('--output は必須です（--server を指定した場合は省略可能）')
+    if args.server and not args.image:
+        parser.error('--server は --image と組み合わせて使用してください')
+    if args.server and args.store:
+        parser.error('--store は --server と組み合わせて使用できません')
+    if args.motion_gate and args.image and not args.device_id:
+        parser.error('--image で --motion-gate を使用する場合は --device-id を指定してください')
+    return args
+
+# 推論に使用できるランタイム
+BACKENDS = ('pytorch', 'onnx', 'openvino')
+
+# 信頼度の分布を集計する区間（0.1刻み）
+CONFIDENCE_BINS = np.linspace(0.0, 1.0, 11)
+
+# キャッシュした検出結果を描画する枠の色（ultralyticsと同じ配色、BGR形式）
+ANNOTATION_COLORS = [
+    tuple(int(color[i:i + 2], 16) for i in (4, 2, 0))
+    for color in ('FF3838', 'FF9D97', 'FF701F', 'FFB21D', 'CFD231', '48F90A', '92CC17', '3DDB86', '1A9334', '00D4BB',
+                  '2C99A8', '00C2FF', '344593', '6473FF', '0018EC', '8438FF', '520085', 'CB38FF', 'FF95C8', 'FF37C7')
+]
+
+def model_cache_dir():
+    """
+    変換したモデルを保存するディレクトリを返す
     
-    return parser.parse_args()
+    Returns:
+        str: ディレクトリのパス
+    """
+    return os.path.join(default_cache_dir(), 'models')
 
-# 出力ディレクトリの定義
-DETECTION_RESULTS_DIR = os.path.join('runs', 'detect')
+def exported_model_path(model_name, backend, int8=False):
+    """
+    変換したモデルのキャッシュのパスを返す
+    
+    Args:
+        model_name (str): 変換元のモデル（例: yolov8n.pt）
+        backend (str): ランタイム（onnx または openvino）
+        int8 (bool): INT8に量子化したモデルの場合はTrue
+        
+    Returns:
+        str: 変換したモデルのパス（openvinoの場合はディレクトリ）
+    """
+    stem = os.path.splitext(os.path.basename(model_name))[0]
+    if int8:
+        stem += '_int8'
+    if backend == 'onnx':
+        return os.path.join(model_cache_dir(), f"{stem}.onnx")
+    # ultralyticsはディレクトリ名の "_openvino_model" でOpenVINOのモデルと判定する
+    return os.path.join(model_cache_dir(), f"{stem}_openvino_model")
+
+def export_model(model_name, backend, int8=False, data=None, force=False):
+    """
+    モデルをCPU向けのランタイムの形式に変換し、キャッシュに保存する
+    変換済みのモデルがキャッシュにある場合はそのパスを返します。
+    
+    Args:
+        model_name (str): 変換元のモデル（例: yolov8n.pt）
+        backend (str): ランタイム（pytorch, onnx, openvino）
+        int8 (bool): INT8に量子化する
+        data (str, optional): OpenVINOのINT8量子化で使用するキャリブレーション用データセットのYAML
+        force (bool): キャッシュがあっても変換し直す
+        
+    Returns:
+        str: 推論に使用するモデルのパス
+    """
+    if backend == 'pytorch':
+        return model_name
+    
+    target_path = exported_model_path(model_name, backend, int8)
+    if os.path.exists(target_path) and not force:
+        return target_path
+    
+    from ultralytics import YOLO
+    
+    print(f"モデル {model_name} を{backend}形式に変換中{'（INT8量子化）' if int8 else ''}...")
+    os.makedirs(model_cache_dir(), exist_ok=True)
+    model = YOLO(model_name)
+    
+    if backend == 'onnx':
+        exported_path = model.export(format='onnx', simplify=True)
+        if int8:
+            # ONNXの量子化はonnxruntimeで行う（重みのみをINT8にする動的量子化）
+            import onnx
+            from onnxruntime.quantization import quantize_dynamic, QuantType
+            quantized_path = f"{exported_path}.int8"
+            quantize_dynamic(exported_path, quantized_path, weight_type=QuantType.QUInt8)
+            
+            # クラス名などのメタデータを量子化後のモデルに引き継ぐ
+            source = onnx.load(exported_path)
+            quantized = onnx.load(quantized_path)
+            del quantized.metadata_props[:]
+            quantized.metadata_props.extend(source.metadata_props)
+            onnx.save(quantized, quantized_path)
+            os.replace(quantized_path, exported_path)
+    else:
+        exported_path = model.export(format='openvino', int8=int8, data=data or 'coco128.yaml')
+    
+    # 変換結果をキャッシュに移動する
+    if os.path.isdir(target_path):
+        shutil.rmtree(target_path)
+    elif os.path.exists(target_path):
+        os.unlink(target_path)
+    shutil.move(exported_path, target_path)
+    print(f"変換したモデルを保存しました: {target_path}")
+    return target_path
 
-def load_model(model_name):
-    """YOLOモデルを読み込む"""
-    input("Enterキーを押すと、モデルを読み込みます...")
+def load_model(model_name, backend='pytorch', int8=False):
+    """
+    YOLOモデルを読み込む
+    
+    Args:
+        model_name (str): モデル（例: yolov8n.pt）
+        backend (str): 推論に使用するランタイム（pytorch, onnx, openvino）
+        int8 (bool): INT8に量子化したモデルを使用する（onnx, openvino のみ）
+        
+    Returns:
+        YOLO: 読み込んだモデル
+    """
     print(f"モデル {model_name} を読み込み中...")
     
     try:
+        # torchの読み込みに時間がかかるため、モデルを使う場合だけultralyticsを読み込む
+        from ultralytics import YOLO
+        
+        # 変換したモデルはキャッシュから読み込む（初回のみ変換する）
+        model_path = export_model(model_name, backend, int8)
+        
         # ultralyticsのYOLOクラスを使用してモデルを読み込む
-        model = YOLO(model_name)
+        model = YOLO(model_path, task='detect')
+        if model_path != model_name:
+            print(f"{backend}のモデルを使用します: {model_path}")
         print(f"モデルを正常に読み込みました: {model_name}")
         print(f"検出可能なオブジェクト: {model.names}")
         print(f"検出可能なオブジェクト数: {len(model.names)}")
@@ -49,74 +206,527 @@ def load_model(model_name):
         raise Exception(f"モデル {model_name} の読み込みに失敗しました。")
 
 def detect_objects(model, image_path, conf_threshold=0.25):
-    """画像内の物体を検出する"""
-    input("Enterキーを押すと、画像を解析します...")
+    """
+    画像内の物体を検出する
+    
+    Returns:
+        tuple: (YOLOの推論結果, summarize_detections の集計結果)
+    """
     print(f"画像 {image_path} を解析中...")
     
     try:
         # 推論を実行
-        results = model(image_path, conf=conf_threshold, save=True)
+        results = model(image_path, conf=conf_threshold)
         
         # 検出結果を集計
-        type_dict = {}
-        for result in results:
-            # 検出されたオブジェクトごとに処理
-            for box in result.boxes:
-                cls_id = int(box.cls.item())
-                conf = box.conf.item()
-                
-                # クラス名を取得
-                cls_name = model.names[cls_id]
-                
-                # 結果を表示
-                print(f"検出: {cls_name}, 信頼度: {conf:.2f}")
-                
-                # 集計
-                if cls_name in type_dict:
-                    type_dict[cls_name] += 1
-                else:
-                    type_dict[cls_name] = 1
+        summary = summarize_detections(results)
+        for detection in summary['detections']:
+            # 結果を表示
+            print(f"検出: {detection['class']}, 信頼度: {detection['conf']:.2f}")
         
-        print(f"検出結果の集計: {json.dumps(type_dict, indent=4, ensure_ascii=False)}")
-        return results
+        print(f"検出結果の集計: {json.dumps(summary['counts'], indent=4, ensure_ascii=False)}")
+        return results, summary
     except Exception as e:
         print(f"物体検出に失敗しました: {str(e)}")
         raise Exception(f"画像 {image_path} の物体検出に失敗しました。")
 
-def save_results(results, output_path, save_txt=False):
-    """検出結果を保存する"""
+def summarize_detections(results):
+    """
+    検出結果を集計する
+    
+    Args:
+        results (list): YOLOの推論結果
+        
+    Returns:
+        dict: 検出数の合計（total）、クラスごとの検出数（counts）、信頼度の分布（confidence_histogram）、
+            検出した物体ごとのクラス・信頼度・座標（detections）
+    """
+    names = results[0].names if len(results) else {}
+    
+    # 検出結果を配列としてまとめて取り出す
+    extracted = [extract_detections(result) for result in results]
+    if extracted:
+        cls_ids = np.concatenate([item[0] for item in extracted])
+        confs = np.concatenate([item[1] for item in extracted])
+        boxes = np.concatenate([item[2] for item in extracted])
+    else:
+        cls_ids = np.zeros(0, dtype=np.int64)
+        confs = np.zeros(0, dtype=np.float32)
+        boxes = np.zeros((0, 4), dtype=np.float32)
+    
+    return summarize_detection_arrays((cls_ids, confs, boxes), names)
+
+def summarize_detection_arrays(detections, names):
+    """
+    配列として取り出した検出結果を集計する
+    
+    Args:
+        detections (tuple): extract_detections の (クラスIDの配列, 信頼度の配列, 座標の配列)
+        names (dict): クラスIDからクラス名への辞書
+        
+    Returns:
+        dict: summarize_detections と同じ形式の集計結果
+    """
+    cls_ids, confs, boxes = detections
+    class_counts, conf_hist = aggregate_detections(cls_ids, confs, len(names))
+    summary = format_aggregation(class_counts, conf_hist, names)
+    summary['detections'] = [
+        {'class': names[cls_id], 'conf': conf, 'xyxy': xyxy}  # xyxy: x1, y1, x2, y2
+        for cls_id, conf, xyxy in zip(cls_ids.tolist(), confs.tolist(), boxes.tolist())
+    ]
+    return summary
+
+def aggregate_detections(cls_ids, confs, num_classes):
+    """
+    クラスごとの検出数と信頼度の分布を配列のまま集計する
+    
+    Args:
+        cls_ids (numpy.ndarray): クラスIDの配列
+        confs (numpy.ndarray): 信頼度の配列
+        num_classes (int): モデルのクラス数
+        
+    Returns:
+        tuple: (クラスIDごとの検出数の配列, 信頼度の区間ごとの検出数の配列)
+    """
+    class_counts = np.bincount(cls_ids, minlength=num_classes)
+    conf_hist, _ = np.histogram(confs, bins=CONFIDENCE_BINS)
+    return class_counts, conf_hist
+
+def format_aggregation(class_counts, conf_hist, names):
+    """
+    aggregate_detections の集計結果を表示・保存用の辞書にする
+    
+    Args:
+        class_counts (numpy.ndarray): クラスIDごとの検出数
+        conf_hist (numpy.ndarray): 信頼度の区間ごとの検出数
+        names (dict): クラスIDからクラス名への辞書
+        
+    Returns:
+        dict: 検出数の合計（total）、検出されたクラスごとの検出数（counts）、信頼度の分布（confidence_histogram）
+    """
+    return {
+        'total': int(class_counts.sum()),
+        'counts': {names[cls_id]: int(class_counts[cls_id]) for cls_id in np.flatnonzero(class_counts).tolist()},
+        'confidence_histogram': {'bins': CONFIDENCE_BINS.tolist(), 'counts': conf_hist.tolist()}
+    }
+
+def extract_detections(result):
+    """
+    1枚の画像の検出結果を配列として取り出す
+    検出された物体ごとではなく、テンソル全体を一度にCPUのNumPy配列に変換します。
+    
+    Args:
+        result: YOLOの推論結果（1枚分）
+        
+    Returns:
+        tuple: (クラスIDの配列, 信頼度の配列, 座標（x1, y1, x2, y2）の N×4 配列)
+    """
+    boxes = result.boxes
+    return (
+        boxes.cls.cpu().numpy().astype(np.int64),
+        boxes.conf.cpu().numpy().astype(np.float32),
+        boxes.xyxy.cpu().numpy().astype(np.float32).reshape(-1, 4)
+    )
+
+def detections_to_cache(detections, names):
+    """
+    検出結果をキャッシュに保存する形式にする
+    
+    Args:
+        detections (tuple): extract_detections の (クラスIDの配列, 信頼度の配列, 座標の配列)
+        names (dict): クラスIDからクラス名への辞書
+        
+    Returns:
+        dict: JSONに変換できる検出結果（クラス名は検出されたクラスの分のみ）
+    """
+    cls_ids, confs, boxes = detections
+    return {
+        'cls': cls_ids.tolist(),
+        'conf': confs.tolist(),
+        'xyxy': boxes.tolist(),
+        'names': {str(cls_id): names[cls_id] for cls_id in set(cls_ids.tolist())}
+    }
+
+def detections_from_cache(value):
+    """
+    キャッシュに保存した検出結果を配列に戻す
+    
+    Args:
+        value (dict): detections_to_cache で作成した検出結果
+        
+    Returns:
+        tuple: ((クラスIDの配列, 信頼度の配列, 座標の配列), クラスIDからクラス名への辞書)
+    """
+    detections = (
+        np.array(value['cls'], dtype=np.int64),
+        np.array(value['conf'], dtype=np.float32),
+        np.array(value['xyxy'], dtype=np.float32).reshape(-1, 4)
+    )
+    return detections, {int(cls_id): name for cls_id, name in value['names'].items()}
+
+def draw_detections(image, detections, names):
+    """
+    配列として取り出した検出結果を画像に描画する
+    キャッシュした検出結果から、モデルを読み込まずに推論結果の plot と同様の画像を作ります。
+    
+    Args:
+        image (numpy.ndarray): BGR形式の画像
+        detections (tuple): extract_detections の (クラスIDの配列, 信頼度の配列, 座標の配列)
+        names (dict): クラスIDからクラス名への辞書
+        
+    Returns:
+        numpy.ndarray: 検出結果を描画した画像
+    """
+    annotated = image.copy()
+    line_width = max(round(sum(image.shape[:2]) / 2 * 0.003), 2)
+    font_scale = line_width / 3
+    thickness = max(line_width - 1, 1)
+    cls_ids, confs, boxes = detections
+    for cls_id, conf, xyxy in zip(cls_ids.tolist(), confs.tolist(), boxes.tolist()):
+        color = ANNOTATION_COLORS[cls_id % len(ANNOTATION_COLORS)]
+        x1, y1, x2, y2 = (int(value) for value in xyxy)
+        cv2.rectangle(annotated, (x1, y1), (x2, y2), color, line_width, cv2.LINE_AA)
+        
+        # ラベルは枠の上に、上に入らない場合は枠の内側に描く
+        label = f"{names.get(cls_id, cls_id)} {conf:.2f}"
+        (width, height), _ = cv2.getTextSize(label, cv2.FONT_HERSHEY_SIMPLEX, font_scale, thickness)
+        outside = y1 - height - 3 >= 0
+        top = y1 - height - 3 if outside else y1 + height + 3
+        cv2.rectangle(annotated, (x1, y1), (x1 + width, top), color, -1, cv2.LINE_AA)
+        cv2.putText(annotated, label, (x1, y1 - 2 if outside else y1 + height + 2), cv2.FONT_HERSHEY_SIMPLEX,
+                    font_scale, (255, 255, 255), thickness, cv2.LINE_AA)
+    return annotated
+
+def detection_cache_params(args):
+    """検出結果に影響する条件（キャッシュのキーに使用する）"""
+    return {'model': args.model, 'backend': args.backend, 'int8': args.int8, 'conf': args.conf}
+
+def image_timestamp(image_path):
+    """
+    画像ファイルの更新時刻を返す
+    
+    Args:
+        image_path (str): 画像ファイルのパス
+        
+    Returns:
+        str: 更新時刻（ISO 8601形式、UTC）
+    """
+    return datetime.fromtimestamp(os.path.getmtime(image_path), timezone.utc).isoformat()
+
+def build_detection_frame(detections, names, image_path, device_id=None, timestamp=None):
+    """
+    1枚の画像の検出結果を列形式のデータフレームにする
+    
+    Args:
+        detections (tuple): extract_detections の (クラスIDの配列, 信頼度の配列, 座標の配列)
+        names (dict): クラスIDからクラス名への辞書
+        image_path (str): 画像ファイルのパス
+        device_id (str, optional): デバイスID
+        timestamp (str, optional): 撮影時刻（ISO 8601形式）
+        
+    Returns:
+        pandas.DataFrame: device_id, timestamp, image, class_id, class, conf, x1, y1, x2, y2 の列を持つデータフレーム
+    """
+    cls_ids, confs, boxes = detections
+    count = len(cls_ids)
+    
+    # 撮影時刻はUTCにそろえる（タイムゾーンがない場合はUTCとみなす）
+    taken_at = pd.Timestamp(timestamp or image_timestamp(image_path))
+    taken_at = taken_at.tz_localize('UTC') if taken_at.tzinfo is None else taken_at.tz_convert('UTC')
+    
+    return pd.DataFrame({
+        'device_id': pd.Series([device_id] * count, dtype='string'),
+        'timestamp': pd.Series([taken_at] * count, dtype='datetime64[ns, UTC]'),
+        'image': pd.Series([image_path] * count, dtype='string'),
+        'class_id': cls_ids.astype(np.int16),
+        'class': pd.Series([names[cls_id] for cls_id in cls_ids.tolist()], dtype='string'),
+        'conf': confs,
+        'x1': boxes[:, 0],
+        'y1': boxes[:, 1],
+        'x2': boxes[:, 2],
+        'y2': boxes[:, 3]
+    })
+
+def append_detections(frames, store_dir):
+    """
+    検出結果をParquetのディレクトリに追記する
+    実行ごとに1つのファイル（part-*.parquet）を追加するため、既存のファイルは書き換えません。
+    pandas.read_parquet(store_dir) でディレクトリ全体をまとめて読み込めます。
+    
+    Args:
+        frames (list): build_detection_frame で作成したデータフレームのリスト
+        store_dir (str): 保存先のディレクトリ
+        
+    Returns:
+        str: 追加したファイルのパス。検出結果がない場合はNone
+    """
+    frames = [frame for frame in frames if len(frame)]
+    if not frames:
+        print("保存する検出結果がありません")
+        return None
+    
+    os.makedirs(store_dir, exist_ok=True)
+    part_name = f"part-{datetime.now(timezone.utc).strftime('%Y%m%dT%H%M%S')}-{uuid.uuid4().hex[:8]}.parquet"
+    part_path = os.path.join(store_dir, part_name)
+    
+    # 書き込み途中のファイルが読み込まれないように、一時ファイルに書いてから名前を変更する
+    temp_path = os.path.join(store_dir, f".{part_name}.tmp")
+    pd.concat(frames, ignore_index=True).to_parquet(temp_path, index=False)
+    os.replace(temp_path, part_path)
+    
+    print(f"{sum(len(frame) for frame in frames)}件の検出結果を保存しました: {part_path}")
+    return part_path
+
+def iter_image_batches(image_paths, batch_size=8, workers=4):
+    """
+    画像をスレッドで先読みしながら、batch_size 枚ずつ返す
+    推論中に次のバッチの画像をデコードしておくことで、CPUを遊ばせないようにします。
+    
+    Args:
+        image_paths (list): 画像ファイルのパス
+        batch_size (int): 1バッチの画像の枚数
+        workers (int): 画像を読み込むスレッド数
+        
+    Yields:
+        tuple: (画像ファイルのパスのリスト, 画像のリスト, 読み込めなかった画像ファイルのパスのリスト)
+    """
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        # 2バッチ分まで先読みする
+        prefetch = batch_size * 2
+        futures = []
+        next_index = 0
+        
+        while futures or next_index < len(image_paths):
+            while next_index < len(image_paths) and len(futures) < prefetch:
+                path = image_paths[next_index]
+                futures.append((path, executor.submit(cv2.imread, path)))
+                next_index += 1
+            
+            paths, images, failed = [], [], []
+            for path, future in futures[:batch_size]:
+                image = future.result()
+                if image is None:
+                    failed.append(path)
+                else:
+                    paths.append(path)
+                    images.append(image)
+            futures = futures[batch_size:]
+            yield paths, images, failed
+
+def detect_objects_batch(model, image_paths, conf_threshold=0.25, batch_size=8, workers=4, annotate_dir=None,
+                         store_frames=None, device_id=None, motion_gate=None, cache=None, cache_params=None):
+    """
+    複数の画像をバッチで物体検出し、結果をまとめる
+    
+    Args:
+        model: YOLOモデル
+        image_paths (list): 画像ファイルのパス
+        conf_threshold (float): 信頼度のしきい値
+        batch_size (int): 1回の推論で処理する画像の枚数
+        workers (int): 画像を読み込むスレッド数
+        annotate_dir (str, optional): 検出結果を描画した画像を保存するディレクトリ
+        store_frames (list, optional): 指定した場合は画像ごとの検出結果のデータフレームを追加する
+        device_id (str, optional): データフレームに記録するデバイスID
+        motion_gate (MotionGate, optional): 指定した場合は、直前までの画像から変化のない画像の推論を省略する
+        cache (ResultCache, optional): 指定した場合は、同じ画像・条件の検出結果をキャッシュから返す
+        cache_params (dict, optional): キャッシュのキーに使用する条件（detection_cache_params の結果）
+        
+    Returns:
+        dict: 画像ごとの検出結果（images）、全体の検出数（total, counts）、
+            読み込めなかった画像（failed）、変化がなく省略した画像（skipped）、
+            キャッシュから返した画像の数（cached）、処理時間と1秒あたりの処理枚数
+    """
+    print(f"{len(image_paths)}枚の画像を解析中（バッチサイズ: {batch_size}）...")
+    
+    start_time = time.time()
+    images_summary = []
+    failed = []
+    skipped = []
+    names = model.names
+    class_counts = np.zeros(len(names), dtype=np.int64)
+    conf_hist = np.zeros(len(CONFIDENCE_BINS) - 1, dtype=np.int64)
+    
+    def add_image(path, detections):
+        """1枚の画像の検出結果を集計に加える"""
+        cls_ids, confs, boxes = detections
+        
+        # 画像ごとの集計を全体の集計に加算する
+        image_counts, image_hist = aggregate_detections(cls_ids, confs, len(names))
+        class_counts[:] += image_counts
+        conf_hist[:] += image_hist
+        
+        summary = format_aggregation(image_counts, image_hist, names)
+        summary['image'] = path
+        summary['detections'] = [
+            {'class': names[cls_id], 'conf': conf, 'xyxy': xyxy}
+            for cls_id, conf, xyxy in zip(cls_ids.tolist(), confs.tolist(), boxes.tolist())
+        ]
+        images_summary.append(summary)
+        
+        if store_frames is not None:
+            store_frames.append(build_detection_frame(detections, names, path, device_id))
+    
+    # キャッシュにある画像は推論を省略する（--annotate-dir を指定した場合はキャッシュした検出結果を描画する）
+    cache_keys = {}
+    cached_paths = set()
+    if cache is not None:
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            digests = list(executor.map(lambda path: file_digest(path) if os.path.isfile(path) else None, image_paths))
+        for path, digest in zip(image_paths, digests):
+            if digest is None:
+                continue
+            cache_keys[path] = ResultCache.make_key(digest, **(cache_params or {}))
+            value = cache.get(cache_keys[path])
+            if value is None:
+                continue
+            detections, cached_names = detections_from_cache(value)
+            if annotate_dir:
+                image = cv2.imread(path)
+                if image is None:
+                    continue
+                cv2.imwrite(os.path.join(annotate_dir, os.path.basename(path)),
+                            draw_detections(image, detections, cached_names))
+            add_image(path, detections)
+            cached_paths.add(path)
+        if cached_paths:
+            print(f"{len(cached_paths)}枚の検出結果をキャッシュから読み込みました")
+    pending_paths = [path for path in image_paths if path not in cached_paths]
+    
+    for paths, images, batch_failed in iter_image_batches(pending_paths, batch_size, workers):
+        for path in batch_failed:
+            print(f"警告: 画像 {path} を読み込めませんでした")
+        failed.extend(batch_failed)
+        
+        if motion_gate is not None:
+            # 画像はファイル名の順に1台のカメラの連続した静止画として扱う
+            changed = [motion_gate.check(device_id or 'default', image)[0] for image in images]
+            skipped.extend(path for path, keep in zip(paths, changed) if not keep)
+            paths = [path for path, keep in zip(paths, changed) if keep]
+            images = [image for image, keep in zip(images, changed) if keep]
+        if not images:
+            continue
+        
+        # バッチで推論を実行
+        results = model(images, conf=conf_threshold, verbose=False)
+        
+        for path, result in zip(paths, results):
+            detections = extract_detections(result)
+            add_image(path, detections)
+            
+            if annotate_dir:
+                cv2.imwrite(os.path.join(annotate_dir, os.path.basename(path)), result.plot())
+            if path in cache_keys:
+                cache.put(cache_keys[path], detections_to_cache(detections, names))
+        
+        print(f"{len(images_summary) + len(failed) + len(skipped)}/{len(image_paths)}枚を処理しました")
+    
+    elapsed = time.time() - start_time
+    fps = len(images_summary) / elapsed if elapsed > 0 else 0.0
+    print(f"処理時間: {elapsed:.1f}秒（{fps:.1f}枚/秒）")
+    
+    # キャッシュから読み込んだ画像を含めて、指定された順に並べる
+    order = {path: i for i, path in enumerate(image_paths)}
+    images_summary.sort(key=lambda summary: order[summary['image']])
+    
+    summary = format_aggregation(class_counts, conf_hist, names)
+    summary.update({
+        'conf': conf_threshold,
+        'images': images_summary,
+        'failed': failed,
+        'skipped': skipped,
+        'cached': len(cached_paths),
+        'elapsed_seconds': elapsed,
+        'fps': fps
+    })
+    if motion_gate is not None:
+        summary['motion'] = motion_gate.report()
+    return summary
+
+def decode_image(data):
+    """
+    画像データをデコードする
+    
+    Args:
+        data (bytes): JPEGやPNGなどの画像データ
+    
+    Returns:
+        numpy.ndarray: BGR形式の画像
+    """
+    image = cv2.imdecode(np.frombuffer(data, dtype=np.uint8), cv2.IMREAD_COLOR)
+    if image is None:
+        raise ValueError("画像をデコードできません")
+    return image
+
+def detect_with_server(server_url, image_path, conf_threshold=0.25):
+    """
+    推論サーバー（yolo_server.py）に画像を送信して物体を検出する
+    
+    Args:
+        server_url (str): 推論サーバーのURL
+        image_path (str): 画像ファイルのパス
+        conf_threshold (float): 信頼度のしきい値
+        
+    Returns:
+        dict: summarize_detections と同じ形式の検出結果（処理時間を含む）
+    """
+    print(f"画像 {image_path} を推論サーバーで解析中...")
+    
+    with open(image_path, 'rb') as f:
+        image_data = f.read()
+    
+    start_time = time.time()
+    response = urllib3.request(
+        'POST',
+        f"{server_url.rstrip('/')}/detect?conf={conf_threshold}",
+        body=image_data,
+        headers={'Content-Type': 'application/octet-stream'}
+    )
+    if response.status >= 400:
+        raise Exception(f"推論サーバーのエラー: {response.status} {response.data.decode('utf-8', errors='replace')}")
+    
+    summary = json.loads(response.data.decode('utf-8'))
+    summary['image'] = image_path
+    print(f"推論時間: {summary['inference_ms']:.1f}ms, 往復時間: {(time.time() - start_time) * 1000:.1f}ms")
+    return summary
+
+def save_results(results, output_path, save_txt=False, annotate=True, summary=None, annotated_image=None):
+    """
+    検出結果を保存する
+    
+    Args:
+        results (list): YOLOの推論結果
+        output_path (str): 出力ファイルパス
+        save_txt (bool): 検出結果をテキストファイルにも保存する
+        annotate (bool): Trueの場合は検出結果を描画した画像を、Falseの場合は検出結果のJSONを保存する
+        summary (dict, optional): summarize_detections の集計結果。指定しない場合は集計する
+        annotated_image (numpy.ndarray, optional): draw_detections で描画した画像。指定した場合は results の代わりに保存する
+    """
     try:
-        # 結果は既にsave=Trueで保存されているため、ここでは何もしない
-        # 保存先は runs/detect/predict/ ディレクトリ
-        
-        # 保存されたファイルを指定の場所にコピー
-        predict_dir = os.path.join('runs', 'detect', 'predict')
-        if os.path.exists(predict_dir):
-            # 最新の結果ファイルを探す
-            result_files = [f for f in os.listdir(predict_dir) if f.endswith('.jpg') or f.endswith('.png')]
-            if result_files:
-                latest_file = os.path.join(predict_dir, result_files[0])
-                # 結果をコピー
-                import shutil
-                shutil.copy(latest_file, output_path)
-                print(f"解析結果を保存しました: {output_path}")
+        if summary is None:
+            summary = summarize_detections(results)
+        
+        if annotate:
+            # 検出結果をメモリ上で画像に描画して、指定の場所に直接保存する
+            images = [annotated_image] if annotated_image is not None else [result.plot() for result in results]
+            for image in images:
+                if not cv2.imwrite(output_path, image):
+                    raise Exception(f"画像を書き込めません: {output_path}")
+            print(f"解析結果を保存しました: {output_path}")
+        else:
+            with open(output_path, 'w', encoding='utf-8') as f:
+                json.dump(summary, f, indent=2, ensure_ascii=False)
+            print(f"検出結果を保存しました: {output_path}")
         
         # テキスト形式でも保存する場合
         if save_txt:
             txt_path = os.path.splitext(output_path)[0] + '.txt'
             try:
                 with open(txt_path, 'w') as f:
-                    for result in results:
-                        for box in result.boxes:
-                            cls_id = int(box.cls.item())
-                            conf = box.conf.item()
-                            xyxy = box.xyxy.tolist()[0]  # x1, y1, x2, y2
-                            
-                            # クラス名を取得
-                            cls_name = results[0].names[cls_id]
-                            
-                            # クラス、信頼度、座標を保存
-                            f.write(f"{cls_name} {conf:.4f} {xyxy[0]:.1f} {xyxy[1]:.1f} {xyxy[2]:.1f} {xyxy[3]:.1f}\n")
+                    for detection in summary['detections']:
+                        xyxy = detection['xyxy']  # x1, y1, x2, y2
+                        
+                        # クラス、信頼度、座標を保存
+                        f.write(f"{detection['class']} {detection['conf']:.4f} {xyxy[0]:.1f} {xyxy[1]:.1f} {xyxy[2]:.1f} {xyxy[3]:.1f}\n")
                 print(f"検出結果をテキストファイルに保存しました: {txt_path}")
             except Exception as e:
                 print(f"テキストファイルの保存中にエラーが発生しました: {str(e)}")
@@ -130,20 +740,9 @@ def print_detection_summary(results):
     """検出結果の概要を表示する"""
     try:
         # 検出されたオブジェクトの数をカウント
-        type_dict = {}
-        total_detections = 0
-        
-        for result in results:
-            for box in result.boxes:
-                cls_id = int(box.cls.item())
-                cls_name = result.names[cls_id]
-                
-                if cls_name in type_dict:
-                    type_dict[cls_name] += 1
-                else:
-                    type_dict[cls_name] = 1
-                
-                total_detections += 1
+        summary = results if isinstance(results, dict) else summarize_detections(results)
+        type_dict = summary['counts']
+        total_detections = summary['total']
         
         if total_detections == 0:
             print("物体は検出されませんでした。")
@@ -154,12 +753,72 @@ def print_detection_summary(results):
         
         for cls, count in type_dict.items():
             print(f"- {cls}: {count}個")
+        
+        # 信頼度の分布
+        histogram = summary.get('confidence_histogram')
+        if histogram:
+            print("信頼度の分布:")
+            bins = histogram['bins']
+            for i, count in enumerate(histogram['counts']):
+                if count:
+                    print(f"- {bins[i]:.1f}〜{bins[i + 1]:.1f}: {count}個")
     except Exception as e:
         print(f"検出結果の表示中にエラーが発生しました: {str(e)}")
 
+def open_result_cache(args):
+    """
+    検出結果のキャッシュを開く
+    
+    Returns:
+        ResultCache: --no-cache を指定した場合はNone
+    """
+    if not args.cache:
+        return None
+    return ResultCache(max_bytes=args.cache_max_mb * 1024 * 1024)
+
 def main():
     """メイン関数"""
     args = parse_args()
+    set_batch_mode(args.batch)
+    
+    if args.images or args.dir:
+        # 複数の画像をまとめて解析する
+        image_paths = collect_image_paths(args.images, args.dir)
+        if not image_paths:
+            print("エラー: 解析する画像ファイルが見つかりません")
+            sys.exit(1)
+        
+        output_dir = os.path.dirname(args.output)
+        if output_dir and not os.path.exists(output_dir):
+            os.makedirs(output_dir)
+        
+        if args.annotate_dir:
+            os.makedirs(args.annotate_dir, exist_ok=True)
+        
+        model = load_model(args.model, backend=args.backend, int8=args.int8)
+        frames = [] if args.store else None
+        cache = open_result_cache(args)
+        summary = detect_objects_batch(model, image_paths, args.conf, args.batch_size, args.workers, args.annotate_dir,
+                                       frames, args.device_id, create_motion_gate(args),
+                                       cache, detection_cache_params(args))
+        summary['model'] = args.model
+        summary['backend'] = args.backend
+        print_detection_summary(summary)
+        if 'motion' in summary:
+            print_motion_report(summary['motion'])
+        if cache is not None:
+            print_cache_report(cache.report())
+            cache.close()
+        
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(summary, f, indent=2, ensure_ascii=False)
+        print(f"検出結果を保存しました: {args.output}")
+        
+        if args.store:
+            append_detections(frames, args.store)
+        
+        print("解析が完了しました")
+        return
     
     # 画像ファイルパスの設定
     image_path = args.image
@@ -170,22 +829,96 @@ def main():
         sys.exit(1)
     
     # 出力ディレクトリが存在しない場合は作成
-    output_dir = os.path.dirname(args.output)
+    output_dir = os.path.dirname(args.output) if args.output else None
     if output_dir and not os.path.exists(output_dir):
         os.makedirs(output_dir)
     
+    # 前回の実行時の背景と比べて変化がなければ、モデルを読み込まずに終了する
+    # （背景は解析に成功した後で保存し、失敗した場合は再実行時に同じ画像を解析し直す）
+    motion_gate = create_motion_gate(args, motion_state_dir())
+    if motion_gate is not None:
+        image = cv2.imread(image_path)
+        if image is None:
+            print(f"エラー: 画像ファイル {image_path} を読み込めませんでした")
+            sys.exit(1)
+        changed, score = motion_gate.check(args.device_id, image, commit=False)
+        if not changed:
+            motion_gate.commit(args.device_id)
+            print(f"前回から変化がないため解析を省略しました（変化した画素: {score * 100:.2f}%、"
+                  f"しきい値: {args.motion_threshold * 100:.2f}%）")
+            return
+    
+    # 同じ画像を同じ条件で解析した結果があれば、モデルを読み込まずに使用する
+    # （検出結果を描画した画像は、キャッシュした検出結果から描画する）
+    cache = None if args.server else open_result_cache(args)
+    cache_key = None
+    if cache is not None:
+        cache_key = ResultCache.make_key(file_digest(image_path), **detection_cache_params(args))
+        cached = cache.get(cache_key)
+        annotated_image = None
+        if cached is not None and args.annotate:
+            image = cv2.imread(image_path)
+            if image is None:
+                # 読み込めない画像は推論時のエラーとして扱う
+                cached = None
+            else:
+                annotated_image = draw_detections(image, *detections_from_cache(cached))
+        if cached is not None:
+            detections, names = detections_from_cache(cached)
+            summary = summarize_detection_arrays(detections, names)
+            print("キャッシュした検出結果を使用します")
+            print_detection_summary(summary)
+            save_results([], args.output, args.save_txt, args.annotate, summary, annotated_image)
+            if args.store:
+                append_detections([build_detection_frame(detections, names, image_path, args.device_id, args.timestamp)],
+                                  args.store)
+            print_cache_report(cache.report())
+            cache.close()
+            if motion_gate is not None:
+                motion_gate.commit(args.device_id)
+            print("解析が完了しました")
+            return
+    
+    if args.server:
+        # 起動済みの推論サーバーで解析する（モデルの読み込みを省略）
+        summary = detect_with_server(args.server, image_path, args.conf)
+        print_detection_summary(summary)
+        
+        if args.output:
+            with open(args.output, 'w', encoding='utf-8') as f:
+                json.dump(summary, f, indent=2, ensure_ascii=False)
+            print(f"検出結果を保存しました: {args.output}")
+        if motion_gate is not None:
+            motion_gate.commit(args.device_id)
+        
+        print("解析が完了しました")
+        return
+    
     # モデルを読み込む
-    model = load_model(args.model)
+    model = load_model(args.model, backend=args.backend, int8=args.int8)
     
-    input("Enterキーを押すと、物体検出を実行します...")
+    pause("Enterキーを押すと、物体検出を実行します...")
     # 物体検出を実行
-    results = detect_objects(model, image_path, args.conf)
+    results, summary = detect_objects(model, image_path, args.conf)
     
     # 検出結果の概要を表示
-    print_detection_summary(results)
+    print_detection_summary(summary)
     
     # 結果を保存
-    save_results(results, args.output, args.save_txt)
+    save_results(results, args.output, args.save_txt, args.annotate, summary)
+    
+    detections = extract_detections(results[0])
+    if args.store:
+        # 検出結果を列形式で追記
+        append_detections([build_detection_frame(detections, results[0].names, image_path, args.device_id, args.timestamp)],
+                          args.store)
+    
+    if cache is not None:
+        cache.put(cache_key, detections_to_cache(detections, results[0].names))
+        print_cache_report(cache.report())
+        cache.close()
+    if motion_gate is not None:
+        motion_gate.commit(args.device_id)
     
     print("解析が完了しました")
 
@@ -0,0 +1,351 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+ソラカメの静止画を取得して物体検出を続けるパイプライン
+取得・デコード・推論・出力の各段階をスレッドで並行に実行し、上限付きのキューでつなぎます。
+後段が詰まった場合は前段が待つため、メモリを使い切ることなく一定の間隔でカメラを監視できます。
+
+使い方:
+    python src/soracam/detection_pipeline.py --device_id DEVICE_ID_1 DEVICE_ID_2 --interval 5 --output detections.jsonl
+"""
+
+import os
+import sys
+import json
+import time
+import queue
+import argparse
+import threading
+from datetime import datetime, timezone
+import numpy as np
+
+# 共通モジュールのパスを追加
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+from common.soracom_api import (
+    load_config,
+    auth_with_api_key,
+    fetch_image_snapshot,
+    fetch_image_export,
+    request_image_export,
+    wait_for_image_export_completion
+)
+from analyze_image_yolo import BACKENDS, decode_image, load_model, summarize_detections
+from motion_gate import add_motion_gate_arguments, create_motion_gate, print_motion_report
+
+# 各段階の終了を伝えるための目印
+STOP = object()
+
+def parse_args():
+    """コマンドライン引数をパースする"""
+    parser = argparse.ArgumentParser(description='ソラカメの静止画を取得して物体検出を続けるパイプライン')
+    parser.add_argument('--device_id', nargs='+', required=True, help='デバイスID（複数指定可）')
+    parser.add_argument('--source', choices=['snapshot', 'export'], default='snapshot',
+                        help='静止画の取得方法（snapshot: スナップショットAPI、export: 静止画エクスポート）')
+    parser.add_argument('--interval', type=float, default=5.0, help='1台のカメラから静止画を取得する間隔（秒）')
+    parser.add_argument('--duration', type=float, default=0, help='実行する時間（秒）。0の場合はCtrl+Cで止めるまで実行')
+    parser.add_argument('--count', type=int, default=0, help='1台のカメラから取得する静止画の枚数。0の場合は制限なし')
+    parser.add_argument('--output', default='-', help='検出結果を追記するJSONLファイルのパス（-の場合は標準出力）')
+    parser.add_argument('--model', default='yolov8n.pt', help='使用するモデル（例: yolov8n.pt, yolov8s.pt）')
+    parser.add_argument('--conf', type=float, default=0.25, help='信頼度のしきい値（0-1）')
+    parser.add_argument('--backend', choices=BACKENDS, default='pytorch', help='推論に使用するランタイム')
+    parser.add_argument('--int8', action='store_true', help='--backend でINT8に量子化したモデルを使用する')
+    parser.add_argument('--batch-size', type=int, default=4, help='1回の推論でまとめて処理する静止画の最大枚数')
+    parser.add_argument('--decode-workers', type=int, default=2, help='静止画をデコードするスレッド数')
+    parser.add_argument('--queue-size', type=int, default=8, help='各段階の間のキューの長さ')
+    parser.add_argument('--timeout', type=int, default=120, help='静止画エクスポートの完了を待つ時間（秒）（exportのみ）')
+    parser.add_argument('--config', default='soracom-config.json', help='設定ファイルのパス')
+    add_motion_gate_arguments(parser)
+    return parser.parse_args()
+
+def fetch_frame(device_id, source='snapshot', timeout=120):
+    """
+    カメラから静止画を1枚取得する
+
+    Args:
+        device_id (str): デバイスID
+        source (str): 取得方法（snapshot または export）
+        timeout (int): 静止画エクスポートの完了を待つ時間（秒）
+
+    Returns:
+        tuple: (取得を開始した時刻（ISO 8601形式、UTC）, 静止画のデータ)
+    """
+    timestamp = datetime.now(timezone.utc).isoformat(timespec='seconds')
+    if source == 'snapshot':
+        return timestamp, fetch_image_snapshot(device_id)
+
+    export_info = request_image_export(device_id, timestamp)
+    export_id = export_info.get('exportId')
+    wait_for_image_export_completion(device_id, export_id, timeout, interval=1)
+    return timestamp, fetch_image_export(device_id, export_id)
+
+def run_fetcher(device_id, args, decode_queue, stop_event, stats):
+    """
+    一定の間隔でカメラから静止画を取得し、デコード待ちのキューに入れる
+    後段が詰まって予定の時刻に間に合わなかった回は飛ばします。
+    """
+    next_time = time.monotonic()
+    fetched = 0
+
+    while not stop_event.is_set() and (not args.count or fetched < args.count):
+        delay = next_time - time.monotonic()
+        if delay > 0 and stop_event.wait(delay):
+            break
+
+        scheduled_at = time.time()
+        try:
+            timestamp, data = fetch_frame(device_id, args.source, args.timeout)
+        except Exception as e:
+            print(f"[{device_id}] 静止画の取得に失敗しました: {str(e)}")
+            stats.add('errors')
+        else:
+            frame = {
+                'device_id': device_id,
+                'timestamp': timestamp,
+                'scheduled_at': scheduled_at,
+                'fetched_at': time.time(),
+                'data': data
+            }
+            # キューが一杯の場合は空くまで待つ（後段の処理速度に合わせる）
+            decode_queue.put(frame)
+            fetched += 1
+            stats.add('fetched')
+
+        next_time += args.interval
+        now = time.monotonic()
+        if next_time < now:
+            skipped = int((now - next_time) // args.interval) + 1
+            next_time += skipped * args.interval
+            stats.add('skipped', skipped)
+
+def run_decoder(decode_queue, detect_queue, stats, motion_gate=None):
+    """
+    静止画をメモリ上でデコードし、推論待ちのキューに入れる
+    motion_gate を指定した場合は、カメラごとの背景から変化のない静止画を推論に回しません。
+    """
+    while True:
+        frame = decode_queue.get()
+        if frame is STOP:
+            break
+
+        start_time = time.time()
+        try:
+            frame['image'] = decode_image(frame.pop('data'))
+        except ValueError as e:
+            print(f"[{frame['device_id']}] {str(e)}")
+            stats.add('errors')
+            continue
+        if motion_gate is not None:
+            changed, frame['motion_score'] = motion_gate.check(frame['device_id'], frame['image'])
+            if not changed:
+                stats.add('motion_skipped')
+                continue
+        frame['decoded_at'] = time.time()
+        frame['decode_ms'] = (frame['decoded_at'] - start_time) * 1000
+        detect_queue.put(frame)
+
+def run_detector(model, detect_queue, sink_queue, conf_threshold, batch_size, stats):
+    """
+    推論待ちのキューから静止画を取り出して物体検出を行う
+    キューにたまっている静止画は batch_size 枚までまとめて推論します。
+    """
+    stopping = False
+    while not stopping:
+        frame = detect_queue.get()
+        if frame is STOP:
+            break
+        frames = [frame]
+        while len(frames) < batch_size:
+            try:
+                frame = detect_queue.get_nowait()
+            except queue.Empty:
+                break
+            if frame is STOP:
+                stopping = True
+                break
+            frames.append(frame)
+
+        start_time = time.time()
+        try:
+            results = model([frame['image'] for frame in frames], conf=conf_threshold, verbose=False)
+        except Exception as e:
+            # 推論に失敗しても前段が詰まらないように処理を続ける
+            print(f"物体検出に失敗しました: {str(e)}")
+            stats.add('errors', len(frames))
+            continue
+        inference_ms = (time.time() - start_time) * 1000
+
+        for frame, result in zip(frames, results):
+            summary = summarize_detections([result])
+            record = {
+                'device_id': frame['device_id'],
+                'timestamp': frame['timestamp'],
+                'total': summary['total'],
+                'counts': summary['counts'],
+                'detections': summary['detections'],
+                'batch_size': len(frames),
+                'latency_ms': {
+                    'fetch': (frame['fetched_at'] - frame['scheduled_at']) * 1000,
+                    'decode': frame['decode_ms'],
+                    'queue': (start_time - frame['decoded_at']) * 1000,
+                    'inference': inference_ms
+                },
+                'scheduled_at': frame['scheduled_at']
+            }
+            if 'motion_score' in frame:
+                record['motion_score'] = frame['motion_score']
+            sink_queue.put(record)
+
+def run_sink(sink_queue, output_file, stats):
+    """検出結果を1行1件のJSONとして書き出す"""
+    while True:
+        record = sink_queue.get()
+        if record is STOP:
+            break
+
+        scheduled_at = record.pop('scheduled_at')
+        record['latency_ms']['end_to_end'] = (time.time() - scheduled_at) * 1000
+        output_file.write(json.dumps(record, ensure_ascii=False) + '\n')
+        output_file.flush()
+        stats.add('emitted')
+        stats.record_latency(record['latency_ms']['end_to_end'])
+
+class PipelineStats:
+    """パイプラインの処理件数と遅延の集計"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.counts = {'fetched': 0, 'emitted': 0, 'skipped': 0, 'motion_skipped': 0, 'errors': 0}
+        self.latencies = []
+
+    def add(self, name, value=1):
+        """件数を加算する"""
+        with self._lock:
+            self.counts[name] += value
+
+    def record_latency(self, latency_ms):
+        """取得開始から出力までの時間を記録する"""
+        with self._lock:
+            self.latencies.append(latency_ms)
+
+    def report(self, elapsed):
+        """
+        集計結果を返す
+
+        Args:
+            elapsed (float): 実行時間（秒）
+
+        Returns:
+            dict: 処理件数、1秒あたりの処理枚数、遅延の中央値・95パーセンタイル・最大値
+        """
+        with self._lock:
+            report = dict(self.counts)
+            report['elapsed_seconds'] = elapsed
+            report['fps'] = self.counts['emitted'] / elapsed if elapsed > 0 else 0.0
+            if self.latencies:
+                p50, p95 = np.percentile(self.latencies, [50, 95])
+                report['latency_ms'] = {'p50': float(p50), 'p95': float(p95), 'max': float(max(self.latencies))}
+            return report
+
+def run_pipeline(model, device_ids, args, output_file, motion_gate=None):
+    """
+    パイプラインを実行する
+
+    Args:
+        model: 読み込み済みのYOLOモデル
+        device_ids (list): デバイスID
+        args: コマンドライン引数
+        output_file: 検出結果の書き込み先
+        motion_gate (MotionGate, optional): 変化のない静止画の推論を省略する場合に指定する
+
+    Returns:
+        dict: PipelineStats.report の集計結果
+    """
+    stats = PipelineStats()
+    stop_event = threading.Event()
+    decode_queue = queue.Queue(maxsize=args.queue_size)
+    detect_queue = queue.Queue(maxsize=args.queue_size)
+    sink_queue = queue.Queue(maxsize=args.queue_size)
+
+    fetchers = [threading.Thread(target=run_fetcher, args=(device_id, args, decode_queue, stop_event, stats),
+                                 name=f"fetch-{device_id}", daemon=True)
+                for device_id in device_ids]
+    decoders = [threading.Thread(target=run_decoder, args=(decode_queue, detect_queue, stats, motion_gate),
+                                 name=f"decode-{i}", daemon=True)
+                for i in range(args.decode_workers)]
+    detector = threading.Thread(target=run_detector, args=(model, detect_queue, sink_queue, args.conf, args.batch_size, stats),
+                                name='detect', daemon=True)
+    sink = threading.Thread(target=run_sink, args=(sink_queue, output_file, stats), name='sink', daemon=True)
+
+    start_time = time.time()
+    for thread in [sink, detector] + decoders + fetchers:
+        thread.start()
+
+    try:
+        deadline = start_time + args.duration if args.duration else None
+        while any(thread.is_alive() for thread in fetchers):
+            if deadline and time.time() >= deadline:
+                break
+            time.sleep(0.2)
+    except KeyboardInterrupt:
+        print("停止しています...")
+    finally:
+        # 前段から順に止め、キューに残っている静止画は処理してから終了する
+        stop_event.set()
+        for thread in fetchers:
+            thread.join()
+        for _ in decoders:
+            decode_queue.put(STOP)
+        for thread in decoders:
+            thread.join()
+        detect_queue.put(STOP)
+        detector.join()
+        sink_queue.put(STOP)
+        sink.join()
+
+    report = stats.report(time.time() - start_time)
+    if motion_gate is not None:
+        report['motion'] = motion_gate.report()
+    return report
+
+def main():
+    """メイン関数"""
+    args = parse_args()
+
+    # 標準出力に検出結果を書き出す場合は、それ以外の表示を標準エラー出力に回す
+    close_output = args.output != '-'
+    if close_output:
+        output_file = open(args.output, 'a', encoding='utf-8')
+    else:
+        output_file = sys.stdout
+        sys.stdout = sys.stderr
+
+    try:
+        # 設定ファイルを読み込む
+        config_path = os.path.join(os.path.dirname(__file__), '..', '..', args.config)
+        load_config(config_path)
+
+        # APIキーとシークレットで認証
+        print('APIキーとシークレットで認証中...')
+        auth_with_api_key()
+
+        # モデルを読み込み、初回の推論で発生する初期化を済ませておく
+        model = load_model(args.model, backend=args.backend, int8=args.int8)
+        model(np.zeros((640, 640, 3), dtype=np.uint8), conf=args.conf, verbose=False)
+
+        print(f"{len(args.device_id)}台のカメラの監視を開始します（間隔: {args.interval}秒）")
+        report = run_pipeline(model, args.device_id, args, output_file, create_motion_gate(args))
+
+        print("\n処理結果:")
+        print(json.dumps(report, indent=2, ensure_ascii=False))
+        if 'motion' in report:
+            print_motion_report(report['motion'])
+    except Exception as e:
+        print(f"エラーが発生しました: {str(e)}")
+        sys.exit(1)
+    finally:
+        if close_output:
+            output_file.close()
+
+if __name__ == "__main__":
+    main()
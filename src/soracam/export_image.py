@@ -9,6 +9,9 @@
 import os
 import sys
 import argparse
+import shutil
+import threading
+from concurrent.futures import ThreadPoolExecutor, wait
 from datetime import datetime, timedelta, timezone
 import time
 
@@ -21,8 +24,13 @@ from common.soracom_api import (
     request_image_export,
     get_image_export_status,
     download_image_export,
-    wait_for_image_export_completion
+    wait_for_image_export_completion,
+    set_rate_limit,
+    get_api_stats
 )
+from common.export_tracker import ExportTracker
+from common.interactive import add_batch_argument, pause, set_batch_mode
+from common.export_cache import add_export_cache_arguments, create_export_cache, print_export_cache_report
 
 def parse_args():
     """コマンドライン引数をパースする"""
@@ -31,7 +39,7 @@ def parse_args():
     # デバイスIDを必須パラメータとして設定
     parser.add_argument('--device_id', required=True, help='デバイスID')
     parser.add_argument('--timestamp', help='時刻（ISO 8601形式、例: 2023-04-24T10:00:00）')
-    parser.add_argument('--output', required=True, help='出力ファイル名（複数時刻の場合は%dが連番に置換されます）')
+    parser.add_argument('--output', required=True, help='出力ファイル名（複数時刻の場合は%%dが連番に置換されます）')
     parser.add_argument('--config', default='soracom-config.json', help='設定ファイルのパス')
     parser.add_argument('--export-type', choices=['snapshot', 'recorded'], default='snapshot',
                         help='エクスポートタイプ（snapshot: リアルタイムの静止画、recorded: 録画映像からの静止画）')
@@ -46,6 +54,15 @@ def parse_args():
     parser.add_argument('--end', help='終了時刻（ISO 8601形式、例: 2025-04-24T10:10:00）')
     parser.add_argument('--interval', type=int, help='時間間隔（秒）')
     
+    # 一括エクスポート用オプション
+    parser.add_argument('--bulk', action='store_true',
+                        help='複数時刻の静止画を一括でエクスポートする（リクエスト・完了待ち・ダウンロードを並行して実行）')
+    parser.add_argument('--window', type=int, default=10, help='一括エクスポートで同時に処理するジョブ数の上限')
+    parser.add_argument('--rate', type=float, help='エクスポートのリクエスト送信レート（件/秒）（指定しない場合は共通の設定を使用）')
+    parser.add_argument('--download-workers', type=int, default=4, help='一括エクスポートで並行してダウンロードする数')
+    add_export_cache_arguments(parser)
+    add_batch_argument(parser)
+    
     return parser.parse_args()
 
 def validate_datetime(dt_str):
@@ -78,7 +95,6 @@ def export_image_snapshot(device_id, timestamp, output_path, wait_for_completion
     
     try:
         # 静止画エクスポートをリクエスト
-        input("Enterキーを押すと、静止画エクスポートをリクエストします...")
         print("静止画エクスポートをリクエスト中...")
         try:
             export_info = request_image_export(device_id, timestamp)
@@ -96,11 +112,9 @@ def export_image_snapshot(device_id, timestamp, output_path, wait_for_completion
                 return True
             
             # エクスポート完了を待つ
-            input("Enterキーを押すと、エクスポート完了を待ちます...")
             export_info = wait_for_image_export_completion(device_id, export_id, timeout)
             
             # 静止画をダウンロード
-            input("Enterキーを押すと、静止画をダウンロードします...")
             print("静止画をダウンロード中...")
             download_image_export(device_id, export_id, output_path)
             
@@ -121,7 +135,6 @@ def export_image_recorded(device_id, timestamp, output_path, wait_for_completion
     
     try:
         # 静止画エクスポートをリクエスト
-        input("Enterキーを押すと、録画映像から静止画エクスポートをリクエストします...")
         print("録画映像から静止画エクスポートをリクエスト中...")
         try:
             export_info = request_image_export(device_id, timestamp)
@@ -139,11 +152,9 @@ def export_image_recorded(device_id, timestamp, output_path, wait_for_completion
                 return True
             
             # エクスポート完了を待つ
-            input("Enterキーを押すと、エクスポート完了を待ちます...")
             export_info = wait_for_image_export_completion(device_id, export_id, timeout)
             
             # 静止画をダウンロード
-            input("Enterキーを押すと、静止画をダウンロードします...")
             print("静止画をダウンロード中...")
             download_image_export(device_id, export_id, output_path)
             
@@ -156,16 +167,145 @@ def export_image_recorded(device_id, timestamp, output_path, wait_for_completion
         print(f"エラー: {str(e)}")
         return False
 
-def export_image(device_id, timestamp, output_path, export_type='snapshot', wait=False, timeout=600):
-    """静止画をエクスポートする"""
+def export_image(device_id, timestamp, output_path, export_type='snapshot', wait=False, timeout=600, cache=None):
+    """
+    静止画をエクスポートする
+    
+    cache を指定した場合、同じ時刻の静止画をエクスポート済みであればキャッシュから保存し、
+    エクスポートしてダウンロードした静止画はキャッシュに追加します。
+    """
+    if cache:
+        cached_path = cache.get(device_id, 'image', timestamp)
+        if cached_path:
+            shutil.copyfile(cached_path, output_path)
+            print(f"キャッシュから静止画を保存しました: {timestamp} -> {output_path}")
+            return True
+    
     if export_type == 'snapshot':
-        return export_image_snapshot(device_id, timestamp, output_path, wait, timeout)
+        success = export_image_snapshot(device_id, timestamp, output_path, wait, timeout)
     else:  # recorded
-        return export_image_recorded(device_id, timestamp, output_path, wait, timeout)
+        success = export_image_recorded(device_id, timestamp, output_path, wait, timeout)
+    
+    # 完了を待たない場合はダウンロードしていないため、キャッシュには追加しない
+    if success and wait and cache:
+        cache.put(device_id, 'image', timestamp, None, output_path)
+    return success
+
+def export_images_bulk(device_id, jobs, window=10, rate=None, timeout=600, download_workers=4, cache=None):
+    """
+    複数時刻の静止画を一括でエクスポートする
+    
+    一定数のジョブを同時に処理しながら（スライディングウィンドウ）、
+    共通のレート制限に従ってエクスポートをリクエストします。完了したジョブから順に
+    並行してダウンロードするため、全体の時間はAPIのレート制限で決まります。
+    キャッシュにある時刻はエクスポートをリクエストせずにキャッシュから保存します。
+    
+    Args:
+        device_id (str): デバイスID
+        jobs (list): (時刻, 出力ファイルパス) のリスト
+        window (int): 同時に処理するジョブ数の上限
+        rate (float): リクエスト送信レート（件/秒）。Noneの場合は共通の設定を使用
+        timeout (int): ジョブごとのタイムアウト（秒）
+        download_workers (int): 並行してダウンロードする数
+        cache (ExportCache, optional): エクスポートのキャッシュ
+    
+    Returns:
+        int: エクスポートに成功した件数
+    """
+    slots = threading.BoundedSemaphore(window)
+    lock = threading.Lock()
+    results = {}
+    downloads = []
+    
+    if rate:
+        set_rate_limit('sora_cam.export_requests', rate)
+    
+    def finish(timestamp, output_path, error=None):
+        with lock:
+            results[timestamp] = error is None
+            done = len(results)
+        if error is None:
+            print(f"[{done}/{len(jobs)}] 完了: {timestamp}")
+        else:
+            print(f"[{done}/{len(jobs)}] 静止画のエクスポートに失敗しました: {timestamp}: {str(error)}")
+        slots.release()
+    
+    def download(export_id, timestamp, output_path):
+        try:
+            download_image_export(device_id, export_id, output_path)
+            if cache:
+                cache.put(device_id, 'image', timestamp, None, output_path)
+            finish(timestamp, output_path)
+        except Exception as e:
+            finish(timestamp, output_path, e)
+    
+    def on_completed(future, export_id, timestamp, output_path):
+        if future.cancelled():
+            finish(timestamp, output_path, Exception("キャンセルされました"))
+        elif future.exception():
+            finish(timestamp, output_path, future.exception())
+        else:
+            downloads.append(download_pool.submit(download, export_id, timestamp, output_path))
+    
+    with ExportTracker(interval=2, timeout=timeout) as tracker, \
+            ThreadPoolExecutor(max_workers=download_workers) as download_pool:
+        for timestamp, output_path in jobs:
+            # 同時に処理するジョブ数がウィンドウの上限に達していれば空きを待つ
+            slots.acquire()
+            
+            cached_path = cache.get(device_id, 'image', timestamp) if cache else None
+            if cached_path:
+                shutil.copyfile(cached_path, output_path)
+                finish(timestamp, output_path)
+                continue
+            
+            try:
+                export_info = request_image_export(device_id, timestamp)
+                export_id = export_info.get('exportId')
+                if not export_id:
+                    raise Exception("エクスポートIDが取得できませんでした")
+            except Exception as e:
+                finish(timestamp, output_path, e)
+                continue
+            
+            print(f"エクスポートをリクエストしました: {timestamp} (エクスポートID: {export_id})")
+            tracker.track(
+                device_id,
+                export_id,
+                'image',
+                callback=lambda future, e=export_id, t=timestamp, o=output_path: on_completed(future, e, t, o)
+            )
+        
+        # 全てのジョブの完了とダウンロードを待つ
+        for _ in range(window):
+            slots.acquire()
+        wait(downloads)
+    
+    return sum(1 for success in results.values() if success)
+
+def build_output_path(output, index, count):
+    """
+    出力ファイル名を生成する（複数の場合は連番）
+    
+    Args:
+        output (str): 出力ファイル名（%dが連番に置換されます）
+        index (int): 0始まりの番号
+        count (int): 全体の件数
+    
+    Returns:
+        str: 出力ファイルパス
+    """
+    if count <= 1:
+        return output
+    if '%d' in output:
+        return output.replace('%d', str(index + 1))
+    base, ext = os.path.splitext(output)
+    return f"{base}_{index + 1}{ext}"
 
 def main():
     """メイン関数"""
     args = parse_args()
+    set_batch_mode(args.batch)
     
     # device_idの設定
     device_id = args.device_id
@@ -179,7 +319,7 @@ def main():
     auth_response = auth_with_api_key()
     print('認証成功:', auth_response)
     
-    input("Enterキーを押すと、処理を続行します...")
+    pause()
     
     # 時刻リストを準備
     timestamps = []
@@ -226,26 +366,50 @@ def main():
     if output_dir and not os.path.exists(output_dir):
         os.makedirs(output_dir)
     
+    cache = create_export_cache(args)
+    
+    # 一括エクスポート
+    if args.bulk:
+        jobs = [
+            (timestamp, build_output_path(args.output, i, len(timestamps)))
+            for i, timestamp in enumerate(timestamps)
+        ]
+        print(f"{len(jobs)}件の静止画を一括でエクスポートします（同時処理数: {args.window}）")
+        started_at = time.time()
+        success_count = export_images_bulk(
+            device_id,
+            jobs,
+            window=args.window,
+            rate=args.rate,
+            timeout=args.timeout,
+            download_workers=args.download_workers,
+            cache=cache
+        )
+        print(f"合計: {len(timestamps)}件中{success_count}件の静止画をエクスポートしました（{time.time() - started_at:.1f}秒）")
+        print(f"API呼び出しの統計: {get_api_stats()}")
+        if cache:
+            print_export_cache_report(cache.report())
+        if success_count < len(timestamps):
+            print("一部の静止画のエクスポートに失敗しましたが、処理は完了しました")
+        else:
+            print("処理が正常に完了しました")
+        return
+    
+    if args.rate:
+        set_rate_limit('sora_cam.export_requests', args.rate)
+    
     # 静止画をエクスポート
     success_count = 0
     for i, timestamp in enumerate(timestamps):
         # 出力ファイル名を生成（複数の場合は連番）
-        if len(timestamps) > 1:
-            output_path = args.output.replace('%d', str(i + 1))
-            if '%d' not in args.output:
-                base, ext = os.path.splitext(args.output)
-                output_path = f"{base}_{i + 1}{ext}"
-        else:
-            output_path = args.output
+        output_path = build_output_path(args.output, i, len(timestamps))
         
-        if export_image(device_id, timestamp, output_path, args.export_type, args.wait, args.timeout):
+        if export_image(device_id, timestamp, output_path, args.export_type, args.wait, args.timeout, cache):
             success_count += 1
         
-        # APIレート制限を避けるために少し待機
-        if i < len(timestamps) - 1:
-            time.sleep(1)
-    
     print(f"合計: {len(timestamps)}件中{success_count}件の静止画をエクスポートしました")
+    if cache:
+        print_export_cache_report(cache.report())
     
     if success_count < len(timestamps):
         print("一部の静止画のエクスポートに失敗しましたが、処理は完了しました")
@@ -8,8 +8,13 @@
 
 import os
 import sys
+import math
 import argparse
 import time
+import shutil
+import subprocess
+import threading
+from concurrent.futures import ThreadPoolExecutor, wait
 from datetime import datetime, timedelta, timezone
 import json
 
@@ -21,8 +26,15 @@ from common.soracom_api import (
     request_video_export,
     get_video_export_status,
     download_video_export,
-    wait_for_export_completion
+    wait_for_export_completion,
+    MAX_VIDEO_EXPORT_SECONDS
 )
+from common.export_tracker import ExportTracker
+from common.interactive import add_batch_argument, pause, set_batch_mode
+from common.export_cache import add_export_cache_arguments, create_export_cache, print_export_cache_report
+
+# キャッシュにない時間範囲をエクスポートする際に揃える区切り（秒）。0の場合は指定した時間範囲のみエクスポートする
+DEFAULT_CACHE_BUCKET_SECONDS = 0
 
 def parse_args():
     """コマンドライン引数をパースする"""
@@ -36,6 +48,16 @@ def parse_args():
     parser.add_argument('--config', default='soracom-config.json', help='設定ファイルのパス')
     parser.add_argument('--wait', action='store_true', help='エクスポート完了を待つ')
     parser.add_argument('--timeout', type=int, default=600, help='タイムアウト（秒）')
+    parser.add_argument('--download-workers', type=int, default=4,
+                        help='長い時間範囲を分割してエクスポートする場合に並行してダウンロードする数')
+    parser.add_argument('--keep-chunks', action='store_true',
+                        help='長い時間範囲を分割してエクスポートした場合に、結合前の分割ファイルを残す')
+    parser.add_argument('--jobs', help='複数の時間範囲をまとめてエクスポートするジョブファイル（1行に「開始時刻,終了時刻,出力ファイル」）')
+    parser.add_argument('--window', type=int, default=10, help='ジョブファイルのエクスポートで同時に処理するジョブ数の上限')
+    parser.add_argument('--cache-bucket', type=int, default=DEFAULT_CACHE_BUCKET_SECONDS,
+                        help='キャッシュにない時間範囲をこの秒数の区切りまで広げてエクスポートする（既定値: 0、広げない）')
+    add_export_cache_arguments(parser)
+    add_batch_argument(parser)
     
     return parser.parse_args()
 
@@ -55,7 +77,6 @@ def export_video(device_id, start_time, end_time, output_path, wait_for_completi
     print(f"出力ファイル: {output_path}")
     
     # エクスポートをリクエスト
-    input("Enterキーを押すと、動画エクスポートをリクエストします...")
     print("動画エクスポートをリクエスト中...")
     try:
         export_info = request_video_export(device_id, start_time, end_time)
@@ -73,23 +94,15 @@ def export_video(device_id, start_time, end_time, output_path, wait_for_completi
     if not wait_for_completion:
         print(f"エクスポートジョブを開始しました。後で以下のコマンドで状態を確認できます:")
         print(f"python src/soracam/export_video.py --device_id {device_id} --start {start_time} --end {end_time} --output {output_path} --wait")
-        # エクスポートIDをファイルに保存
-        with open(f"{output_path}.export_id", 'w') as f:
-            json.dump({
-                'device_id': device_id,
-                'export_id': export_id,
-                'start': start_time,
-                'end': end_time
-            }, f)
+        # エクスポートIDをファイルに保存（--wait を指定して再実行すると、このジョブの完了を待つ）
+        save_manifest(device_id, export_id, start_time, end_time, output_path)
         return True
     
     try:
         # エクスポート完了を待つ
-        input("Enterキーを押すと、エクスポート完了を待ちます...")
         export_info = wait_for_export_completion(device_id, export_id, timeout)
         
         # 動画をダウンロード
-        input("Enterキーを押すと、動画をダウンロードします...")
         print("動画をダウンロード中...")
         download_video_export(device_id, export_id, output_path)
         
@@ -99,9 +112,594 @@ def export_video(device_id, start_time, end_time, output_path, wait_for_completi
         print(f"エラー: {str(e)}")
         return False
 
+def manifest_path(output_path):
+    """エクスポートジョブの情報を保存するファイル（出力ファイル名.export_id）のパス"""
+    return f"{output_path}.export_id"
+
+def save_manifest(device_id, export_id, start_time, end_time, output_path, done=False):
+    """
+    エクスポートジョブの情報を出力ファイルの隣に保存する
+    
+    Args:
+        device_id (str): デバイスID
+        export_id (str): エクスポートジョブID
+        start_time (str): 開始時刻（ISO 8601形式）
+        end_time (str): 終了時刻（ISO 8601形式）
+        output_path (str): 出力ファイルパス
+        done (bool): Trueの場合は出力ファイルの保存が完了したことと、そのサイズを記録する
+    """
+    manifest = {
+        'device_id': device_id,
+        'export_id': export_id,
+        'start': start_time,
+        'end': end_time,
+        'done': done
+    }
+    if done:
+        manifest['size'] = os.path.getsize(output_path)
+    path = manifest_path(output_path)
+    temp_path = f"{path}.tmp"
+    with open(temp_path, 'w') as f:
+        json.dump(manifest, f)
+    os.replace(temp_path, path)
+
+def read_manifest(device_id, start_time, end_time, output_path):
+    """
+    保存したエクスポートジョブの情報を読み込む
+    
+    Returns:
+        dict: エクスポートジョブの情報。保存していない場合や、デバイス・時間範囲が異なる場合はNone
+    """
+    try:
+        with open(manifest_path(output_path)) as f:
+            manifest = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if (manifest.get('device_id'), manifest.get('start'), manifest.get('end')) != (device_id, start_time, end_time):
+        return None
+    return manifest
+
+def load_manifest(device_id, start_time, end_time, output_path):
+    """
+    保存したエクスポートジョブのIDを読み込む
+    
+    Returns:
+        str: エクスポートジョブID。保存していない場合や、デバイス・時間範囲が異なる場合はNone
+    """
+    manifest = read_manifest(device_id, start_time, end_time, output_path)
+    return manifest.get('export_id') if manifest else None
+
+def is_downloaded(device_id, start_time, end_time, output_path):
+    """
+    同じデバイス・時間範囲の動画を出力ファイルに保存済みかを確認する
+    
+    保存が完了したときに記録したサイズと一致する場合のみ保存済みとみなします
+    （別の時間範囲のファイルや、中断して途中まで書き込まれたファイルは保存済みとみなさない）。
+    
+    Returns:
+        bool: 保存済みの場合はTrue
+    """
+    manifest = read_manifest(device_id, start_time, end_time, output_path)
+    if not manifest or not manifest.get('done'):
+        return False
+    try:
+        return os.path.getsize(output_path) == manifest.get('size')
+    except OSError:
+        return False
+
+def remove_manifest(output_path):
+    """保存したエクスポートジョブの情報を削除する"""
+    try:
+        os.unlink(manifest_path(output_path))
+    except FileNotFoundError:
+        pass
+
+def load_jobs(path):
+    """
+    ジョブファイルからエクスポートする時間範囲を読み込む
+    
+    1行に「開始時刻,終了時刻,出力ファイル」を記述します。空行と # で始まる行は無視します。
+    
+    Args:
+        path (str): ジョブファイルのパス
+    
+    Returns:
+        list: (開始時刻, 終了時刻, 出力ファイルパス) のリスト
+    """
+    jobs = []
+    with open(path, encoding='utf-8') as f:
+        for line_number, line in enumerate(f, 1):
+            line = line.strip()
+            if not line or line.startswith('#'):
+                continue
+            fields = [field.strip() for field in line.split(',')]
+            if len(fields) != 3 or not all(fields) or not validate_datetime(fields[0]) or not validate_datetime(fields[1]):
+                raise Exception(f"ジョブファイルの{line_number}行目が無効です: {line}（形式: 開始時刻,終了時刻,出力ファイル）")
+            
+            start_dt = datetime.fromisoformat(fields[0].replace('Z', '+00:00'))
+            end_dt = datetime.fromisoformat(fields[1].replace('Z', '+00:00'))
+            seconds = (end_dt - start_dt).total_seconds()
+            if not 0 < seconds <= MAX_VIDEO_EXPORT_SECONDS:
+                raise Exception(f"ジョブファイルの{line_number}行目の時間範囲は{MAX_VIDEO_EXPORT_SECONDS}秒以下で指定してください: {line}")
+            jobs.append(tuple(fields))
+    return jobs
+
+def split_time_range(start_time, end_time, max_seconds=MAX_VIDEO_EXPORT_SECONDS):
+    """
+    時間範囲をエクスポートできる長さ以下の区間に分割する
+    
+    Args:
+        start_time (str): 開始時刻（ISO 8601形式）
+        end_time (str): 終了時刻（ISO 8601形式）
+        max_seconds (int): 1区間の最大の長さ（秒）
+    
+    Returns:
+        list: (開始時刻, 終了時刻) のリスト（ISO 8601形式）
+    """
+    start_dt = datetime.fromisoformat(start_time.replace('Z', '+00:00'))
+    end_dt = datetime.fromisoformat(end_time.replace('Z', '+00:00'))
+    
+    if end_dt <= start_dt:
+        raise Exception(f"終了時刻は開始時刻より後を指定してください: {start_time} - {end_time}")
+    
+    chunks = []
+    chunk_start = start_dt
+    while chunk_start < end_dt:
+        chunk_end = min(chunk_start + timedelta(seconds=max_seconds), end_dt)
+        chunks.append((chunk_start.isoformat(), chunk_end.isoformat()))
+        chunk_start = chunk_end
+    
+    return chunks
+
+def concat_videos(input_paths, output_path):
+    """
+    複数のMP4ファイルを再エンコードせずに1つに結合する（ffmpegが必要）
+    
+    Args:
+        input_paths (list): 結合するファイルのパス（再生順）
+        output_path (str): 出力ファイルパス
+    """
+    if len(input_paths) == 1:
+        shutil.copyfile(input_paths[0], output_path)
+        return
+    
+    ffmpeg = shutil.which('ffmpeg')
+    if not ffmpeg:
+        raise Exception("動画の結合にはffmpegが必要です。ffmpegをインストールしてください")
+    
+    list_path = f"{output_path}.concat.txt"
+    try:
+        # ffmpegのconcat demuxer用のファイル一覧を作成
+        with open(list_path, 'w', encoding='utf-8') as f:
+            for path in input_paths:
+                escaped = os.path.abspath(path).replace("'", "'\\''")
+                f.write(f"file '{escaped}'\n")
+        
+        result = subprocess.run(
+            [ffmpeg, '-hide_banner', '-loglevel', 'error', '-y',
+             '-f', 'concat', '-safe', '0', '-i', list_path,
+             '-c', 'copy', '-movflags', '+faststart', output_path],
+            capture_output=True,
+            text=True
+        )
+        if result.returncode != 0:
+            raise Exception(f"動画の結合に失敗しました: {result.stderr.strip()}")
+    finally:
+        if os.path.exists(list_path):
+            os.unlink(list_path)
+
+def trim_video(input_path, output_path, offset, duration):
+    """
+    動画の一部を再エンコードせずに切り出す（ffmpegが必要）
+    
+    再エンコードしないため、切り出す位置はキーフレーム単位になります。
+    
+    Args:
+        input_path (str): 入力ファイルパス
+        output_path (str): 出力ファイルパス
+        offset (float): 切り出しを開始する位置（秒）
+        duration (float): 切り出す長さ（秒）
+    """
+    ffmpeg = shutil.which('ffmpeg')
+    if not ffmpeg:
+        raise Exception("動画の切り出しにはffmpegが必要です。ffmpegをインストールしてください")
+    
+    result = subprocess.run(
+        [ffmpeg, '-hide_banner', '-loglevel', 'error', '-y',
+         '-ss', f"{offset:.3f}", '-i', input_path, '-t', f"{duration:.3f}",
+         '-c', 'copy', '-avoid_negative_ts', 'make_zero', '-movflags', '+faststart', output_path],
+        capture_output=True,
+        text=True
+    )
+    if result.returncode != 0:
+        raise Exception(f"動画の切り出しに失敗しました: {result.stderr.strip()}")
+
+def ms_to_iso(timestamp_ms):
+    """UNIXタイムスタンプ（ミリ秒）をISO 8601形式（UTC）に変換する"""
+    return datetime.fromtimestamp(timestamp_ms / 1000, timezone.utc).isoformat()
+
+def prepare_chunk_dir(chunk_dir, device_id, chunks):
+    """
+    分割ファイルを保存するディレクトリを用意する
+    
+    ディレクトリにはデバイスIDと区間の一覧を manifest.json として記録します。
+    前回の実行とデバイスや時間範囲が異なる場合は、別の時間範囲の映像を結合しないよう、
+    残っている分割ファイルを削除してから始めます。
+    
+    Args:
+        chunk_dir (str): 分割ファイルを保存するディレクトリ
+        device_id (str): デバイスID
+        chunks (list): split_time_range で分割した (開始時刻, 終了時刻) のリスト
+    """
+    manifest_file = os.path.join(chunk_dir, 'manifest.json')
+    manifest = {
+        'device_id': device_id,
+        'start': chunks[0][0],
+        'end': chunks[-1][1],
+        'chunks': [list(chunk) for chunk in chunks]
+    }
+    
+    if os.path.isdir(chunk_dir):
+        try:
+            with open(manifest_file, encoding='utf-8') as f:
+                previous = json.load(f)
+        except (OSError, ValueError):
+            previous = None
+        if previous != manifest:
+            print(f"{chunk_dir} に残っている分割ファイルは別の時間範囲のものであるため削除します")
+            shutil.rmtree(chunk_dir)
+    
+    os.makedirs(chunk_dir, exist_ok=True)
+    with open(manifest_file, 'w', encoding='utf-8') as f:
+        json.dump(manifest, f)
+
+def export_video_range(device_id, start_time, end_time, output_path, timeout=600,
+                       download_workers=4, keep_chunks=False):
+    """
+    長い時間範囲の動画を分割して並行にエクスポートし、1つのMP4に結合する
+    
+    900秒以下の区間ごとにエクスポートを同時にリクエストし、完了した区間から
+    順にダウンロードします。全体の時間はおおよそエクスポート1回分になります。
+    
+    Args:
+        device_id (str): デバイスID
+        start_time (str): 開始時刻（ISO 8601形式）
+        end_time (str): 終了時刻（ISO 8601形式）
+        output_path (str): 出力ファイルパス
+        timeout (int): 区間ごとのタイムアウト（秒）
+        download_workers (int): 並行してダウンロードする数
+        keep_chunks (bool): 結合前の分割ファイルを残す
+    
+    Returns:
+        bool: 成功した場合はTrue
+    """
+    chunks = split_time_range(start_time, end_time)
+    chunk_dir = f"{output_path}.chunks"
+    prepare_chunk_dir(chunk_dir, device_id, chunks)
+    chunk_paths = [os.path.join(chunk_dir, f"part_{i + 1:03d}.mp4") for i in range(len(chunks))]
+    
+    print(f"{len(chunks)}個の区間に分割してエクスポートします")
+    
+    # 処理中の区間数（ダウンロードまたは失敗が確定した時点で減らす）
+    remaining = threading.Condition()
+    in_flight = [0]
+    errors = {}
+    
+    def finish(index, error=None):
+        with remaining:
+            if error is not None:
+                errors[index] = error
+            in_flight[0] -= 1
+            remaining.notify_all()
+    
+    def download(index, export_id):
+        try:
+            # 途中で失敗したファイルを再実行時にダウンロード済みと誤認しないよう、完了後に名前を変更する
+            partial_path = f"{chunk_paths[index]}.part"
+            download_video_export(device_id, export_id, partial_path)
+            os.replace(partial_path, chunk_paths[index])
+            print(f"区間 {index + 1}/{len(chunks)} をダウンロードしました")
+            finish(index)
+        except Exception as e:
+            finish(index, e)
+    
+    def on_completed(future, index, export_id):
+        if future.cancelled():
+            finish(index, Exception("キャンセルされました"))
+        elif future.exception():
+            finish(index, future.exception())
+        else:
+            download_pool.submit(download, index, export_id)
+    
+    with ExportTracker(interval=2, timeout=timeout) as tracker, \
+            ThreadPoolExecutor(max_workers=download_workers) as download_pool:
+        for index, (chunk_start, chunk_end) in enumerate(chunks):
+            # スキップできる区間（再実行時にダウンロード済みのもの）はリクエストしない
+            if os.path.exists(chunk_paths[index]):
+                print(f"区間 {index + 1}/{len(chunks)} はダウンロード済みです")
+                continue
+            try:
+                export_info = request_video_export(device_id, chunk_start, chunk_end)
+                export_id = export_info.get('exportId')
+                if not export_id:
+                    raise Exception("エクスポートIDが取得できませんでした")
+            except Exception as e:
+                with remaining:
+                    errors[index] = e
+                continue
+            
+            print(f"区間 {index + 1}/{len(chunks)} のエクスポートをリクエストしました: {chunk_start} - {chunk_end} (エクスポートID: {export_id})")
+            with remaining:
+                in_flight[0] += 1
+            tracker.track(
+                device_id,
+                export_id,
+                'video',
+                callback=lambda future, i=index, e=export_id: on_completed(future, i, e)
+            )
+        
+        # 全ての区間の完了とダウンロードを待つ
+        with remaining:
+            remaining.wait_for(lambda: in_flight[0] == 0)
+    
+    if errors:
+        for index in sorted(errors):
+            print(f"区間 {index + 1}/{len(chunks)} のエクスポートに失敗しました: {str(errors[index])}")
+        print(f"ダウンロード済みの区間は {chunk_dir} に残しています。再実行すると残りの区間のみエクスポートします")
+        return False
+    
+    print("動画を結合中...")
+    try:
+        concat_videos(chunk_paths, output_path)
+    except Exception as e:
+        print(f"エラー: {str(e)}")
+        print(f"分割ファイルは {chunk_dir} に残しています")
+        return False
+    print(f"動画を保存しました: {output_path}")
+    
+    if not keep_chunks:
+        shutil.rmtree(chunk_dir, ignore_errors=True)
+    return True
+
+def resume_export(device_id, start_time, end_time, output_path):
+    """
+    保存したエクスポートジョブを引き継げるかを確認する
+    
+    失敗したジョブや見つからないジョブの情報は削除し、新しくリクエストし直すようにします。
+    
+    Returns:
+        str: 引き継ぐエクスポートジョブID。引き継げない場合はNone
+    """
+    export_id = load_manifest(device_id, start_time, end_time, output_path)
+    if not export_id:
+        return None
+    try:
+        status = get_video_export_status(device_id, export_id).get('status')
+    except Exception as e:
+        print(f"保存したエクスポートジョブを確認できませんでした: {export_id}: {str(e)}")
+        status = None
+    if status in (None, 'failed', 'canceled'):
+        remove_manifest(output_path)
+        return None
+    return export_id
+
+def export_video_jobs(device_id, jobs, window=10, timeout=600, download_workers=4, cache=None):
+    """
+    複数の時間範囲の動画をまとめてエクスポートする
+    
+    一定数のジョブを同時に処理しながら（スライディングウィンドウ）エクスポートをリクエストし、
+    完了したジョブから順に、後のジョブの処理中に並行してダウンロードします。
+    リクエストしたジョブは出力ファイルの隣（出力ファイル名.export_id）に保存し、保存が完了すると
+    完了したことを記録するため、途中で中断しても再実行すると同じジョブの完了を待ち、
+    同じデバイス・時間範囲を保存済みの出力ファイルは省略します。
+    
+    Args:
+        device_id (str): デバイスID
+        jobs (list): (開始時刻, 終了時刻, 出力ファイルパス) のリスト
+        window (int): 同時に処理するジョブ数の上限
+        timeout (int): ジョブごとのタイムアウト（秒）
+        download_workers (int): 並行してダウンロードする数
+        cache (ExportCache, optional): エクスポートのキャッシュ
+    
+    Returns:
+        int: エクスポートに成功した件数
+    """
+    slots = threading.BoundedSemaphore(window)
+    lock = threading.Lock()
+    results = {}
+    downloads = []
+    
+    def finish(index, error=None):
+        with lock:
+            results[index] = error is None
+            done = len(results)
+        start_time, end_time, output_path = jobs[index]
+        if error is None:
+            print(f"[{done}/{len(jobs)}] 完了: {start_time} - {end_time} -> {output_path}")
+        else:
+            print(f"[{done}/{len(jobs)}] 動画のエクスポートに失敗しました: {start_time} - {end_time}: {str(error)}")
+        slots.release()
+    
+    def download(index, export_id):
+        start_time, end_time, output_path = jobs[index]
+        try:
+            # 途中で失敗したファイルを再実行時にダウンロード済みと誤認しないよう、完了後に名前を変更する
+            partial_path = f"{output_path}.part"
+            download_video_export(device_id, export_id, partial_path)
+            os.replace(partial_path, output_path)
+            save_manifest(device_id, export_id, start_time, end_time, output_path, done=True)
+            if cache:
+                cache.put(device_id, 'video', start_time, end_time, output_path)
+            finish(index)
+        except Exception as e:
+            finish(index, e)
+    
+    def on_completed(future, index, export_id):
+        if future.cancelled():
+            finish(index, Exception("キャンセルされました"))
+        elif future.exception():
+            finish(index, future.exception())
+        else:
+            downloads.append(download_pool.submit(download, index, export_id))
+    
+    can_trim = shutil.which('ffmpeg') is not None
+    with ExportTracker(interval=2, timeout=timeout) as tracker, \
+            ThreadPoolExecutor(max_workers=download_workers) as download_pool:
+        for index, (start_time, end_time, output_path) in enumerate(jobs):
+            # 同時に処理するジョブ数がウィンドウの上限に達していれば空きを待つ
+            slots.acquire()
+            
+            # 再実行時に同じデバイス・時間範囲を保存済みのものは省略する
+            if is_downloaded(device_id, start_time, end_time, output_path):
+                print(f"ダウンロード済みです: {output_path}")
+                finish(index)
+                continue
+            
+            try:
+                output_dir = os.path.dirname(output_path)
+                if output_dir:
+                    os.makedirs(output_dir, exist_ok=True)
+                
+                # キャッシュだけで用意できる場合はエクスポートしない
+                if cache and cache.covers(device_id, 'video', start_time, end_time, exact=not can_trim):
+                    if not export_video_cached(device_id, start_time, end_time, output_path, cache):
+                        raise Exception("キャッシュからの保存に失敗しました")
+                    save_manifest(device_id, None, start_time, end_time, output_path, done=True)
+                    finish(index)
+                    continue
+                
+                export_id = resume_export(device_id, start_time, end_time, output_path)
+                if export_id:
+                    print(f"保存したエクスポートジョブを引き継ぎます: {start_time} - {end_time} (エクスポートID: {export_id})")
+                else:
+                    export_info = request_video_export(device_id, start_time, end_time)
+                    export_id = export_info.get('exportId')
+                    if not export_id:
+                        raise Exception("エクスポートIDが取得できませんでした")
+                    save_manifest(device_id, export_id, start_time, end_time, output_path)
+                    print(f"エクスポートをリクエストしました: {start_time} - {end_time} (エクスポートID: {export_id})")
+            except Exception as e:
+                finish(index, e)
+                continue
+            
+            tracker.track(
+                device_id,
+                export_id,
+                'video',
+                callback=lambda future, i=index, e=export_id: on_completed(future, i, e)
+            )
+        
+        # 全てのジョブの完了とダウンロードを待つ
+        for _ in range(window):
+            slots.acquire()
+        wait(downloads)
+    
+    return sum(1 for success in results.values() if success)
+
+def export_video_cached(device_id, start_time, end_time, output_path, cache, timeout=600,
+                        download_workers=4, keep_chunks=False, bucket_seconds=DEFAULT_CACHE_BUCKET_SECONDS):
+    """
+    キャッシュを使用して動画をエクスポートする
+    
+    キャッシュにある時間範囲は保存したファイルから切り出し、不足している時間範囲だけを
+    エクスポートしてキャッシュに保存した後、1つのMP4に結合します。近い時間範囲を後で
+    再利用しやすいよう、bucket_seconds を指定すると不足している時間範囲をその区切りまで広げてエクスポートします
+    （エクスポートジョブの数が増える場合は広げません）。
+    ffmpegがない場合は、時間範囲が完全に一致する場合のみキャッシュを使用します。
+    
+    Args:
+        device_id (str): デバイスID
+        start_time (str): 開始時刻（ISO 8601形式）
+        end_time (str): 終了時刻（ISO 8601形式）
+        output_path (str): 出力ファイルパス
+        cache (ExportCache): エクスポートのキャッシュ
+        timeout (int): 区間ごとのタイムアウト（秒）
+        download_workers (int): 並行してダウンロードする数
+        keep_chunks (bool): 結合前の分割ファイルを残す
+        bucket_seconds (int): エクスポートする時間範囲を揃える区切り（秒）。0の場合は広げない
+    
+    Returns:
+        bool: 成功した場合はTrue
+    """
+    if not shutil.which('ffmpeg'):
+        cached_path = cache.get(device_id, 'video', start_time, end_time)
+        if cached_path:
+            shutil.copyfile(cached_path, output_path)
+            print(f"キャッシュから動画を保存しました: {output_path}")
+            return True
+        if not export_video_range(device_id, start_time, end_time, output_path, timeout, download_workers, keep_chunks):
+            return False
+        cache.put(device_id, 'video', start_time, end_time, output_path)
+        return True
+    
+    segments = cache.plan(device_id, 'video', start_time, end_time)
+    work_dir = f"{output_path}.parts"
+    os.makedirs(work_dir, exist_ok=True)
+    bucket_ms = bucket_seconds * 1000
+    now_ms = int(time.time() * 1000)
+    
+    cached_seconds = sum((end - start) for start, end, entry in segments if entry is not None) / 1000
+    print(f"キャッシュから{cached_seconds:.0f}秒分を使用します"
+          f"（エクスポートする時間範囲: {sum(1 for _, _, entry in segments if entry is None)}個）")
+    
+    for index, (segment_start, segment_end, entry) in enumerate(segments):
+        if entry is not None:
+            continue
+        
+        # キャッシュと接していない先頭と末尾は区切りまで広げる（現在より後の時刻には広げない）
+        export_start, export_end = segment_start, segment_end
+        if bucket_ms and index == 0:
+            export_start = segment_start // bucket_ms * bucket_ms
+        if bucket_ms and index == len(segments) - 1:
+            export_end = min(-(-segment_end // bucket_ms) * bucket_ms, max(segment_end, now_ms))
+        
+        # 広げたことで1回のエクスポートの上限を超え、ジョブの数が増える場合は広げない
+        limit_ms = MAX_VIDEO_EXPORT_SECONDS * 1000
+        if math.ceil((export_end - export_start) / limit_ms) > math.ceil((segment_end - segment_start) / limit_ms):
+            export_start, export_end = segment_start, segment_end
+        
+        # 再実行時に同じ名前になるよう、ファイル名には時間範囲を使用する
+        export_path = os.path.join(work_dir, f"export_{export_start}_{export_end}.mp4")
+        print(f"キャッシュにない時間範囲をエクスポートします: {ms_to_iso(export_start)} - {ms_to_iso(export_end)}")
+        if not os.path.exists(export_path) and not export_video_range(
+                device_id, ms_to_iso(export_start), ms_to_iso(export_end), export_path,
+                timeout, download_workers, keep_chunks):
+            print(f"エクスポート済みの時間範囲は {work_dir} に残しています。再実行すると残りの時間範囲のみエクスポートします")
+            return False
+        cache.put(device_id, 'video', ms_to_iso(export_start), ms_to_iso(export_end), export_path)
+        segments[index] = (segment_start, segment_end, {'start_ms': export_start, 'end_ms': export_end, 'path': export_path})
+    
+    try:
+        piece_paths = []
+        for index, (segment_start, segment_end, entry) in enumerate(segments):
+            if (segment_start, segment_end) == (entry['start_ms'], entry['end_ms']):
+                piece_paths.append(entry['path'])
+                continue
+            piece_path = os.path.join(work_dir, f"piece_{index + 1:03d}.mp4")
+            trim_video(
+                entry['path'],
+                piece_path,
+                (segment_start - entry['start_ms']) / 1000,
+                (segment_end - segment_start) / 1000
+            )
+            piece_paths.append(piece_path)
+        
+        if len(piece_paths) > 1:
+            print("動画を結合中...")
+        concat_videos(piece_paths, output_path)
+    except Exception as e:
+        print(f"エラー: {str(e)}")
+        print(f"エクスポート済みの時間範囲は {work_dir} に残しています")
+        return False
+    
+    shutil.rmtree(work_dir, ignore_errors=True)
+    print(f"動画を保存しました: {output_path}")
+    return True
+
 def main():
     """メイン関数"""
     args = parse_args()
+    set_batch_mode(args.batch)
     
     # device_idの設定
     device_id = args.device_id
@@ -115,7 +713,29 @@ def main():
     auth_response = auth_with_api_key()
     print('認証成功:', auth_response)
     
-    input("Enterキーを押すと、処理を続行します...")
+    pause()
+    
+    # ジョブファイルの時間範囲をまとめてエクスポートする
+    if args.jobs:
+        try:
+            jobs = load_jobs(args.jobs)
+        except Exception as e:
+            print(f"エラー: {str(e)}")
+            sys.exit(1)
+        
+        print(f"{len(jobs)}件の時間範囲をエクスポートします（同時処理数: {args.window}）")
+        cache = create_export_cache(args)
+        started_at = time.time()
+        success_count = export_video_jobs(device_id, jobs, args.window, args.timeout, args.download_workers, cache)
+        print(f"合計: {len(jobs)}件中{success_count}件の動画をエクスポートしました（{time.time() - started_at:.1f}秒）")
+        if cache:
+            print_export_cache_report(cache.report())
+            cache.close()
+        if success_count < len(jobs):
+            print("一部の動画のエクスポートに失敗しました。再実行すると、リクエスト済みのジョブを引き継いで残りをエクスポートします")
+            sys.exit(1)
+        print("処理が正常に完了しました")
+        return
     
     # 日時の設定
     now = datetime.now(timezone.utc)
@@ -158,6 +778,73 @@ def main():
     if output_dir and not os.path.exists(output_dir):
         os.makedirs(output_dir)
     
+    start_dt = datetime.fromisoformat(start_time.replace('Z', '+00:00'))
+    end_dt = datetime.fromisoformat(end_time.replace('Z', '+00:00'))
+    too_long = (end_dt - start_dt).total_seconds() > MAX_VIDEO_EXPORT_SECONDS
+    
+    # 完了を待たずに開始したジョブがあれば、新しくリクエストせずにそのジョブの完了を待つ
+    if args.wait and not too_long and load_manifest(device_id, start_time, end_time, output_path):
+        cache = create_export_cache(args)
+        success = export_video_jobs(device_id, [(start_time, end_time, output_path)], 1, args.timeout, 1, cache) == 1
+        if cache:
+            cache.close()
+        if success:
+            print("処理が正常に完了しました")
+        else:
+            print("処理中にエラーが発生しました")
+        return
+    
+    # 完了を待つ場合と全体をキャッシュから切り出せる場合は、キャッシュを使用してエクスポートする
+    cache = create_export_cache(args)
+    if cache and (args.wait or too_long or cache.covers(device_id, 'video', start_time, end_time,
+                                                                exact=not shutil.which('ffmpeg'))):
+        try:
+            success = export_video_cached(
+                device_id,
+                start_time,
+                end_time,
+                output_path,
+                cache,
+                args.timeout,
+                args.download_workers,
+                args.keep_chunks,
+                args.cache_bucket
+            )
+        except Exception as e:
+            print(f"エラー: {str(e)}")
+            success = False
+        print_export_cache_report(cache.report())
+        cache.close()
+        
+        if success:
+            print("処理が正常に完了しました")
+        else:
+            print("処理中にエラーが発生しました")
+        return
+    
+    # 1回でエクスポートできない長さの場合は分割してエクスポートする
+    if too_long:
+        print(f"時間範囲が{MAX_VIDEO_EXPORT_SECONDS}秒を超えるため、分割してエクスポートし完了まで待ちます")
+        try:
+            success = export_video_range(
+                device_id,
+                start_time,
+                end_time,
+                output_path,
+                args.timeout,
+                args.download_workers,
+                args.keep_chunks
+            )
+        except Exception as e:
+            print(f"エラー: {str(e)}")
+            success = False
+        
+        if success:
+            print("処理が正常に完了しました")
+        else:
+            print("処理中にエラーが発生しました")
+        return
+    
     # 動画をエクスポート
     success = export_video(
         device_id,
@@ -0,0 +1,176 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+YOLOモデルをCPU向けのランタイム（ONNX / OpenVINO）の形式に変換するスクリプト
+変換したモデルはキャッシュに保存され、analyze_image_yolo.py の --backend で使用されます。
+--benchmark を指定すると、元のモデルと変換したモデルの処理速度と検出結果の差を比較します。
+"""
+
+import os
+import sys
+import time
+import argparse
+import cv2
+import numpy as np
+
+from analyze_image_yolo import (
+    extract_detections,
+    export_model,
+    load_model
+)
+
+# 共通モジュールのパスを追加
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+from common.image_files import collect_image_paths
+
+def parse_args():
+    """コマンドライン引数をパースする"""
+    parser = argparse.ArgumentParser(description='YOLOモデルをCPU向けのランタイムの形式に変換するスクリプト')
+    parser.add_argument('--model', default='yolov8n.pt', help='変換するモデル（例: yolov8n.pt, yolov8s.pt）')
+    parser.add_argument('--backend', choices=('onnx', 'openvino'), default='openvino', help='変換先のランタイム')
+    parser.add_argument('--int8', action='store_true', help='INT8に量子化する')
+    parser.add_argument('--data', help='OpenVINOのINT8量子化に使用するキャリブレーション用データセットのYAML（デフォルト: coco128.yaml）')
+    parser.add_argument('--force', action='store_true', help='変換済みのモデルがあっても変換し直す')
+    parser.add_argument('--benchmark', nargs='+', help='比較に使用する画像ファイルのパス（ワイルドカード可）')
+    parser.add_argument('--conf', type=float, default=0.25, help='比較に使用する信頼度のしきい値（0-1）')
+    parser.add_argument('--warmup', type=int, default=3, help='比較の前に実行する推論の回数')
+    return parser.parse_args()
+
+def box_iou(boxes_a, boxes_b):
+    """
+    2つの矩形の集合のIoUを計算する
+
+    Args:
+        boxes_a (numpy.ndarray): N×4 の矩形（x1, y1, x2, y2）
+        boxes_b (numpy.ndarray): M×4 の矩形（x1, y1, x2, y2）
+
+    Returns:
+        numpy.ndarray: N×M のIoU
+    """
+    top_left = np.maximum(boxes_a[:, None, :2], boxes_b[None, :, :2])
+    bottom_right = np.minimum(boxes_a[:, None, 2:], boxes_b[None, :, 2:])
+    intersection = np.prod(np.clip(bottom_right - top_left, 0, None), axis=2)
+    area_a = np.prod(boxes_a[:, 2:] - boxes_a[:, :2], axis=1)
+    area_b = np.prod(boxes_b[:, 2:] - boxes_b[:, :2], axis=1)
+    return intersection / np.maximum(area_a[:, None] + area_b[None, :] - intersection, 1e-9)
+
+def match_detections(reference, candidate, iou_threshold=0.5):
+    """
+    同じクラスでIoUがしきい値以上の検出を、IoUの大きい順に1対1で対応付ける
+
+    Args:
+        reference (tuple): 基準の (クラスID, 信頼度, 座標)
+        candidate (tuple): 比較対象の (クラスID, 信頼度, 座標)
+        iou_threshold (float): 一致とみなすIoUのしきい値
+
+    Returns:
+        list: 対応付けた検出の (基準のインデックス, 比較対象のインデックス) のリスト
+    """
+    ref_cls, _, ref_boxes = reference
+    cand_cls, _, cand_boxes = candidate
+    if len(ref_cls) == 0 or len(cand_cls) == 0:
+        return []
+
+    iou = box_iou(ref_boxes, cand_boxes)
+    iou[ref_cls[:, None] != cand_cls[None, :]] = 0.0
+
+    matches = []
+    while True:
+        i, j = np.unravel_index(np.argmax(iou), iou.shape)
+        if iou[i, j] < iou_threshold:
+            break
+        matches.append((i, j))
+        iou[i, :] = 0.0
+        iou[:, j] = 0.0
+    return matches
+
+def measure(model, images, conf_threshold, warmup):
+    """
+    画像を1枚ずつ推論して処理時間を測る
+
+    Returns:
+        tuple: (画像ごとの検出結果のリスト, 1枚あたりの平均処理時間（ミリ秒）)
+    """
+    for image in images[:warmup]:
+        model(image, conf=conf_threshold, verbose=False)
+
+    detections = []
+    start_time = time.perf_counter()
+    for image in images:
+        detections.append(extract_detections(model(image, conf=conf_threshold, verbose=False)[0]))
+    elapsed = time.perf_counter() - start_time
+    return detections, elapsed / len(images) * 1000
+
+def benchmark(model_name, backend, int8, image_paths, conf_threshold=0.25, warmup=3):
+    """
+    元のモデル（PyTorch）と変換したモデルの処理速度と検出結果を比較する
+
+    Args:
+        model_name (str): 元のモデル
+        backend (str): 変換先のランタイム
+        int8 (bool): INT8に量子化したモデルを使用する
+        image_paths (list): 比較に使用する画像ファイルのパス
+        conf_threshold (float): 信頼度のしきい値
+        warmup (int): 計測の前に実行する推論の回数
+
+    Returns:
+        dict: 処理時間、速度比、元のモデルの検出に対する適合率・再現率、一致した検出の信頼度の差
+    """
+    images = [image for image in (cv2.imread(path) for path in image_paths) if image is not None]
+    if not images:
+        raise Exception("比較に使用できる画像がありません")
+
+    print(f"{len(images)}枚の画像で比較します...")
+    reference, reference_ms = measure(load_model(model_name), images, conf_threshold, warmup)
+    candidate, candidate_ms = measure(load_model(model_name, backend=backend, int8=int8),
+                                      images, conf_threshold, warmup)
+
+    matched = 0
+    conf_diffs = []
+    for ref, cand in zip(reference, candidate):
+        matches = match_detections(ref, cand)
+        matched += len(matches)
+        conf_diffs.extend(abs(float(ref[1][i]) - float(cand[1][j])) for i, j in matches)
+
+    reference_total = sum(len(ref[0]) for ref in reference)
+    candidate_total = sum(len(cand[0]) for cand in candidate)
+    report = {
+        'images': len(images),
+        'pytorch_ms': reference_ms,
+        'backend_ms': candidate_ms,
+        'speedup': reference_ms / candidate_ms if candidate_ms > 0 else 0.0,
+        'pytorch_detections': reference_total,
+        'backend_detections': candidate_total,
+        'precision': matched / candidate_total if candidate_total else 1.0,
+        'recall': matched / reference_total if reference_total else 1.0,
+        'mean_conf_diff': float(np.mean(conf_diffs)) if conf_diffs else 0.0
+    }
+
+    label = f"{backend}{' (INT8)' if int8 else ''}"
+    print("\n比較結果:")
+    print(f"- 処理時間: pytorch {report['pytorch_ms']:.1f}ms/枚, {label} {report['backend_ms']:.1f}ms/枚（{report['speedup']:.2f}倍）")
+    print(f"- 検出数: pytorch {reference_total}個, {label} {candidate_total}個")
+    print(f"- pytorchの検出との一致（同じクラス・IoU 0.5以上）: 適合率 {report['precision']:.3f}, 再現率 {report['recall']:.3f}")
+    print(f"- 一致した検出の信頼度の差（平均）: {report['mean_conf_diff']:.4f}")
+    return report
+
+def main():
+    """メイン関数"""
+    args = parse_args()
+
+    try:
+        model_path = export_model(args.model, args.backend, args.int8, args.data, args.force)
+        print(f"変換したモデル: {model_path}")
+        print(f"使用例: python src/soracam/analyze_image_yolo.py --image image.jpg --output result.jpg "
+              f"--model {args.model} --backend {args.backend}{' --int8' if args.int8 else ''}")
+
+        if args.benchmark:
+            image_paths = collect_image_paths(args.benchmark)
+            benchmark(args.model, args.backend, args.int8, image_paths, args.conf, args.warmup)
+    except Exception as e:
+        print(f"エラーが発生しました: {str(e)}")
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,246 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+映像に変化があった静止画だけを解析に回すためのフィルター
+縮小したグレースケール画像をデバイスごとの背景（過去の静止画の移動平均）と比較し、
+変化した画素の割合がしきい値未満の静止画はYOLOやGPTでの解析を省略します。
+"""
+
+import os
+import sys
+import hashlib
+import threading
+import cv2
+import numpy as np
+
+# 共通モジュールのパスを追加
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+from common.token_cache import default_cache_dir
+
+class MotionGate:
+    """
+    デバイスごとの背景と比較して、静止画に変化があるかを判定する
+
+    最初の静止画は必ず変化ありと判定します。max_skip を指定すると、変化がなくても
+    その回数だけ続けて省略した後は変化ありと判定し、定期的に解析されるようにします。
+    check(..., commit=False) で判定した場合は背景を更新せず、解析に成功した後で commit を
+    呼び出して更新します（解析に失敗した静止画を再実行時に変化なしと判定しないため）。
+    """
+
+    def __init__(self, threshold=0.01, pixel_threshold=25, alpha=0.05, width=160, max_skip=0, state_dir=None):
+        """
+        Args:
+            threshold (float): 変化ありと判定する、変化した画素の割合（0-1）
+            pixel_threshold (int): 背景との輝度の差がこの値を超えた画素を変化したとみなす（0-255）
+            alpha (float): 背景を更新する重み（大きいほど新しい静止画に早く追従する）
+            width (int): 比較に使用する縮小後の幅（高さは縦横比を保つ）
+            max_skip (int): 続けて省略する最大回数（0の場合は制限なし）
+            state_dir (str, optional): 背景を保存するディレクトリ。指定すると実行をまたいで背景を引き継ぐ
+        """
+        self.threshold = threshold
+        self.pixel_threshold = pixel_threshold
+        self.alpha = alpha
+        self.width = width
+        self.max_skip = max_skip
+        self.state_dir = state_dir
+        self._backgrounds = {}
+        self._last_frames = {}
+        self._pending = {}
+        self._skipped_in_row = {}
+        self._stats = {}
+        self._lock = threading.Lock()
+
+    def check(self, device_id, image, commit=True):
+        """
+        静止画に変化があるかを判定し、背景を更新する
+
+        背景を保存する場合（state_dir を指定した場合）、最後に commit した静止画と同じ静止画は
+        条件を変えて解析し直すために変化ありと判定します。
+
+        Args:
+            device_id (str): デバイスID（背景はデバイスごとに保持する）
+            image (numpy.ndarray): BGR形式の静止画
+            commit (bool): Falseの場合は背景を更新せず、commit を呼び出すまで保留する
+
+        Returns:
+            tuple: (変化があればTrue, 変化した画素の割合)
+        """
+        small = self._preprocess(image)
+        digest = hashlib.sha1(image.tobytes()).hexdigest() if self.state_dir else None
+
+        with self._lock:
+            background = self._backgrounds.get(device_id)
+            if background is None:
+                background = self._load_background(device_id)
+            if device_id not in self._last_frames:
+                self._last_frames[device_id] = self._load_last_frame(device_id)
+            stats = self._stats.setdefault(device_id, {'frames': 0, 'changed': 0, 'skipped': 0})
+            stats['frames'] += 1
+
+            if background is None or background.shape != small.shape:
+                # 最初の静止画（または解像度が変わった場合）は背景として登録して解析する
+                background = small.astype(np.float32)
+                score = 1.0
+                changed = True
+            else:
+                diff = cv2.absdiff(small, cv2.convertScaleAbs(background))
+                score = float(np.count_nonzero(diff > self.pixel_threshold)) / diff.size
+                changed = score >= self.threshold
+                if not changed and self.max_skip and self._skipped_in_row.get(device_id, 0) >= self.max_skip:
+                    changed = True
+                if not changed and digest is not None and digest == self._last_frames[device_id]:
+                    # 前回と同じ静止画は、意図して解析し直すものとみなす
+                    changed = True
+                # commit するまで現在の背景を変更しないように複製してから更新する
+                background = background.copy()
+                cv2.accumulateWeighted(small.astype(np.float32), background, self.alpha)
+
+            if changed:
+                stats['changed'] += 1
+                self._skipped_in_row[device_id] = 0
+            else:
+                stats['skipped'] += 1
+                self._skipped_in_row[device_id] = self._skipped_in_row.get(device_id, 0) + 1
+
+            self._pending[device_id] = (background, digest)
+            if commit:
+                self._commit(device_id)
+            return changed, score
+
+    def commit(self, device_id):
+        """
+        check(..., commit=False) で保留した背景を反映して保存する
+
+        Args:
+            device_id (str): デバイスID
+        """
+        with self._lock:
+            self._commit(device_id)
+
+    def report(self):
+        """
+        しきい値と省略した回数を返す
+
+        Returns:
+            dict: しきい値、全体とデバイスごとの静止画数・解析した数・省略した数・省略した割合
+        """
+        with self._lock:
+            devices = {device_id: dict(stats) for device_id, stats in self._stats.items()}
+        frames = sum(stats['frames'] for stats in devices.values())
+        skipped = sum(stats['skipped'] for stats in devices.values())
+        return {
+            'threshold': self.threshold,
+            'pixel_threshold': self.pixel_threshold,
+            'alpha': self.alpha,
+            'max_skip': self.max_skip,
+            'frames': frames,
+            'changed': frames - skipped,
+            'skipped': skipped,
+            'skip_ratio': skipped / frames if frames else 0.0,
+            'devices': devices
+        }
+
+    def _commit(self, device_id):
+        """保留した背景を反映して保存する（ロックを取得した状態で呼び出す）"""
+        pending = self._pending.pop(device_id, None)
+        if pending is None:
+            return
+        self._backgrounds[device_id], self._last_frames[device_id] = pending
+        self._save_background(device_id)
+
+    def _preprocess(self, image):
+        """縮小してグレースケールにし、ノイズを減らす"""
+        height = max(1, round(image.shape[0] * self.width / image.shape[1]))
+        gray = image if image.ndim == 2 else cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+        small = cv2.resize(gray, (self.width, height), interpolation=cv2.INTER_AREA)
+        return cv2.GaussianBlur(small, (5, 5), 0)
+
+    def _state_path(self, device_id, ext='.npy'):
+        """背景を保存するファイルのパス"""
+        safe_id = ''.join(c if c.isalnum() or c in '-_' else '_' for c in str(device_id))
+        return os.path.join(self.state_dir, f"{safe_id}{ext}")
+
+    def _load_background(self, device_id):
+        """保存した背景を読み込む（保存していない場合はNone）"""
+        if not self.state_dir:
+            return None
+        try:
+            return np.load(self._state_path(device_id))
+        except (OSError, ValueError):
+            return None
+
+    def _load_last_frame(self, device_id):
+        """最後に commit した静止画のハッシュを読み込む（保存していない場合はNone）"""
+        if not self.state_dir:
+            return None
+        try:
+            with open(self._state_path(device_id, '.last'), 'r', encoding='utf-8') as f:
+                return f.read().strip() or None
+        except OSError:
+            return None
+
+    def _save_background(self, device_id):
+        """背景を保存する"""
+        if not self.state_dir:
+            return
+        os.makedirs(self.state_dir, exist_ok=True)
+        path = self._state_path(device_id)
+        temp_path = f"{path}.tmp.npy"
+        np.save(temp_path, self._backgrounds[device_id])
+        os.replace(temp_path, path)
+        digest = self._last_frames.get(device_id)
+        if digest:
+            last_path = self._state_path(device_id, '.last')
+            with open(f"{last_path}.tmp", 'w', encoding='utf-8') as f:
+                f.write(digest)
+            os.replace(f"{last_path}.tmp", last_path)
+
+def print_motion_report(report):
+    """
+    MotionGate.report の結果を表示する
+
+    Args:
+        report (dict): MotionGate.report の結果
+    """
+    print(f"\n変化の判定（しきい値: 画素の{report['threshold'] * 100:.1f}%、輝度差 {report['pixel_threshold']}）:")
+    print(f"- {report['frames']}枚中 {report['changed']}枚を解析、{report['skipped']}枚を省略"
+          f"（省略した割合: {report['skip_ratio'] * 100:.1f}%）")
+    for device_id, stats in report['devices'].items():
+        print(f"  - {device_id}: {stats['frames']}枚中 {stats['skipped']}枚を省略")
+
+def add_motion_gate_arguments(parser):
+    """
+    変化の判定に関するコマンドライン引数を追加する
+
+    Args:
+        parser (argparse.ArgumentParser): 引数を追加するパーサー
+    """
+    group = parser.add_argument_group('変化の判定')
+    group.add_argument('--motion-gate', action='store_true', help='直前までの静止画から変化のない静止画の解析を省略する')
+    group.add_argument('--motion-threshold', type=float, default=0.01,
+                       help='変化ありと判定する、変化した画素の割合（0-1）')
+    group.add_argument('--motion-pixel-threshold', type=int, default=25,
+                       help='背景との輝度の差がこの値を超えた画素を変化したとみなす（0-255）')
+    group.add_argument('--motion-max-skip', type=int, default=0,
+                       help='変化がなくても、この回数だけ続けて省略した後は解析する（0の場合は制限なし）')
+
+def create_motion_gate(args, state_dir=None):
+    """
+    コマンドライン引数から MotionGate を作成する
+
+    Args:
+        args: add_motion_gate_arguments で追加した引数を含むコマンドライン引数
+        state_dir (str, optional): 背景を保存するディレクトリ
+
+    Returns:
+        MotionGate: --motion-gate を指定しなかった場合はNone
+    """
+    if not args.motion_gate:
+        return None
+    return MotionGate(threshold=args.motion_threshold, pixel_threshold=args.motion_pixel_threshold,
+                      max_skip=args.motion_max_skip, state_dir=state_dir)
+
+def motion_state_dir():
+    """実行をまたいで背景を保存するディレクトリ"""
+    return os.path.join(default_cache_dir(), 'motion')
@@ -0,0 +1,179 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+全てのソラカメの現在の静止画をまとめて取得するスクリプト
+1つのコネクションプールを共有して全てのカメラに並行してリクエストするため、
+全体の所要時間は最も遅いカメラの応答時間とほぼ同じになります。
+静止画は日付ごとのディレクトリ（出力先/YYYY-MM-DD/デバイスID/HHMMSS.jpg、UTC）に保存します。
+
+使い方:
+    python src/soracam/sweep_snapshots.py --output-dir snapshots
+"""
+
+import os
+import sys
+import json
+import time
+import asyncio
+import argparse
+from datetime import datetime, timezone
+import numpy as np
+
+# 共通モジュールのパスを追加
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+from common.soracom_api import load_config, auth_with_api_key, rate_limiter
+from common.soracom_api_async import AsyncSoracomClient
+
+def parse_args():
+    """コマンドライン引数をパースする"""
+    parser = argparse.ArgumentParser(description='全てのソラカメの現在の静止画をまとめて取得するスクリプト')
+    parser.add_argument('--output-dir', default='snapshots', help='静止画を保存するディレクトリ')
+    parser.add_argument('--device_id', nargs='+', help='取得するデバイスID（指定しない場合は全てのソラカメ）')
+    parser.add_argument('--concurrency', type=int, default=50, help='同時に実行するリクエストの最大数')
+    parser.add_argument('--rate', type=float, help='1秒あたりの静止画の取得数の上限（指定しない場合は設定ファイルの値）')
+    parser.add_argument('--config', default='soracom-config.json', help='設定ファイルのパス')
+    return parser.parse_args()
+
+def snapshot_path(output_dir, device_id, taken_at):
+    """
+    静止画の保存先のパスを返す
+
+    Args:
+        output_dir (str): 出力先のディレクトリ
+        device_id (str): デバイスID
+        taken_at (datetime): 取得を開始した時刻（UTC）
+
+    Returns:
+        str: 出力先/YYYY-MM-DD/デバイスID/HHMMSS.jpg
+    """
+    # デバイスIDはディレクトリ名に使用するため、パスの区切りなどを置き換える
+    safe_id = ''.join(c if c.isalnum() or c in '-_' else '_' for c in device_id)
+    return os.path.join(output_dir, taken_at.strftime('%Y-%m-%d'), safe_id, taken_at.strftime('%H%M%S.jpg'))
+
+async def fetch_snapshot(client, device_id, output_path):
+    """
+    1台のカメラの静止画を取得して保存する
+    失敗しても他のカメラの取得を続けるため、例外は結果として返します。
+
+    Returns:
+        dict: デバイスID、成否、所要時間、保存先とサイズ（失敗した場合はエラーの内容）
+    """
+    os.makedirs(os.path.dirname(output_path), exist_ok=True)
+    partial_path = f"{output_path}.part"
+    start_time = time.monotonic()
+    try:
+        await client.get_image_snapshot(device_id, None, partial_path)
+        os.replace(partial_path, output_path)
+        return {
+            'device_id': device_id,
+            'status': 'ok',
+            'latency_ms': (time.monotonic() - start_time) * 1000,
+            'path': output_path,
+            'bytes': os.path.getsize(output_path)
+        }
+    except Exception as e:
+        if os.path.exists(partial_path):
+            os.unlink(partial_path)
+        return {
+            'device_id': device_id,
+            'status': 'error',
+            'latency_ms': (time.monotonic() - start_time) * 1000,
+            'error': str(e)
+        }
+
+async def sweep_snapshots(output_dir, device_ids=None, concurrency=50):
+    """
+    全てのカメラの静止画を並行して取得する
+
+    Args:
+        output_dir (str): 出力先のディレクトリ
+        device_ids (list, optional): デバイスID。指定しない場合はソラカメの一覧を取得する
+        concurrency (int): 同時に実行するリクエストの最大数
+
+    Returns:
+        dict: 取得した時刻、カメラごとの結果、全体の所要時間と遅延の集計
+    """
+    taken_at = datetime.now(timezone.utc)
+    start_time = time.monotonic()
+
+    async with AsyncSoracomClient(max_concurrency=concurrency) as client:
+        if not device_ids:
+            cameras = await client.get_cameras()
+            device_ids = [camera['deviceId'] for camera in cameras]
+        print(f"{len(device_ids)}台のカメラから静止画を取得中...")
+
+        results = await asyncio.gather(*(
+            fetch_snapshot(client, device_id, snapshot_path(output_dir, device_id, taken_at))
+            for device_id in device_ids
+        ))
+
+    elapsed = time.monotonic() - start_time
+    latencies = [result['latency_ms'] for result in results if result['status'] == 'ok']
+    report = {
+        'taken_at': taken_at.isoformat(timespec='seconds'),
+        'devices': len(results),
+        'succeeded': len(latencies),
+        'failed': len(results) - len(latencies),
+        'elapsed_seconds': elapsed,
+        'results': results
+    }
+    if latencies:
+        p50, p95 = np.percentile(latencies, [50, 95])
+        report['latency_ms'] = {'p50': float(p50), 'p95': float(p95), 'max': float(max(latencies))}
+        # 1台ずつ取得した場合に比べて何倍速く終わったか
+        report['speedup'] = sum(latencies) / 1000 / elapsed if elapsed > 0 else 0.0
+    return report
+
+def save_report(report, output_dir):
+    """
+    取得結果を日付のディレクトリにJSONとして保存する
+
+    Returns:
+        str: 保存したファイルのパス
+    """
+    taken_at = datetime.fromisoformat(report['taken_at'])
+    report_path = os.path.join(output_dir, taken_at.strftime('%Y-%m-%d'), taken_at.strftime('sweep-%H%M%S.json'))
+    os.makedirs(os.path.dirname(report_path), exist_ok=True)
+    with open(report_path, 'w', encoding='utf-8') as f:
+        json.dump(report, f, indent=2, ensure_ascii=False)
+    return report_path
+
+def print_report(report):
+    """取得結果の概要を表示する"""
+    print(f"\n{report['devices']}台中 {report['succeeded']}台の静止画を取得しました"
+          f"（{report['elapsed_seconds']:.2f}秒、失敗: {report['failed']}台）")
+    if 'latency_ms' in report:
+        latency = report['latency_ms']
+        print(f"- カメラごとの所要時間: 中央値 {latency['p50']:.0f}ms, 95パーセンタイル {latency['p95']:.0f}ms, "
+              f"最大 {latency['max']:.0f}ms（順に取得した場合の{report['speedup']:.1f}倍の速さ）")
+    for result in report['results']:
+        if result['status'] != 'ok':
+            print(f"- 取得に失敗: {result['device_id']}: {result['error']}")
+
+def main():
+    """メイン関数"""
+    args = parse_args()
+
+    try:
+        # 設定ファイルを読み込む
+        config_path = os.path.join(os.path.dirname(__file__), '..', '..', args.config)
+        load_config(config_path)
+        if args.rate:
+            rate_limiter.configure('sora_cam.snapshots', args.rate)
+
+        # APIキーとシークレットで認証
+        print('APIキーとシークレットで認証中...')
+        auth_with_api_key()
+
+        report = asyncio.run(sweep_snapshots(args.output_dir, args.device_id, args.concurrency))
+        print_report(report)
+        print(f"取得結果を保存しました: {save_report(report, args.output_dir)}")
+        if report['failed']:
+            sys.exit(1)
+    except Exception as e:
+        print(f"エラーが発生しました: {str(e)}")
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
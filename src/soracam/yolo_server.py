@@ -0,0 +1,124 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+YOLOの推論サーバー
+モデルを一度だけ読み込んで常駐させ、HTTPで受け取った画像の物体検出結果を返します。
+画像ごとにスクリプトを起動する場合と異なり、Pythonやtorchの起動とモデルの読み込みを省略できます。
+
+使い方:
+    python src/soracam/yolo_server.py --model yolov8n.pt --port 8008
+
+    # 画像を送信して解析
+    curl --data-binary @image.jpg http://127.0.0.1:8008/detect
+    # サーバーから読める画像ファイルのパスを指定して解析
+    curl -H 'Content-Type: application/json' -d '{"path": "image.jpg"}' http://127.0.0.1:8008/detect
+"""
+
+import os
+import time
+import argparse
+import threading
+import numpy as np
+from flask import Flask, request, jsonify
+
+from analyze_image_yolo import BACKENDS, decode_image, load_model, summarize_detections
+
+def parse_args():
+    """コマンドライン引数をパースする"""
+    parser = argparse.ArgumentParser(description='YOLOの推論サーバー')
+    parser.add_argument('--model', default='yolov8n.pt', help='使用するモデル（例: yolov8n.pt, yolov8s.pt）')
+    parser.add_argument('--conf', type=float, default=0.25, help='信頼度のしきい値の既定値（0-1）')
+    parser.add_argument('--backend', choices=BACKENDS, default='pytorch', help='推論に使用するランタイム')
+    parser.add_argument('--int8', action='store_true', help='--backend でINT8に量子化したモデルを使用する')
+    parser.add_argument('--host', default='127.0.0.1', help='待ち受けるアドレス')
+    parser.add_argument('--port', type=int, default=8008, help='待ち受けるポート番号')
+    return parser.parse_args()
+
+def create_app(model, model_name, default_conf=0.25):
+    """
+    推論サーバーのアプリケーションを作成する
+
+    Args:
+        model: 読み込み済みのYOLOモデル
+        model_name (str): モデル名
+        default_conf (float): 信頼度のしきい値の既定値
+
+    Returns:
+        Flask: アプリケーション
+    """
+    app = Flask(__name__)
+    # 1つのモデルを複数のスレッドから同時に使わないようにする
+    model_lock = threading.Lock()
+    stats = {'requests': 0, 'inference_seconds': 0.0}
+
+    @app.get('/health')
+    def health():
+        return jsonify({
+            'status': 'ok',
+            'model': model_name,
+            'classes': len(model.names),
+            'requests': stats['requests'],
+            'inference_seconds': stats['inference_seconds']
+        })
+
+    @app.post('/detect')
+    def detect():
+        conf = request.args.get('conf', default=default_conf, type=float)
+
+        # 画像の受け取り（JSONでパスを指定、multipartのimageフィールド、または画像データそのもの）
+        decode_start = time.perf_counter()
+        try:
+            if request.is_json:
+                payload = request.get_json()
+                image_path = payload.get('path')
+                conf = float(payload.get('conf', conf))
+                if not image_path or not os.path.isfile(image_path):
+                    return jsonify({'error': f"画像ファイルが見つかりません: {image_path}"}), 400
+                with open(image_path, 'rb') as f:
+                    image = decode_image(f.read())
+            elif 'image' in request.files:
+                image_path = request.files['image'].filename
+                image = decode_image(request.files['image'].read())
+            else:
+                image_path = None
+                image = decode_image(request.get_data())
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+        decode_ms = (time.perf_counter() - decode_start) * 1000
+
+        inference_start = time.perf_counter()
+        with model_lock:
+            results = model(image, conf=conf, verbose=False)
+            inference_seconds = time.perf_counter() - inference_start
+            stats['requests'] += 1
+            stats['inference_seconds'] += inference_seconds
+
+        summary = summarize_detections(results)
+        summary.update({
+            'image': image_path,
+            'model': model_name,
+            'conf': conf,
+            'decode_ms': decode_ms,
+            'inference_ms': inference_seconds * 1000
+        })
+        return jsonify(summary)
+
+    return app
+
+def main():
+    """メイン関数"""
+    args = parse_args()
+
+    model = load_model(args.model, backend=args.backend, int8=args.int8)
+
+    # 初回の推論で発生する初期化を起動時に済ませておく
+    print("ウォームアップ中...")
+    model(np.zeros((640, 640, 3), dtype=np.uint8), conf=args.conf, verbose=False)
+
+    app = create_app(model, args.model, args.conf)
+    print(f"推論サーバーを起動します: http://{args.host}:{args.port}")
+    app.run(host=args.host, port=args.port, threaded=True)
+
+if __name__ == "__main__":
+    main()